@@ -0,0 +1,201 @@
+import numpy as np
+import chess
+from python_engine import (PIECE_VALUES, PIECE_TABLES, KING_MIDDLEGAME_TABLE, KING_ENDGAME_TABLE,
+                           BISHOP_PAIR_BONUS)
+
+# Score for a checkmated position, matching the engine manager's mate scores
+MATE_EVALUATION = 30000
+
+# Planes are (color, piece type): white pawn..king are 0-5, black pawn..king are 6-11
+PIECE_TYPES = [chess.PAWN, chess.KNIGHT, chess.BISHOP, chess.ROOK, chess.QUEEN, chess.KING]
+PLANE_COUNT = 12
+
+# Centipawns per attacked square that is not occupied by an own piece
+MOBILITY_WEIGHTS = {chess.KNIGHT: 4, chess.BISHOP: 5, chess.ROOK: 2, chess.QUEEN: 1}
+
+# Non-pawn material of the starting position; the king tables are blended by the share left
+OPENING_MATERIAL = 2 * (2 * PIECE_VALUES[chess.KNIGHT] + 2 * PIECE_VALUES[chess.BISHOP] +
+                        2 * PIECE_VALUES[chess.ROOK] + PIECE_VALUES[chess.QUEEN])
+
+FILE_A = np.uint64(0x0101010101010101)
+FILE_B = np.uint64(0x0202020202020202)
+FILE_G = np.uint64(0x4040404040404040)
+FILE_H = np.uint64(0x8080808080808080)
+NOT_A = ~FILE_A
+NOT_H = ~FILE_H
+NOT_AB = ~(FILE_A | FILE_B)
+NOT_GH = ~(FILE_G | FILE_H)
+
+
+def _plane(color, piece_type):
+    """Get the plane index of a piece type and color."""
+    return (0 if color == chess.WHITE else 6) + piece_type - 1
+
+
+def _build_weights():
+    """Build the (12, 64) weight tensors for material plus piece-square tables.
+    
+    Returns the weights shared by every game phase and the extra king
+    weights for the middlegame and the endgame. Black planes are negated,
+    so a dot product gives the score from white's point of view.
+    """
+    weights = np.zeros((PLANE_COUNT, 64), dtype=np.float32)
+    king_middlegame = np.zeros((PLANE_COUNT, 64), dtype=np.float32)
+    king_endgame = np.zeros((PLANE_COUNT, 64), dtype=np.float32)
+    
+    for color, sign, flip in ((chess.WHITE, 1, 56), (chess.BLACK, -1, 0)):
+        # The tables list rank 8 first, so white squares are mirrored
+        squares = np.arange(64) ^ flip
+        for piece_type, table in PIECE_TABLES.items():
+            weights[_plane(color, piece_type)] = sign * (PIECE_VALUES[piece_type] + np.array(table)[squares])
+        king_middlegame[_plane(color, chess.KING)] = sign * np.array(KING_MIDDLEGAME_TABLE)[squares]
+        king_endgame[_plane(color, chess.KING)] = sign * np.array(KING_ENDGAME_TABLE)[squares]
+    
+    return weights, king_middlegame, king_endgame
+
+
+WEIGHTS, KING_MIDDLEGAME_WEIGHTS, KING_ENDGAME_WEIGHTS = _build_weights()
+
+
+def encode_boards(boards):
+    """Stack positions into bitboards.
+    
+    Returns a (N, 12) uint64 array with one bitboard per plane, and a
+    boolean array marking checkmated positions (True where the side to
+    move is mated).
+    """
+    bitboards = np.zeros((len(boards), PLANE_COUNT), dtype=np.uint64)
+    mated = np.zeros(len(boards), dtype=bool)
+    
+    for i, board in enumerate(boards):
+        for color in chess.COLORS:
+            for piece_type in PIECE_TYPES:
+                bitboards[i, _plane(color, piece_type)] = board.pieces_mask(piece_type, color)
+        mated[i] = board.is_checkmate()
+    
+    return bitboards, mated
+
+
+def _unpack(bitboards):
+    """Expand (N, 12) bitboards into (N, 12, 64) 0/1 square planes (bit i is square i)."""
+    as_bytes = bitboards.astype("<u8").view(np.uint8).reshape(bitboards.shape + (8,))
+    return np.unpackbits(as_bytes, axis=-1, bitorder="little")
+
+
+def _popcount(bitboards):
+    """Count the set bits of every bitboard in an array."""
+    as_bytes = bitboards.astype("<u8").view(np.uint8).reshape(bitboards.shape + (8,))
+    return np.unpackbits(as_bytes, axis=-1).sum(axis=-1, dtype=np.int32)
+
+
+# Shifts by one step in each direction, dropping bits that would wrap around the board edge
+DIRECTIONS = {
+    "north": lambda b: b << np.uint64(8),
+    "south": lambda b: b >> np.uint64(8),
+    "east": lambda b: (b << np.uint64(1)) & NOT_A,
+    "west": lambda b: (b >> np.uint64(1)) & NOT_H,
+    "north_east": lambda b: (b << np.uint64(9)) & NOT_A,
+    "north_west": lambda b: (b << np.uint64(7)) & NOT_H,
+    "south_east": lambda b: (b >> np.uint64(7)) & NOT_A,
+    "south_west": lambda b: (b >> np.uint64(9)) & NOT_H
+}
+ORTHOGONAL = ["north", "south", "east", "west"]
+DIAGONAL = ["north_east", "north_west", "south_east", "south_west"]
+
+
+def _knight_attacks(knights):
+    """Get the squares attacked by a set of knights."""
+    attacks = ((knights << np.uint64(17)) & NOT_A) | ((knights << np.uint64(15)) & NOT_H)
+    attacks |= ((knights << np.uint64(10)) & NOT_AB) | ((knights << np.uint64(6)) & NOT_GH)
+    attacks |= ((knights >> np.uint64(17)) & NOT_H) | ((knights >> np.uint64(15)) & NOT_A)
+    attacks |= ((knights >> np.uint64(10)) & NOT_GH) | ((knights >> np.uint64(6)) & NOT_AB)
+    return attacks
+
+
+def _slider_attacks(sliders, empty, directions):
+    """Get the squares attacked by a set of sliding pieces (fill until blocked, plus the blocker)."""
+    attacks = np.zeros_like(sliders)
+    for direction in directions:
+        shift = DIRECTIONS[direction]
+        flood = sliders
+        ray = sliders
+        for _ in range(6):
+            ray = shift(ray) & empty
+            flood = flood | ray
+        attacks |= shift(flood)
+    return attacks
+
+
+def _mobility(bitboards):
+    """Approximate mobility from white's point of view.
+    
+    Attacks are computed set-wise per piece type, so two pieces reaching the
+    same square count it once; this is a coarse but fully vectorized measure.
+    """
+    occupied = np.bitwise_or.reduce(bitboards, axis=1)
+    empty = ~occupied
+    score = np.zeros(len(bitboards), dtype=np.int32)
+    
+    for color, sign in ((chess.WHITE, 1), (chess.BLACK, -1)):
+        own = np.bitwise_or.reduce(bitboards[:, _plane(color, chess.PAWN):_plane(color, chess.KING) + 1], axis=1)
+        queens = bitboards[:, _plane(color, chess.QUEEN)]
+        attacks = {
+            chess.KNIGHT: _knight_attacks(bitboards[:, _plane(color, chess.KNIGHT)]),
+            chess.BISHOP: _slider_attacks(bitboards[:, _plane(color, chess.BISHOP)], empty, DIAGONAL),
+            chess.ROOK: _slider_attacks(bitboards[:, _plane(color, chess.ROOK)], empty, ORTHOGONAL),
+            chess.QUEEN: _slider_attacks(queens, empty, DIAGONAL + ORTHOGONAL)
+        }
+        for piece_type, attacked in attacks.items():
+            score += sign * MOBILITY_WEIGHTS[piece_type] * _popcount(attacked & ~own)
+    
+    return score
+
+
+def evaluate_bitboards(bitboards, mated=None, turns=None):
+    """Score encoded positions in one batched pass.
+    
+    Returns centipawns from white's point of view (int32, one per position):
+    material and piece-square tables, with the king tables blended by the
+    remaining material, plus bishop pair and mobility terms. Mated positions
+    score +/-MATE_EVALUATION; turns (True for white to move) is needed for them.
+    """
+    planes = _unpack(bitboards).astype(np.float32)
+    
+    # Game phase: 1.0 with all pieces on the board, 0.0 with only kings and pawns
+    counts = planes.sum(axis=2)
+    non_pawn_material = sum(
+        (counts[:, _plane(color, piece_type)] * PIECE_VALUES[piece_type]
+         for color in chess.COLORS for piece_type in PIECE_TYPES[1:5])
+    )
+    phase = np.clip(non_pawn_material / OPENING_MATERIAL, 0.0, 1.0)
+    
+    score = np.einsum("npq,pq->n", planes, WEIGHTS)
+    score += phase * np.einsum("npq,pq->n", planes, KING_MIDDLEGAME_WEIGHTS)
+    score += (1.0 - phase) * np.einsum("npq,pq->n", planes, KING_ENDGAME_WEIGHTS)
+    
+    score += BISHOP_PAIR_BONUS * (counts[:, _plane(chess.WHITE, chess.BISHOP)] >= 2)
+    score -= BISHOP_PAIR_BONUS * (counts[:, _plane(chess.BLACK, chess.BISHOP)] >= 2)
+    
+    score = np.rint(score).astype(np.int32) + _mobility(bitboards)
+    
+    if mated is not None and turns is not None:
+        # The side to move is mated, so the other side scores the mate
+        score = np.where(mated, np.where(turns, -MATE_EVALUATION, MATE_EVALUATION), score).astype(np.int32)
+    return score
+
+
+def evaluate_boards(boards):
+    """Score a list of positions (e.g. every position of a game) in one batch."""
+    if not boards:
+        return np.zeros(0, dtype=np.int32)
+    bitboards, mated = encode_boards(boards)
+    turns = np.array([board.turn == chess.WHITE for board in boards])
+    return evaluate_bitboards(bitboards, mated, turns)
+
+
+def evaluate_games(games):
+    """Score several games in a single batch; returns one array per game."""
+    boards = [board for game in games for board in game]
+    scores = evaluate_boards(boards)
+    bounds = np.cumsum([len(game) for game in games])[:-1]
+    return np.split(scores, bounds)
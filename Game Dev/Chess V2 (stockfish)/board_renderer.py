@@ -1,6 +1,6 @@
 import pygame
 import chess
-from config import SQUARE_SIZE, BOARD_SIZE, LIGHT_SQUARE, DARK_SQUARE, HIGHLIGHT, BLACK, BEST_MOVE_COLOR
+from config import SQUARE_SIZE, BOARD_SIZE, LIGHT_SQUARE, DARK_SQUARE, HIGHLIGHT, BLACK, BEST_MOVE_COLOR, CANDIDATE_MOVE_COLORS
 from utils import load_pieces, square_to_coords, get_square_center
 
 class BoardRenderer:
@@ -72,4 +72,19 @@ class BoardRenderer:
             
             # Draw circles at the start and end points
             pygame.draw.circle(self.screen, BEST_MOVE_COLOR, (from_x, from_y), 10)
-            pygame.draw.circle(self.screen, (255, 0, 0), (to_x, to_y), 10) 
\ No newline at end of file
+            pygame.draw.circle(self.screen, (255, 0, 0), (to_x, to_y), 10)
+    
+    def draw_candidate_moves(self, moves):
+        """Draw ranked arrows for several candidate moves (best move last, on top)."""
+        for rank in reversed(range(len(moves))):
+            move = moves[rank]
+            color = CANDIDATE_MOVE_COLORS[min(rank, len(CANDIDATE_MOVE_COLORS) - 1)]
+            width = max(2, 6 - rank * 2)
+            
+            from_x, from_y = get_square_center(move.from_square)
+            to_x, to_y = get_square_center(move.to_square)
+            
+            # Draw the arrow line with a thinner stroke for lower-ranked moves
+            pygame.draw.line(self.screen, color, (from_x, from_y), (to_x, to_y), width)
+            pygame.draw.circle(self.screen, color, (from_x, from_y), 8)
+            pygame.draw.circle(self.screen, color, (to_x, to_y), 12, 3) 
\ No newline at end of file
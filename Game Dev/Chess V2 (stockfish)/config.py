@@ -14,6 +14,14 @@ LIGHT_SQUARE = (240, 217, 181)
 DARK_SQUARE = (181, 136, 99)
 HIGHLIGHT = (255, 255, 0)
 BEST_MOVE_COLOR = (0, 255, 0)
+CANDIDATE_MOVE_COLORS = [(0, 255, 0), (255, 165, 0), (0, 160, 255), (200, 0, 200), (128, 128, 128)]
+
+# Frame rates (power-aware rendering)
+ACTIVE_FPS = 60
+IDLE_FPS = 5  # After IDLE_TIMEOUT seconds without input
+UNFOCUSED_FPS = 2  # While the window is in the background or minimized
+IDLE_TIMEOUT = 10  # Seconds
+ANALYSIS_IDLE_TIMEOUT = 300  # Seconds without input before analysis is suspended
 
 # Font
 DEFAULT_FONT = None
@@ -23,17 +31,112 @@ LARGE_FONT_SIZE = 48
 
 # Engine settings
 STOCKFISH_PATH = "stockfish"
-ENGINE_THREADS = 1
+ENGINE_THREADS = 1  # Defaults; per-mode values come from the tuned engine profiles
 ENGINE_HASH = 16
 
+# Engine provisioning (run provision_engine.py to build the bundled source)
+STOCKFISH_SOURCE_DIR = "stockfish/src"
+ENGINE_BUILD_DIR = "engines"
+ENGINE_BUILD_PATH = "engine_build.json"  # Records the fastest working binary
+
+# Engine auto-tuning (run engine_tuning.py to calibrate and save the profiles)
+ENGINE_PROFILE_PATH = "engine_profiles.json"
+TUNING_MEMORY_FRACTION = 0.5  # Share of free memory the Hash tables may use
+TUNING_BENCH_DEPTH = 10
+TUNING_BENCH_TIMEOUT = 120  # Seconds
+
+# Engine backend: "stockfish", "python" (built-in engine) or "auto" (Stockfish,
+# falling back to the built-in engine if it cannot be started)
+ENGINE_BACKEND = "auto"
+PYTHON_ENGINE_HASH = 16  # MB-equivalent size of the built-in engine's transposition table
+PYTHON_ENGINE_BENCH_DEPTH = 4
+
+# Engine pool settings
+ENGINE_POOL_SIZE = 2
+ENGINE_PROFILES = {
+    "play": {"Threads": ENGINE_THREADS, "Hash": ENGINE_HASH},
+    "analysis": {"Threads": ENGINE_THREADS, "Hash": ENGINE_HASH, "Skill Level": 20}
+}
+
 # Difficulty settings
+# "book" is how a move is picked from the opening book: uniform, weighted or best
+# "clock_depth" caps the search in timed games (None lets the engine budget its clock)
+# "backend": "python" plays with the in-process engine, which is strong enough at depth 1
+# and avoids the round trip to the Stockfish process (its skill margin is not calibrated
+# against Stockfish's Skill Level, so stronger difficulties stay on Stockfish)
 DIFFICULTY_SETTINGS = {
-    "easy": {"skill_level": 0, "time": 0.01, "depth": 1},
-    "medium": {"skill_level": 10, "time": 0.1, "depth": 3},
-    "hard": {"skill_level": 20, "time": 1.0, "depth": 5}
+    "easy": {"skill_level": 0, "time": 0.01, "depth": 1, "clock_depth": 1, "book": "uniform", "backend": "python"},
+    "medium": {"skill_level": 10, "time": 0.1, "depth": 3, "clock_depth": 3, "book": "weighted"},
+    "hard": {"skill_level": 20, "time": 1.0, "depth": 5, "clock_depth": None, "book": "best", "ponder": True}
 }
 
+# Time controls as (base seconds, increment seconds); None plays without clocks
+TIME_CONTROLS = [None, (60, 0), (180, 2), (300, 3), (600, 5), (900, 10)]
+DEFAULT_TIME_CONTROL = 0  # Index into TIME_CONTROLS
+
+# Engine telemetry (written to TELEMETRY_PATH + ".json" and ".prom")
+TELEMETRY_PATH = "engine_stats"
+TELEMETRY_FLUSH_INTERVAL = 10  # Seconds
+
+# Endgame bitbases (run endgame_bitbase.py to generate them; missing tables are left to the engine)
+BITBASE_DIR = "bitbases"
+BITBASE_TABLES = ["KQK", "KRK", "KPK", "KBNK"]
+
+# PGN databases: the game index is written next to the PGN file with this suffix, and
+# these headers can be searched without scanning the file
+PGN_INDEX_SUFFIX = ".idx"
+PGN_INDEX_HEADERS = ["White", "Black", "Event", "Site", "Date", "Result", "ECO"]
+
+# Position explorer over a game collection (built with position_explorer.py; optional)
+EXPLORER_PATH = "explorer.sqlite3"
+EXPLORER_MAX_PLY = 40  # Plies of each game that are indexed
+EXPLORER_CHUNK_GAMES = 2000  # Games per task handed to a worker process
+EXPLORER_MOVES_SHOWN = 6
+
+# Session snapshot: the game, statistics and cached evaluations are saved here on quit
+# and restored on the next start
+SESSION_PATH = "session.bin"
+
+# Headless game server (game_server.py): JSON lines over TCP, many games sharing one engine pool
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8765
+SERVER_ENGINE_POOL_SIZE = 4  # Engine processes shared by every session
+SERVER_MAX_SESSIONS = 64
+SERVER_MAX_ENGINE_REQUESTS = 16  # Searches handed to the pool at once; later ones wait their turn
+SERVER_MAX_WAITING_REQUESTS = 256  # Searches allowed to wait before new ones are refused as busy
+SERVER_MAX_INFLIGHT = 8  # Unanswered requests per connection before the server stops reading it
+SERVER_ANALYSIS_DEPTH = 12
+SERVER_MAX_ANALYSIS_DEPTH = 20
+
+# LAN two-player games (main.py --lan-host or --lan-join ADDRESS)
+LAN_PORT = 5555
+LAN_LISTEN_ADDRESS = "0.0.0.0"  # The host accepts its opponent on every network interface
+LAN_CONNECT_TIMEOUT = 10  # Seconds a guest keeps trying to reach the host
+LAN_PING_INTERVAL = 1.0  # Seconds between round-trip measurements (which also compare positions)
+
+# Polyglot opening book (optional; AI moves come from the engine if the file is missing)
+OPENING_BOOK_PATH = "book.bin"
+
 # Evaluation settings
-EVAL_TIME = 0.5
-EVAL_DEPTH = 20
-EVAL_PV_LINE_LENGTH = 5 
\ No newline at end of file
+EVAL_DEPTH = None  # None keeps searching deeper until the position changes
+EVAL_PV_LINE_LENGTH = 5
+EVAL_MULTIPV = 3  # Candidate lines shown during analysis
+EVAL_UPDATE_INTERVAL = 0.05  # Minimum seconds between partial MultiPV updates
+EVAL_CACHE_SIZE = 4096  # Positions kept in the in-memory evaluation cache
+EVAL_GRAPH_REFRESH_INTERVAL = 500  # Milliseconds between merging new engine results into the eval graph
+
+# Draws that end the game without a claim (the fivefold repetition and seventy-five-move rules)
+REPETITION_DRAW_COUNT = 5
+MOVE_RULE_DRAW_PLIES = 150
+
+# Game tree: boards kept for quick jumps to positions away from the cursor
+CHECKPOINT_CACHE_SIZE = 32
+
+# Analysis prefetch (positions around the cursor searched on idle engines)
+PREFETCH_RADIUS = 3
+PREFETCH_DEPTH = 14
+
+# Persistent evaluation store
+EVAL_STORE_PATH = "evaluations.sqlite3"
+EVAL_STORE_MAX_ENTRIES = 200000
+EVAL_STORE_MIN_DEPTH = 12  # Shallower results are not worth keeping across sessions 
\ No newline at end of file
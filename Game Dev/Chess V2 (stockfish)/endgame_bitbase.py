@@ -0,0 +1,516 @@
+import argparse
+import os
+import time
+import numpy as np
+import chess
+from config import BITBASE_DIR, BITBASE_TABLES, EVAL_PV_LINE_LENGTH
+from evaluation_cache import CachedEvaluation
+
+# White pieces besides the king for each table; the weak side is a lone black king
+# and positions with the strong side as black are probed mirrored
+MATERIAL = {
+    "KQK": (chess.QUEEN,),
+    "KRK": (chess.ROOK,),
+    "KPK": (chess.PAWN,),
+    "KBNK": (chess.BISHOP, chess.KNIGHT)
+}
+
+# KPK promotes into these, so they have to be generated first
+PROMOTION_TABLES = {chess.QUEEN: "KQK", chess.ROOK: "KRK"}
+
+# File layout: 16-byte header, 2-bit WDL codes for all positions, then one DTM byte per position.
+# Positions are indexed white to move first, then black to move, each by the squares
+# (white king, white pieces in table order, black king) as base-64 digits.
+MAGIC = b"CBB1"
+HEADER_SIZE = 16
+WDL_ILLEGAL, WDL_DRAW, WDL_WHITE_WINS = 0, 1, 2
+DTM_NONE = 255  # Not a win for white
+
+# Evaluations from the bitbase are exact; this depth makes them outrank any search
+BITBASE_DEPTH = 100
+
+CHUNK_SIZE = 1 << 20
+
+
+def _square_table(predicate):
+    """Build a 64x64 boolean table from predicate(from_square, to_square)."""
+    return np.array([[predicate(s, t) for t in chess.SQUARES] for s in chess.SQUARES], dtype=bool)
+
+
+def _distance(s, t):
+    return max(abs(chess.square_file(s) - chess.square_file(t)), abs(chess.square_rank(s) - chess.square_rank(t)))
+
+
+KING_ATTACKS = _square_table(lambda s, t: _distance(s, t) == 1)
+KNIGHT_ATTACKS = _square_table(lambda s, t: bool(chess.BB_KNIGHT_ATTACKS[s] & chess.BB_SQUARES[t]))
+PAWN_ATTACKS = _square_table(lambda s, t: bool(chess.BB_PAWN_ATTACKS[chess.WHITE][s] & chess.BB_SQUARES[t]))
+ORTHOGONAL_LINES = _square_table(lambda s, t: s != t and (chess.square_file(s) == chess.square_file(t) or
+                                                          chess.square_rank(s) == chess.square_rank(t)))
+DIAGONAL_LINES = _square_table(lambda s, t: s != t and abs(chess.square_file(s) - chess.square_file(t)) ==
+                               abs(chess.square_rank(s) - chess.square_rank(t)))
+BETWEEN = np.array([[chess.between(s, t) for t in chess.SQUARES] for s in chess.SQUARES], dtype=np.uint64)
+SQUARE_BITS = np.array([1 << s for s in chess.SQUARES], dtype=np.uint64)
+
+# (file, rank) steps of each piece; sliders repeat their step up to seven times
+KING_STEPS = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+KNIGHT_STEPS = [(-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)]
+ROOK_STEPS = [(-1, 0), (1, 0), (0, -1), (0, 1)]
+BISHOP_STEPS = [(-1, -1), (-1, 1), (1, -1), (1, 1)]
+SLIDER_STEPS = {chess.ROOK: ROOK_STEPS, chess.BISHOP: BISHOP_STEPS, chess.QUEEN: ROOK_STEPS + BISHOP_STEPS}
+
+
+def _ray_table(step, length):
+    """Build a (64, length) table of the squares reached by repeating a step (-1 off the board)."""
+    table = np.full((64, length), -1, dtype=np.int16)
+    for square in chess.SQUARES:
+        file, rank = chess.square_file(square), chess.square_rank(square)
+        for k in range(length):
+            file, rank = file + step[0], rank + step[1]
+            if not (0 <= file < 8 and 0 <= rank < 8):
+                break
+            table[square, k] = chess.square(file, rank)
+    return table
+
+
+KING_TARGETS = [_ray_table(step, 1)[:, 0] for step in KING_STEPS]
+KNIGHT_TARGETS = [_ray_table(step, 1)[:, 0] for step in KNIGHT_STEPS]
+RAYS = {step: _ray_table(step, 7) for step in ROOK_STEPS + BISHOP_STEPS}
+
+
+class BitbaseGenerator:
+    """Retrograde analysis of one table (king and pieces against a lone king).
+    
+    Black-to-move checkmates are the starting frontier. Working backwards
+    ply by ply, every white-to-move position with a move into a lost position
+    is won, and a black-to-move position is lost once every legal move leads
+    into a won position (tracked with a per-position move counter). Capturing
+    a white piece always draws. KPK also seeds its promotions from the KQK
+    and KRK tables. All steps are vectorized over the positions with NumPy.
+    """
+    
+    def __init__(self, name, promotion_tables=None):
+        """Set up the table layout; promotion_tables maps piece types to generated tables (KPK)."""
+        self.name = name
+        self.pieces = MATERIAL[name]
+        self.piece_count = len(self.pieces) + 2
+        self.size = 64 ** self.piece_count
+        self.promotion_tables = promotion_tables or {}
+        self.wtm_dtm = np.full(self.size, DTM_NONE, dtype=np.uint8)
+        self.btm_dtm = np.full(self.size, DTM_NONE, dtype=np.uint8)
+        self.wtm_legal = np.zeros(self.size, dtype=bool)
+        self.btm_legal = np.zeros(self.size, dtype=bool)
+        self.move_count = np.zeros(self.size, dtype=np.uint8)
+        self.escape = np.zeros(self.size, dtype=bool)
+    
+    def decode(self, indices):
+        """Split position indices into square arrays (white king, pieces..., black king)."""
+        squares = []
+        for digit in range(self.piece_count - 1, -1, -1):
+            squares.append(((indices // 64 ** digit) % 64).astype(np.int64))
+        return squares
+    
+    def encode(self, squares):
+        """Combine square arrays into position indices."""
+        indices = np.zeros_like(squares[0], dtype=np.int64)
+        for square in squares:
+            indices = indices * 64 + square
+        return indices
+    
+    @staticmethod
+    def occupancy(squares):
+        """Bitmask of the white pieces (the black king is left out)."""
+        occupied = np.zeros(len(squares[0]), dtype=np.uint64)
+        for square in squares[:-1]:
+            occupied |= SQUARE_BITS[square]
+        return occupied
+    
+    def attacked(self, target, squares, occupied, skip=None):
+        """Check if white attacks target; skip is the index of a captured piece."""
+        hit = KING_ATTACKS[squares[0], target]
+        for i, piece in enumerate(self.pieces, 1):
+            if i == skip:
+                continue
+            square = squares[i]
+            if piece == chess.KNIGHT:
+                hit |= KNIGHT_ATTACKS[square, target]
+            elif piece == chess.PAWN:
+                hit |= PAWN_ATTACKS[square, target]
+            else:
+                line = np.zeros(len(target), dtype=bool)
+                if piece in (chess.ROOK, chess.QUEEN):
+                    line |= ORTHOGONAL_LINES[square, target]
+                if piece in (chess.BISHOP, chess.QUEEN):
+                    line |= DIAGONAL_LINES[square, target]
+                hit |= line & ((BETWEEN[square, target] & occupied) == 0)
+        return hit
+    
+    def base_legal(self, squares):
+        """Check the conditions shared by both sides to move (no overlaps, kings apart, pawn ranks)."""
+        legal = ~KING_ATTACKS[squares[0], squares[-1]]
+        for i in range(self.piece_count):
+            for j in range(i + 1, self.piece_count):
+                legal &= squares[i] != squares[j]
+        for i, piece in enumerate(self.pieces, 1):
+            if piece == chess.PAWN:
+                legal &= (squares[i] >= 8) & (squares[i] < 56)
+        return legal
+    
+    def initialize(self):
+        """Find legal positions, black's legal moves, and the checkmates."""
+        for start in range(0, self.size, CHUNK_SIZE):
+            indices = np.arange(start, min(start + CHUNK_SIZE, self.size), dtype=np.int64)
+            squares = self.decode(indices)
+            occupied = self.occupancy(squares)
+            base = self.base_legal(squares)
+            black_king = squares[-1]
+            in_check = self.attacked(black_king, squares, occupied)
+            
+            self.wtm_legal[indices] = base & ~in_check
+            self.btm_legal[indices] = base
+            
+            # Count black's legal king moves; capturing a piece escapes to a draw
+            count = np.zeros(len(indices), dtype=np.uint8)
+            escape = np.zeros(len(indices), dtype=bool)
+            for targets in KING_TARGETS:
+                target = targets[black_king].astype(np.int64)
+                valid = base & (target >= 0)
+                target = np.where(valid, target, 0)
+                valid &= (target != squares[0]) & ~KING_ATTACKS[squares[0], target]
+                
+                captured = np.zeros(len(indices), dtype=bool)
+                for i in range(1, self.piece_count - 1):
+                    takes = valid & (squares[i] == target)
+                    captured |= takes
+                    escape |= takes & ~self.attacked(target, squares, occupied & ~SQUARE_BITS[squares[i]], skip=i)
+                
+                quiet = valid & ~captured
+                count += (quiet & ~self.attacked(target, squares, occupied)).astype(np.uint8)
+            
+            self.move_count[indices] = count
+            self.escape[indices] = escape
+            mated = base & in_check & (count == 0) & ~escape
+            self.btm_dtm[indices[mated]] = 0
+    
+    def seed_promotions(self):
+        """Score white-to-move pawn promotions from the already generated tables (KPK only)."""
+        if chess.PAWN not in self.pieces or not self.promotion_tables:
+            return
+        
+        pawn = self.pieces.index(chess.PAWN) + 1
+        indices = np.flatnonzero(self.wtm_legal)
+        squares = self.decode(indices)
+        on_seventh = (squares[pawn] >= 48)
+        indices = indices[on_seventh]
+        squares = [square[on_seventh] for square in squares]
+        
+        promotion = squares[pawn] + 8
+        free = np.ones(len(indices), dtype=bool)
+        for i, square in enumerate(squares):
+            if i != pawn:
+                free &= square != promotion
+        
+        best = np.full(len(indices), DTM_NONE, dtype=np.int64)
+        for piece, table in self.promotion_tables.items():
+            promoted = list(squares)
+            promoted[pawn] = promotion
+            # The promoted table holds (king, piece, black king) with black to move
+            target_dtm = table.btm_dtm[table.encode(promoted)].astype(np.int64)
+            won = free & (target_dtm != DTM_NONE)
+            best = np.where(won, np.minimum(best, target_dtm + 1), best)
+        
+        seeded = best != DTM_NONE
+        self.wtm_dtm[indices[seeded]] = best[seeded].astype(np.uint8)
+    
+    def white_predecessors(self, indices):
+        """Get the white-to-move positions with a white move into the given black-to-move positions."""
+        squares = self.decode(indices)
+        occupied = self.occupancy(squares)
+        all_occupied = occupied | SQUARE_BITS[squares[-1]]
+        predecessors = []
+        
+        for i in range(self.piece_count - 1):
+            piece = chess.KING if i == 0 else self.pieces[i - 1]
+            origins = []
+            
+            if piece == chess.KING or piece == chess.KNIGHT:
+                for targets in (KING_TARGETS if piece == chess.KING else KNIGHT_TARGETS):
+                    origin = targets[squares[i]].astype(np.int64)
+                    valid = origin >= 0
+                    origin = np.where(valid, origin, 0)
+                    origins.append((origin, valid & ((all_occupied & SQUARE_BITS[origin]) == 0)))
+            elif piece == chess.PAWN:
+                one_back = squares[i] - 8
+                valid = (one_back >= 8) & ((all_occupied & SQUARE_BITS[np.maximum(one_back, 0)]) == 0)
+                origins.append((np.maximum(one_back, 0), valid))
+                two_back = squares[i] - 16
+                double = valid & (squares[i] >= 24) & (squares[i] < 32)
+                double &= (all_occupied & SQUARE_BITS[np.maximum(two_back, 0)]) == 0
+                origins.append((np.maximum(two_back, 0), double))
+            else:
+                for step in SLIDER_STEPS[piece]:
+                    ray = RAYS[step][squares[i]]
+                    open_path = np.ones(len(indices), dtype=bool)
+                    for k in range(7):
+                        origin = ray[:, k].astype(np.int64)
+                        open_path &= origin >= 0
+                        origin = np.where(open_path, origin, 0)
+                        open_path &= (all_occupied & SQUARE_BITS[origin]) == 0
+                        origins.append((origin, open_path.copy()))
+            
+            for origin, valid in origins:
+                if not valid.any():
+                    continue
+                moved = [square[valid] for square in squares]
+                moved[i] = origin[valid]
+                predecessor = self.encode(moved)
+                # The position before the move must be legal with white to move
+                predecessor = predecessor[self.wtm_legal[predecessor]]
+                predecessors.append(predecessor)
+        
+        return np.concatenate(predecessors) if predecessors else np.zeros(0, dtype=np.int64)
+    
+    def black_predecessors(self, indices):
+        """Get the black-to-move positions with a black king move into the given white-to-move positions."""
+        squares = self.decode(indices)
+        occupied = self.occupancy(squares)
+        predecessors = []
+        
+        for targets in KING_TARGETS:
+            origin = targets[squares[-1]].astype(np.int64)
+            valid = origin >= 0
+            origin = np.where(valid, origin, 0)
+            valid &= (occupied & SQUARE_BITS[origin]) == 0
+            if not valid.any():
+                continue
+            moved = [square[valid] for square in squares]
+            moved[-1] = origin[valid]
+            predecessor = self.encode(moved)
+            predecessors.append(predecessor[self.btm_legal[predecessor]])
+        
+        return np.concatenate(predecessors) if predecessors else np.zeros(0, dtype=np.int64)
+    
+    def generate(self):
+        """Run the retrograde analysis; returns self for chaining."""
+        self.initialize()
+        self.seed_promotions()
+        longest_seed = int(self.wtm_dtm[self.wtm_dtm != DTM_NONE].max(initial=0))
+        
+        ply = 0
+        while ply < DTM_NONE - 2:
+            # Black to move, lost in `ply`: every white move into it wins in ply + 1
+            lost = np.flatnonzero(self.btm_dtm == ply)
+            if lost.size:
+                predecessors = self.white_predecessors(lost)
+                self.wtm_dtm[predecessors] = np.minimum(self.wtm_dtm[predecessors], ply + 1)
+            
+            # White to move, won in ply + 1: black positions run out of safe moves
+            won = np.flatnonzero(self.wtm_dtm == ply + 1)
+            if won.size:
+                predecessors, counts = np.unique(self.black_predecessors(won), return_counts=True)
+                remaining = self.move_count[predecessors].astype(np.int64) - counts
+                self.move_count[predecessors] = np.maximum(remaining, 0).astype(np.uint8)
+                lost_now = predecessors[(remaining <= 0) & ~self.escape[predecessors] &
+                                       (self.btm_dtm[predecessors] == DTM_NONE)]
+                self.btm_dtm[lost_now] = ply + 2
+            
+            if not lost.size and not won.size and ply + 1 >= longest_seed:
+                break
+            ply += 2
+        
+        return self
+    
+    def save(self, path):
+        """Write the bit-packed WDL codes and DTM bytes to disk."""
+        wdl = np.concatenate([
+            np.where(self.wtm_dtm != DTM_NONE, WDL_WHITE_WINS, np.where(self.wtm_legal, WDL_DRAW, WDL_ILLEGAL)),
+            np.where(self.btm_dtm != DTM_NONE, WDL_WHITE_WINS, np.where(self.btm_legal, WDL_DRAW, WDL_ILLEGAL))
+        ]).astype(np.uint8)
+        # Four 2-bit codes per byte, lowest bits first
+        quads = wdl.reshape(-1, 4)
+        packed = quads[:, 0] | (quads[:, 1] << 2) | (quads[:, 2] << 4) | (quads[:, 3] << 6)
+        
+        header = MAGIC + bytes([self.piece_count]) + bytes(HEADER_SIZE - len(MAGIC) - 1)
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as f:
+            f.write(header)
+            f.write(packed.astype(np.uint8).tobytes())
+            f.write(self.wtm_dtm.tobytes())
+            f.write(self.btm_dtm.tobytes())
+        os.replace(temp_path, path)
+
+
+class Bitbase:
+    """A generated table opened as a read-only memory map."""
+    
+    def __init__(self, name, path):
+        """Map the table file and check its header."""
+        self.name = name
+        self.pieces = MATERIAL[name]
+        self.piece_count = len(self.pieces) + 2
+        self.size = 64 ** self.piece_count
+        
+        data = np.memmap(path, dtype=np.uint8, mode="r")
+        packed_size = 2 * self.size // 4
+        if bytes(data[:len(MAGIC)]) != MAGIC or data[len(MAGIC)] != self.piece_count or \
+                len(data) != HEADER_SIZE + packed_size + 2 * self.size:
+            raise ValueError(f"{path} is not a valid {name} bitbase")
+        self.wdl = data[HEADER_SIZE:HEADER_SIZE + packed_size]
+        self.dtm = data[HEADER_SIZE + packed_size:]
+    
+    def probe(self, squares, white_to_move):
+        """Get (WDL code, DTM) for a position given as (white king, pieces..., black king)."""
+        index = 0
+        for square in squares:
+            index = index * 64 + square
+        if not white_to_move:
+            index += self.size
+        code = (int(self.wdl[index >> 2]) >> ((index & 3) * 2)) & 3
+        return code, int(self.dtm[index])
+
+
+class EndgameBitbases:
+    """Exact results for KQK, KRK, KPK and KBNK from generated bitbases.
+    
+    Tables are generated with `python endgame_bitbase.py` into BITBASE_DIR
+    and memory-mapped on first use, so probing costs a few array lookups.
+    Missing tables are skipped and those endings are left to the engine.
+    """
+    
+    def __init__(self, directory=BITBASE_DIR):
+        """Open every table present in the directory."""
+        self.tables = {}
+        for name in BITBASE_TABLES:
+            path = os.path.join(directory, f"{name}.bb")
+            if not os.path.exists(path):
+                continue
+            try:
+                table = Bitbase(name, path)
+            except (OSError, ValueError) as e:
+                print(f"Error loading bitbase: {str(e)}")
+                continue
+            self.tables[tuple(sorted(table.pieces))] = table
+    
+    def probe(self, board):
+        """Get (wdl, dtm) for the side to move, or None if no table covers the position.
+        
+        wdl is 1 (win), 0 (draw) or -1 (loss); dtm is the number of plies to
+        mate for decided positions and None for draws.
+        """
+        if not self.tables or board.castling_rights or chess.popcount(board.occupied) > 4:
+            return None
+        
+        # Tables store the strong side as white; mirror positions where black is strong
+        if chess.popcount(board.occupied_co[chess.WHITE]) == 1:
+            board = board.mirror()
+        if chess.popcount(board.occupied_co[chess.BLACK]) != 1:
+            return None
+        
+        white = board.occupied_co[chess.WHITE]
+        pieces = [(board.piece_type_at(square), square) for square in chess.scan_forward(white & ~board.kings)]
+        table = self.tables.get(tuple(sorted(piece for piece, _ in pieces)))
+        if table is None:
+            return None
+        
+        squares = [board.king(chess.WHITE)]
+        for piece in table.pieces:
+            squares.append(next(square for piece_type, square in pieces if piece_type == piece))
+        squares.append(board.king(chess.BLACK))
+        
+        code, dtm = table.probe(squares, board.turn == chess.WHITE)
+        if code == WDL_WHITE_WINS:
+            return (1, dtm) if board.turn == chess.WHITE else (-1, dtm)
+        if code == WDL_DRAW:
+            return 0, None
+        return None
+    
+    def _child_result(self, board, move):
+        """Get (wdl, dtm) for the side to move after a move, treating dead positions as draws."""
+        board.push(move)
+        try:
+            if board.is_insufficient_material():
+                return 0, None
+            return self.probe(board)
+        finally:
+            board.pop()
+    
+    def best_move(self, board):
+        """Get the move that wins fastest, holds the draw, or loses slowest, or None if not covered."""
+        if self.probe(board) is None:
+            return None
+        
+        best = None
+        best_key = None
+        for move in board.legal_moves:
+            result = self._child_result(board, move)
+            if result is None:
+                return None
+            wdl, dtm = result
+            # Our outcome is the opposite of the opponent's; prefer short wins and long losses
+            if wdl == -1:
+                key = (2, -dtm)
+            elif wdl == 0:
+                key = (1, 0)
+            else:
+                key = (0, dtm)
+            if best_key is None or key > best_key:
+                best, best_key = move, key
+        return best
+    
+    def evaluation(self, board):
+        """Get an exact CachedEvaluation (white's point of view) with the winning line, or None."""
+        result = self.probe(board)
+        if result is None:
+            return None
+        
+        wdl, dtm = result
+        pv = []
+        line_board = board.copy(stack=False)
+        while len(pv) < EVAL_PV_LINE_LENGTH and not line_board.is_game_over():
+            move = self.best_move(line_board)
+            if move is None:
+                break
+            pv.append(move)
+            line_board.push(move)
+        
+        if wdl == 0:
+            return CachedEvaluation(0, None, pv, BITBASE_DEPTH)
+        white_wins = (wdl == 1) == (board.turn == chess.WHITE)
+        return CachedEvaluation(30000 if white_wins else -30000, (dtm + 1) // 2, pv, BITBASE_DEPTH)
+
+
+def generate_tables(names, directory=BITBASE_DIR):
+    """Generate the named tables (and the tables KPK promotes into) and save them."""
+    os.makedirs(directory, exist_ok=True)
+    if "KPK" in names:
+        names = [name for name in PROMOTION_TABLES.values() if name not in names] + list(names)
+    # Promotion tables first
+    names = sorted(names, key=lambda name: name == "KPK")
+    
+    generated = {}
+    for name in names:
+        start = time.monotonic()
+        promotion_tables = {piece: generated[table] for piece, table in PROMOTION_TABLES.items()
+                            if table in generated} if name == "KPK" else None
+        generator = BitbaseGenerator(name, promotion_tables).generate()
+        generator.save(os.path.join(directory, f"{name}.bb"))
+        generated[name] = generator
+        
+        longest = int(max(generator.wtm_dtm[generator.wtm_dtm != DTM_NONE].max(initial=0),
+                          generator.btm_dtm[generator.btm_dtm != DTM_NONE].max(initial=0)))
+        print(f"{name}: {int((generator.wtm_dtm != DTM_NONE).sum())} won positions with white to move, "
+              f"longest mate {(longest + 1) // 2} moves, {time.monotonic() - start:.1f}s")
+        
+        # KPK only needs the promotion tables, so free everything else
+        if name not in PROMOTION_TABLES.values():
+            del generated[name]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate endgame bitbases by retrograde analysis")
+    parser.add_argument("tables", nargs="*", default=BITBASE_TABLES, help=f"tables to build ({', '.join(MATERIAL)})")
+    args = parser.parse_args()
+    
+    unknown = [name for name in args.tables if name not in MATERIAL]
+    if unknown:
+        parser.error(f"unknown tables: {', '.join(unknown)}")
+    generate_tables(args.tables)
@@ -1,68 +1,299 @@
 import chess
 import chess.engine
+import chess.polyglot
 import threading
+import time
 import concurrent.futures
-from config import STOCKFISH_PATH, ENGINE_THREADS, ENGINE_HASH, DIFFICULTY_SETTINGS, EVAL_TIME, EVAL_DEPTH, EVAL_PV_LINE_LENGTH
+from collections import namedtuple
+from config import (DIFFICULTY_SETTINGS, EVAL_DEPTH, EVAL_PV_LINE_LENGTH, EVAL_MULTIPV, EVAL_UPDATE_INTERVAL,
+                    EVAL_STORE_MIN_DEPTH, PREFETCH_DEPTH, ENGINE_POOL_SIZE)
+from engine_pool import EnginePool, PRIORITY_PLAY, PRIORITY_PONDER, PRIORITY_ANALYSIS, PRIORITY_PREFETCH
+from evaluation_cache import EvaluationCache, CachedEvaluation
+from evaluation_store import EvaluationStore
+from opening_book import OpeningBook
+from endgame_bitbase import EndgameBitbases
+from engine_telemetry import EngineTelemetry
+from engine_tuning import load_profiles
+from provision_engine import resolve_engine_path
+
+# One ranked analysis line: the first move, its score (white's point of view) and the line in SAN
+CandidateLine = namedtuple("CandidateLine", ["move", "evaluation", "mate_in", "san_line", "depth"])
+
+class AnalysisSession:
+    """Position and stream handle shared between the UI thread and an analysis job."""
+    
+    def __init__(self, board):
+        """Initialize the session with the position to analyse."""
+        self.lock = threading.Lock()
+        self.board = board.copy()
+        self.handle = None
+        self.wake = threading.Event()
+    
+    def set_board(self, board):
+        """Switch the session to a new position, interrupting the running search."""
+        with self.lock:
+            self.board = board.copy()
+            self.wake.set()
+            if self.handle:
+                self.handle.stop()
+    
+    def interrupt(self):
+        """Interrupt the running search (used when the job is stopped)."""
+        with self.lock:
+            self.wake.set()
+            if self.handle:
+                self.handle.stop()
+
+class PonderSearch(AnalysisSession):
+    """Search of the position after the expected reply, run on the player's time."""
+    
+    def __init__(self, board):
+        """Initialize a ponder search of the given (expected) position."""
+        super().__init__(board)
+        self.key = chess.polyglot.zobrist_hash(self.board)
+        self.job = None
+        self.best_move = None
+        self.depth = 0
 
 class EngineManager:
     """Class to manage interactions with the chess engine (Stockfish)."""
     
-    def __init__(self):
-        """Initialize the engine manager."""
-        self.engine = chess.engine.SimpleEngine.popen_uci(STOCKFISH_PATH)
-        self.engine.configure({"Threads": ENGINE_THREADS, "Hash": ENGINE_HASH})
-        self.stop_evaluation_event = threading.Event()
+    def __init__(self, pool_size=ENGINE_POOL_SIZE, in_process_play=True):
+        """Initialize the engine manager with pool_size engine processes.
+        
+        in_process_play=False plays every difficulty on the engine pool, also
+        those set to the built-in engine (a server keeps searches out of its
+        own process that way).
+        """
+        engine_path = resolve_engine_path()
+        self.pool = EnginePool(size=pool_size, engine_path=engine_path)
+        self.in_process_play = in_process_play
+        self.python_pool = None  # Started on first use by a "python" backend difficulty
+        self.telemetry = EngineTelemetry()
+        self.profiles = load_profiles(engine_path=engine_path, pool_size=pool_size)
+        self.cache = EvaluationCache()
+        self.store = self._open_store()
+        self.book = OpeningBook()
+        self.bitbases = EndgameBitbases()
+        self.ponder = None
+        self.ponder_lock = threading.Lock()
+        self.prefetch_jobs = []
         self.evaluation_lock = threading.Lock()
-        self.evaluation_thread = None
+        self.evaluation_job = None
+        self.evaluation_session = None
         self.evaluation = None
         self.best_move = None
         self.pv_line = []
         self.mate_in = None
+        self.depth = None
+        self.lines = []
         self._current_callback = None
         self._current_board = None
+        self.paused = False
+        self._paused_evaluation = None
     
-    def set_difficulty(self, difficulty):
-        """Set the difficulty level for the engine."""
-        if difficulty in DIFFICULTY_SETTINGS:
-            settings = DIFFICULTY_SETTINGS[difficulty]
-            self.engine.configure({"Skill Level": settings["skill_level"]})
-    
-    def get_best_move(self, board, difficulty):
-        """Get the best move from the engine for the given board position."""
-        # Temporarily stop evaluation to avoid engine conflicts
-        was_evaluating = self.evaluation_thread and self.evaluation_thread.is_alive()
-        if was_evaluating:
-            self.stop_evaluation()
-        
+    @staticmethod
+    def _open_store():
+        """Open the persistent evaluation store, or run without one if it is unavailable."""
         try:
-            settings = DIFFICULTY_SETTINGS[difficulty]
-            result = self.engine.play(
-                board, 
-                chess.engine.Limit(
-                    time=settings["time"], 
-                    depth=settings["depth"]
-                )
-            )
-            move = result.move
-        except concurrent.futures.CancelledError:
-            print("AI move was cancelled")
-            move = None
+            return EvaluationStore()
         except Exception as e:
-            print(f"Error in AI move: {str(e)}")
-            move = None
+            print(f"Evaluation store disabled: {str(e)}")
+            return None
+    
+    def get_best_move(self, board, difficulty, clocks=None):
+        """Get the best move from the engine for the given board position."""
+        move = self.request_best_move(board, difficulty, clocks).result()
         
-        # Restart evaluation if it was running before
-        if was_evaluating:
-            # Use the updated board position after the move
+        # Move the evaluation on to the position after the AI move
+        if self.is_evaluating():
             updated_board = board.copy()
             if move:
                 updated_board.push(move)
-            self.start_evaluation(updated_board, self._current_callback)
+            self.update_evaluation_position(updated_board)
+        
+        return move
+    
+    def request_best_move(self, board, difficulty, clocks=None, ponder=True):
+        """Ask for the AI move without blocking.
+        
+        clocks holds the remaining times and increments (white_clock,
+        black_clock, white_inc, black_inc) in timed games, so the engine
+        budgets its own time; without it a fixed time per move is used.
+        ponder=False never ponders, for callers playing several games at once.
+        
+        Returns a concurrent.futures.Future resolving to the move (None if the
+        engine failed). Cancelling the future cancels the engine job.
+        """
+        settings = DIFFICULTY_SETTINGS[difficulty]
+        if clocks:
+            limit = chess.engine.Limit(depth=settings.get("clock_depth"), **clocks)
+        else:
+            limit = chess.engine.Limit(time=settings["time"], depth=settings["depth"])
+        board = board.copy()
+        future = concurrent.futures.Future()
+        
+        # Answer book positions without touching the engine
+        move = self.book.choose_move(board, settings.get("book", "weighted"))
+        
+        # Play covered endgames perfectly from the bitbases
+        if move is None:
+            move = self.bitbases.best_move(board)
+        
+        # Answer at once if the player made the reply we were pondering on
+        ponder_move = self._take_ponder_hit(board, settings) if ponder else None
+        if move is None:
+            move = ponder_move
+        
+        if move is not None:
+            future.set_result(move)
+            return future
+        
+        # AI moves outrank analysis, which keeps running on another worker
+        job = self._pool_for(difficulty).submit(
+            "play",
+            lambda engine, job: self._timed_play(engine, board, limit),
+            PRIORITY_PLAY,
+            self._play_options(difficulty)
+        )
+        
+        def on_job_done(job_future):
+            try:
+                result = job_future.result()
+                move = result.move
+                if ponder and settings.get("ponder") and move and result.ponder and not future.cancelled():
+                    self._start_ponder(board, move, result.ponder, difficulty)
+            except concurrent.futures.CancelledError:
+                print("AI move was cancelled")
+                move = None
+            except Exception as e:
+                print(f"Error in AI move: {str(e)}")
+                self.telemetry.record_error("play")
+                move = None
+            
+            try:
+                future.set_result(move)
+            except concurrent.futures.InvalidStateError:
+                pass  # The caller cancelled the request
         
+        def on_request_done(request_future):
+            if request_future.cancelled():
+                job.cancel()
+        
+        job.future.add_done_callback(on_job_done)
+        future.add_done_callback(on_request_done)
+        return future
+    
+    def _pool_for(self, difficulty):
+        """Get the pool that plays moves at a difficulty (the in-process engine or Stockfish)."""
+        if (not self.in_process_play or DIFFICULTY_SETTINGS[difficulty].get("backend") != "python"
+                or self.pool.in_process):
+            return self.pool
+        if self.python_pool is None:
+            self.python_pool = EnginePool(size=1, backend="python")
+        return self.python_pool
+    
+    def _timed_play(self, engine, board, limit):
+        """Run engine.play and record its latency, depth and node counts."""
+        start = time.monotonic()
+        result = engine.play(board, limit, info=chess.engine.INFO_BASIC)
+        self.telemetry.record("play", time.monotonic() - start, result.info)
+        return result
+    
+    def _play_options(self, difficulty):
+        """Get the engine options (tuned Threads/Hash and Skill Level) for a difficulty."""
+        options = dict(self.profiles.get(difficulty, {}))
+        options["Skill Level"] = DIFFICULTY_SETTINGS[difficulty]["skill_level"]
+        return options
+    
+    def _start_ponder(self, board, move, expected_reply, difficulty):
+        """Search the position after the expected reply while the player thinks."""
+        if self.paused:
+            return
+        
+        expected_board = board.copy()
+        expected_board.push(move)
+        if not expected_board.is_legal(expected_reply):
+            return
+        expected_board.push(expected_reply)
+        
+        ponder = PonderSearch(expected_board)
+        ponder.job = self.pool.submit(
+            "play",
+            lambda engine, job: self._ponder_worker(engine, job, ponder),
+            PRIORITY_PONDER,
+            self._play_options(difficulty)
+        )
+        ponder.job.add_stop_hook(ponder.interrupt)
+        
+        with self.ponder_lock:
+            previous, self.ponder = self.ponder, ponder
+        if previous:
+            previous.job.cancel()
+    
+    def _take_ponder_hit(self, board, settings):
+        """Stop the ponder search and return its move if it searched this exact position."""
+        with self.ponder_lock:
+            ponder, self.ponder = self.ponder, None
+        if ponder is None:
+            return None
+        
+        ponder.job.cancel()
+        if ponder.key != chess.polyglot.zobrist_hash(board):
+            return None  # Ponder miss: the player chose another move
+        
+        with ponder.lock:
+            move, depth = ponder.best_move, ponder.depth
+        
+        # A ponder search shallower than a normal move is not worth playing
+        if move is None or depth < settings["depth"] or not board.is_legal(move):
+            return None
         return move
     
+    def cancel_ponder(self):
+        """Cancel the running ponder search, if any."""
+        with self.ponder_lock:
+            ponder, self.ponder = self.ponder, None
+        if ponder:
+            ponder.job.cancel()
+    
+    def _ponder_worker(self, engine, job, ponder):
+        """Pool job searching the pondered position until it is cancelled."""
+        start = time.monotonic()
+        stream_info = {}
+        try:
+            with engine.analysis(ponder.board) as analysis:
+                with ponder.lock:
+                    ponder.handle = analysis
+                    if job.stop_event.is_set():
+                        analysis.stop()
+                
+                for info in analysis:
+                    stream_info.update(info)
+                    pv = info.get("pv")
+                    if not pv or "score" not in info:
+                        continue
+                    
+                    with ponder.lock:
+                        ponder.best_move = pv[0]
+                        ponder.depth = info.get("depth") or 0
+                    self.cache.store(ponder.board, self._entry_from_info(info), ponder.key)
+        except Exception:
+            self.telemetry.record_error("ponder")
+            raise
+        finally:
+            with ponder.lock:
+                ponder.handle = None
+            self.telemetry.record("ponder", time.monotonic() - start, stream_info)
+    
     def start_evaluation(self, board, callback):
-        """Start continuous evaluation of the position."""
+        """Start continuous evaluation of the position.
+        
+        callback (if not None) receives every analysis update as
+        callback(best_move, evaluation, pv_line, mate_in, depth, lines), from
+        the engine thread while holding the evaluation lock. lines holds the
+        ranked CandidateLine objects (EVAL_MULTIPV of them when available).
+        """
         # Stop any existing evaluation
         self.stop_evaluation()
         
@@ -70,106 +301,439 @@ class EngineManager:
         self._current_callback = callback
         self._current_board = board.copy()
         
-        self.stop_evaluation_event.clear()
-        self.evaluation_thread = threading.Thread(
-            target=self._evaluation_worker, 
-            args=(board, callback)
+        # Show what we already know about the position while the engine starts
+        self._show_cached(board, callback)
+        
+        session = AnalysisSession(board)
+        self.evaluation_session = session
+        self.evaluation_job = self.pool.submit(
+            "analysis",
+            lambda engine, job: self._evaluation_worker(engine, job, session, callback),
+            PRIORITY_ANALYSIS,
+            self.profiles.get("analysis")
         )
-        self.evaluation_thread.start()
+        self.evaluation_job.add_stop_hook(session.interrupt)
     
     def stop_evaluation(self):
         """Stop the continuous evaluation."""
-        if self.evaluation_thread and self.evaluation_thread.is_alive():
-            self.stop_evaluation_event.set()
-            self.evaluation_thread.join()
+        self._paused_evaluation = None
+        if self.evaluation_job:
+            self.evaluation_job.cancel()
+            self.evaluation_job = None
+            self.evaluation_session = None
+    
+    def is_evaluating(self):
+        """Check if continuous evaluation is active."""
+        return self.evaluation_job is not None and self.evaluation_job.is_active()
+    
+    def pause(self):
+        """Suspend analysis, pondering and prefetching to leave the CPU idle.
+        
+        The analysed position is remembered, and resume() continues the
+        analysis from the cached result.
+        """
+        if self.paused:
+            return
+        self.paused = True
+        
+        paused_evaluation = None
+        if self.is_evaluating():
+            paused_evaluation = (self._current_board, self._current_callback)
+        self.stop_evaluation()
+        self._paused_evaluation = paused_evaluation
+        self.cancel_ponder()
+        self.cancel_prefetch()
+    
+    def resume(self):
+        """Restart the analysis suspended by pause()."""
+        if not self.paused:
+            return
+        self.paused = False
+        
+        if self._paused_evaluation:
+            board, callback = self._paused_evaluation
+            self._paused_evaluation = None
+            self.start_evaluation(board, callback)
     
     def update_evaluation_position(self, board):
         """Update the evaluation for a new board position while keeping evaluation active."""
-        if self.evaluation_thread and self.evaluation_thread.is_alive():
-            # Restart evaluation with new position
-            self.start_evaluation(board, self._current_callback)
+        if self.is_evaluating():
+            # Redirect the running analysis stream to the new position
+            self._current_board = board.copy()
+            self.evaluation_session.set_board(board)
+            self._show_cached(board, self._current_callback)
+        elif self._paused_evaluation:
+            # Resume on the position the player is looking at now
+            self._paused_evaluation = (board.copy(), self._paused_evaluation[1])
+            self._show_cached(board, self._paused_evaluation[1])
+    
+    def prefetch_positions(self, boards):
+        """Search positions near the cursor to a shallow depth on idle engine capacity.
+        
+        boards should be ordered by priority (nearest first). Results only go
+        into the evaluation cache, so moving to one of these positions shows
+        an evaluation at once. Any earlier prefetch request is cancelled.
+        """
+        self.cancel_prefetch()
+        # The built-in engine is far too slow for PREFETCH_DEPTH searches
+        if self.paused or self.pool.in_process:
+            return
+        
+        for board in boards:
+            session = AnalysisSession(board)
+            # Sequence numbers keep the jobs in the order given
+            job = self.pool.submit(
+                "analysis",
+                lambda engine, job, session=session: self._prefetch_worker(engine, job, session),
+                PRIORITY_PREFETCH,
+                self.profiles.get("prefetch")
+            )
+            job.add_stop_hook(session.interrupt)
+            self.prefetch_jobs.append(job)
+    
+    def cancel_prefetch(self):
+        """Cancel prefetch jobs that have not finished yet."""
+        for job in self.prefetch_jobs:
+            job.cancel()
+        self.prefetch_jobs = []
+    
+    def _prefetch_worker(self, engine, job, session):
+        """Pool job giving one position a shallow search, unless it is already known."""
+        board = session.board
+        if job.stop_event.is_set() or board.is_game_over():
+            return
+        
+        entry = self._lookup(board)
+        if entry is not None and entry.depth >= PREFETCH_DEPTH:
+            return
+        
+        # Keep the result even if the job was stopped meanwhile; it is still valid
+        start = time.monotonic()
+        try:
+            info = self._search(engine, job, session, chess.engine.Limit(depth=PREFETCH_DEPTH))
+        except Exception:
+            self.telemetry.record_error("prefetch")
+            raise
+        self.telemetry.record("prefetch", time.monotonic() - start, info)
+        if "score" in info:
+            key = self.cache.key(board)
+            self.cache.store(board, self._entry_from_info(info), key)
+            self._write_back(board, key)
+    
+    def request_analysis(self, board, depth):
+        """Search a position to a fixed depth without blocking.
+        
+        Returns a concurrent.futures.Future resolving to a CachedEvaluation.
+        Known positions (bitbases, cache or store) at least depth deep are
+        answered at once. Cancelling the future cancels the engine job.
+        """
+        board = board.copy()
+        future = concurrent.futures.Future()
+        entry = self._lookup(board)
+        if entry is not None and (entry.depth or 0) >= depth:
+            future.set_result(entry)
+            return future
+        
+        session = AnalysisSession(board)
+        job = self.pool.submit(
+            "analysis",
+            lambda engine, job: self._analysis_worker(engine, job, session, depth),
+            PRIORITY_ANALYSIS,
+            self.profiles.get("analysis")
+        )
+        job.add_stop_hook(session.interrupt)
+        
+        def on_job_done(job_future):
+            if future.cancelled():
+                return
+            try:
+                future.set_result(job_future.result())
+            except concurrent.futures.CancelledError:
+                future.cancel()
+            except Exception as e:
+                future.set_exception(e)
+        
+        def on_request_done(request_future):
+            if request_future.cancelled():
+                job.cancel()
+        
+        job.future.add_done_callback(on_job_done)
+        future.add_done_callback(on_request_done)
+        return future
+    
+    def _analysis_worker(self, engine, job, session, depth):
+        """Pool job searching one position to a fixed depth and caching the result."""
+        # A preempted job runs again; another request may have searched the position meanwhile
+        board = session.board
+        entry = self._lookup(board)
+        if entry is not None and (entry.depth or 0) >= depth:
+            return entry
+        
+        start = time.monotonic()
+        try:
+            info = self._search(engine, job, session, chess.engine.Limit(depth=depth))
+        except Exception:
+            self.telemetry.record_error("analysis")
+            raise
+        self.telemetry.record("analysis", time.monotonic() - start, info)
+        if "score" not in info and job.stop_event.is_set():
+            return None  # Stopped before the first result: run again (preempted) or dropped (cancelled)
+        
+        key = self.cache.key(board)
+        entry = self.cache.store(board, self._entry_from_info(info), key)
+        self._write_back(board, key)
+        return entry
+    
+    @staticmethod
+    def _search(engine, job, session, limit):
+        """Search the session's position to a limit on a stream the job's stop hooks interrupt.
+        
+        Returns the merged info of the main line, like engine.analyse, with
+        what was found so far if the job is stopped (preempted or cancelled).
+        """
+        info = {}
+        try:
+            with engine.analysis(session.board, limit) as analysis:
+                with session.lock:
+                    session.handle = analysis
+                    if job.stop_event.is_set():
+                        analysis.stop()
+                
+                for update in analysis:
+                    info.update(update)
+        finally:
+            with session.lock:
+                session.handle = None
+        return info
     
     def reset_evaluation_state(self):
         """Reset evaluation state completely - useful when starting new games."""
         self.stop_evaluation()
+        self.cancel_ponder()
+        self.cancel_prefetch()
         with self.evaluation_lock:
             self.evaluation = None
             self.best_move = None
             self.pv_line = []
             self.mate_in = None
+            self.depth = None
+            self.lines = []
         self._current_callback = None
         self._current_board = None
     
-    def _evaluation_worker(self, board, callback):
-        """Worker thread for continuous position evaluation."""
-        while not self.stop_evaluation_event.is_set():
-            try:
-                info = self.engine.analyse(
-                    board, 
-                    chess.engine.Limit(time=EVAL_TIME, depth=EVAL_DEPTH)
-                )
-                
+    def _evaluation_worker(self, engine, job, session, callback):
+        """Pool job streaming engine analysis until the job is stopped.
+        
+        Each position is searched with a single open-ended analysis, and every
+        new depth is published as soon as the engine reports it. When the
+        position changes, the stream is stopped and restarted on the new board.
+        """
+        limit = chess.engine.Limit(depth=EVAL_DEPTH) if EVAL_DEPTH else None
+        
+        while not job.stop_event.is_set():
+            with session.lock:
+                board = session.board
+                session.wake.clear()
+            key = self.cache.key(board)
+            
+            # Bitbase positions are exact: show the stored result instead of searching
+            entry = self.bitbases.evaluation(board)
+            if entry is not None:
                 with self.evaluation_lock:
-                    # Extract best move
-                    pv = info.get("pv", [])
-                    best_move = pv[0] if pv and pv[0] in board.legal_moves else None
-                    
-                    # Extract evaluation score
-                    score = info.get("score")
-                    evaluation = None
-                    mate_in = None
-                    
-                    if score:
-                        try:
-                            # Get score from white's perspective (consistent display)
-                            evaluation = score.white().score()
-                        except (ValueError, TypeError):
-                            # Handle mate scores
-                            if score.is_mate():
-                                mate_moves = score.white().mate()
-                                if mate_moves is not None:
-                                    mate_in = abs(mate_moves)
-                                    # Use large values for mate, preserving sign
-                                    evaluation = 30000 if mate_moves > 0 else -30000
-                                else:
-                                    evaluation = 0  # Fallback for unclear mate
-                            else:
-                                evaluation = 0  # Fallback for other score types
-                    else:
-                        evaluation = 0  # Never leave evaluation as None
-                    
-                    # Generate PV line
-                    pv_board = board.copy()
-                    pv_line = []
-                    for move in pv[:EVAL_PV_LINE_LENGTH]:
-                        if pv_board.is_legal(move):
-                            pv_line.append(pv_board.san(move))
-                            pv_board.push(move)
-                        else:
-                            break
-                    
-                    # Update evaluation data
-                    self.best_move = best_move
-                    self.evaluation = evaluation
-                    self.pv_line = pv_line
-                    self.mate_in = mate_in
+                    if not job.stop_event.is_set() and session.board is board:
+                        self._show_entry(board, self.cache.store(board, entry, key), callback)
+                session.wake.wait()
+                continue
+            
+            # Lines are batched: publish once every line of a depth has arrived,
+            # or after EVAL_UPDATE_INTERVAL, whichever comes first
+            line_count = max(1, min(EVAL_MULTIPV, board.legal_moves.count()))
+            infos = {}
+            last_publish = 0.0
+            stream_start = time.monotonic()
+            stream_info = {}
+            
+            try:
+                with engine.analysis(board, limit, multipv=line_count) as analysis:
+                    with session.lock:
+                        session.handle = analysis
+                        if job.stop_event.is_set() or session.board is not board:
+                            analysis.stop()
                     
-                    # Call the callback with updated data
-                    if callback:
-                        callback(best_move, evaluation, pv_line, mate_in)
+                    for info in analysis:
+                        stream_info.update(info)
+                        if "score" not in info:
+                            continue  # Skip currmove and hashfull-only updates
+                        
+                        rank = info.get("multipv", 1)
+                        infos[rank] = info
+                        now = time.monotonic()
+                        if 1 not in infos or (rank < line_count and now - last_publish < EVAL_UPDATE_INTERVAL):
+                            continue
                         
+                        with self.evaluation_lock:
+                            # Drop results from a stopped job or a stale position
+                            if job.stop_event.is_set() or session.board is not board:
+                                break
+                            self._publish(board, key, dict(infos), callback)
+                        last_publish = now
             except concurrent.futures.CancelledError:
                 print("Evaluation was cancelled")
                 break
+            except chess.engine.EngineTerminatedError:
+                raise
             except Exception as e:
                 print(f"Error in evaluation: {str(e)}")
+                self.telemetry.record_error("analysis")
+                job.stop_event.wait(0.1)  # Back off before retrying
+            finally:
+                with session.lock:
+                    session.handle = None
+                self._write_back(board, key)
+                self.telemetry.record("analysis", time.monotonic() - stream_start, stream_info)
             
-            self.stop_evaluation_event.wait(0.1)  # Wait for 100ms or until stop_evaluation is set
+            # The search finished on its own (depth limit or game over): wait for a new position
+            session.wake.wait()
+    
+    def _publish(self, board, key, infos, callback):
+        """Cache a batch of analysis lines and push them to the callback (evaluation lock held).
+        
+        infos maps MultiPV rank (1 = best) to the latest info for that line.
+        """
+        entries = [self._entry_from_info(infos[rank]) for rank in sorted(infos)]
+        
+        # Keep showing a deeper cached result until the live search catches up
+        entry = self.cache.store(board, entries[0], key)
+        if entry is not entries[0]:
+            self._show_entry(board, entry, callback)
+            return
+        
+        lines = [self._format_line(board, line_entry) for line_entry in entries]
+        self._show_entry(board, entry, callback, lines)
+    
+    def known_evaluations(self, boards, keys=None):
+        """Get the cached engine evaluation of each position (None where it has not been searched)."""
+        keys = keys or [None] * len(boards)
+        evaluations = []
+        for board, key in zip(boards, keys):
+            entry = self.cache.get(board, key)
+            evaluations.append(entry.evaluation if entry is not None else None)
+        return evaluations
+    
+    def _lookup(self, board):
+        """Find a known evaluation in the bitbases or memory, falling back to the persistent store."""
+        entry = self.bitbases.evaluation(board)
+        if entry is not None:
+            return entry
+        
+        key = self.cache.key(board)
+        entry = self.cache.get(board, key)
+        if entry is None and self.store:
+            try:
+                entry = self.store.get(key)
+            except Exception as e:
+                print(f"Error reading evaluation store: {str(e)}")
+                self.telemetry.record_error("store")
+            if entry is not None:
+                entry = self.cache.store(board, entry, key)
+        return entry
+    
+    def _write_back(self, board, key):
+        """Persist the deepest known evaluation of a position once its search ends."""
+        entry = self.cache.get(board, key)
+        if self.store and entry is not None and entry.depth >= EVAL_STORE_MIN_DEPTH:
+            try:
+                self.store.put(key, entry)
+            except Exception as e:
+                print(f"Error writing evaluation store: {str(e)}")
+                self.telemetry.record_error("store")
+    
+    def _show_cached(self, board, callback):
+        """Show the cached evaluation of a position right away, if there is one."""
+        entry = self._lookup(board)
+        if entry is not None:
+            with self.evaluation_lock:
+                self._show_entry(board, entry, callback)
+    
+    def _show_entry(self, board, entry, callback, lines=None):
+        """Update the displayed evaluation data and notify the callback (evaluation lock held)."""
+        main_line = self._format_line(board, entry)
+        if not lines:
+            lines = [main_line]
+        
+        # Update evaluation data
+        self.best_move = main_line.move
+        self.evaluation = entry.evaluation
+        self.pv_line = main_line.san_line
+        self.mate_in = entry.mate_in
+        self.depth = entry.depth
+        self.lines = lines
+        
+        # Call the callbacks with updated data
+        if callback:
+            callback(main_line.move, entry.evaluation, main_line.san_line, entry.mate_in, entry.depth, lines)
+    
+    @staticmethod
+    def _format_line(board, entry):
+        """Turn a cached evaluation into a CandidateLine with a SAN move sequence."""
+        # Extract best move
+        pv = entry.pv
+        best_move = pv[0] if pv and pv[0] in board.legal_moves else None
+        
+        # Generate PV line
+        pv_board = board.copy()
+        pv_line = []
+        for move in pv[:EVAL_PV_LINE_LENGTH]:
+            if pv_board.is_legal(move):
+                pv_line.append(pv_board.san(move))
+                pv_board.push(move)
+            else:
+                break
+        
+        return CandidateLine(best_move, entry.evaluation, entry.mate_in, pv_line, entry.depth)
+    
+    @staticmethod
+    def _entry_from_info(info):
+        """Convert an engine info dict into a CachedEvaluation."""
+        # Extract evaluation score
+        score = info.get("score")
+        evaluation = None
+        mate_in = None
+        
+        if score:
+            try:
+                # Get score from white's perspective (consistent display)
+                evaluation = score.white().score()
+            except (ValueError, TypeError):
+                evaluation = None
+            
+            if evaluation is None:
+                # Handle mate scores
+                if score.is_mate():
+                    mate_moves = score.white().mate()
+                    if mate_moves is not None:
+                        mate_in = abs(mate_moves)
+                        # Use large values for mate, preserving sign
+                        evaluation = 30000 if mate_moves > 0 else -30000
+                    else:
+                        evaluation = 0  # Fallback for unclear mate
+                else:
+                    evaluation = 0  # Fallback for other score types
+        else:
+            evaluation = 0  # Never leave evaluation as None
+        
+        pv = list(info.get("pv", [])[:EVAL_PV_LINE_LENGTH])
+        return CachedEvaluation(evaluation, mate_in, pv, info.get("depth") or 0)
     
     def quit(self):
         """Clean up the engine resources."""
-        self.stop_evaluation_event.set()
-        if self.evaluation_thread and self.evaluation_thread.is_alive():
-            self.evaluation_thread.join()
-        if self.engine:
-            self.engine.quit() 
\ No newline at end of file
+        self.stop_evaluation()
+        self.cancel_ponder()
+        self.cancel_prefetch()
+        self.pool.shutdown()
+        if self.python_pool:
+            self.python_pool.shutdown()
+        self.telemetry.close()
+        self.book.close()
+        if self.store:
+            self.store.close()
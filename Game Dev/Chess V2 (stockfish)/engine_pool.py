@@ -0,0 +1,251 @@
+import heapq
+import itertools
+import threading
+import concurrent.futures
+import chess.engine
+from config import STOCKFISH_PATH, ENGINE_POOL_SIZE, ENGINE_PROFILES, ENGINE_BACKEND
+from python_engine import PythonEngine
+
+# Job priorities (lower values are scheduled first)
+# Pondering runs until it is cancelled, so it only takes an otherwise idle worker
+# and any other job preempts it
+PRIORITY_PLAY = 0
+PRIORITY_ANALYSIS = 20
+PRIORITY_PREFETCH = 30
+PRIORITY_PONDER = 40
+
+_job_counter = itertools.count()
+
+
+class EngineJob:
+    """A unit of work scheduled on the engine pool.
+    
+    The job function is called as ``fn(engine, job)`` on a worker thread.
+    Long-running jobs should return as soon as ``job.stop_event`` is set.
+    """
+    
+    def __init__(self, kind, fn, priority, options=None):
+        """Initialize a job of the given kind ("play" or "analysis")."""
+        self.kind = kind
+        self.fn = fn
+        self.priority = priority
+        self.options = options or {}
+        self.sequence = next(_job_counter)
+        self.future = concurrent.futures.Future()
+        self.stop_event = threading.Event()
+        self.cancelled = False
+        self.preempted = False
+        self.started = False
+        self._stop_hooks = []
+    
+    def __lt__(self, other):
+        return (self.priority, self.sequence) < (other.priority, other.sequence)
+    
+    @property
+    def preemptible(self):
+        """Background jobs can be interrupted to make room for urgent ones."""
+        return self.priority >= PRIORITY_ANALYSIS
+    
+    def add_stop_hook(self, hook):
+        """Register a function that interrupts the job's blocking engine calls."""
+        self._stop_hooks.append(hook)
+    
+    def stop(self):
+        """Ask a running job to return as soon as possible."""
+        self.stop_event.set()
+        for hook in list(self._stop_hooks):
+            hook()
+    
+    def cancel(self):
+        """Cancel the job, stopping it if it is already running."""
+        self.cancelled = True
+        self.future.cancel()
+        self.stop()
+    
+    def is_active(self):
+        """Check if the job is still queued or running."""
+        return not self.cancelled and not self.future.done()
+
+
+def open_engine(engine_path=STOCKFISH_PATH, backend=ENGINE_BACKEND):
+    """Start an engine for the given backend ("stockfish", "python" or "auto").
+    
+    "auto" starts Stockfish and falls back to the built-in Python engine if
+    the binary is missing or fails to start.
+    """
+    if backend == "python":
+        return PythonEngine()
+    
+    try:
+        return chess.engine.SimpleEngine.popen_uci(engine_path)
+    except (OSError, chess.engine.EngineError) as e:
+        if backend != "auto":
+            raise
+        print(f"Could not start {engine_path} ({str(e)}); using the built-in Python engine")
+        return PythonEngine()
+
+
+class EngineWorker(threading.Thread):
+    """A thread owning one engine (process or in-process) and running jobs from the pool."""
+    
+    def __init__(self, pool, index):
+        """Start an engine for this worker."""
+        super().__init__(name=f"engine-worker-{index}", daemon=True)
+        self.pool = pool
+        self.engine = open_engine(pool.engine_path, pool.backend)
+        self.options = {}
+        self.current_job = None
+    
+    def configure_for(self, job):
+        """Apply the profile for the job's type, sending only changed options."""
+        desired = dict(ENGINE_PROFILES.get(job.kind, {}))
+        desired.update(job.options)
+        changed = {name: value for name, value in desired.items() if self.options.get(name) != value}
+        if changed:
+            self.engine.configure(changed)
+            self.options.update(changed)
+    
+    def run(self):
+        """Run jobs until the pool shuts down."""
+        while True:
+            job = self.pool._next_job(self)
+            if job is None:
+                break
+            
+            try:
+                self.configure_for(job)
+                result = job.fn(self.engine, job)
+            except chess.engine.EngineTerminatedError as e:
+                print(f"Engine worker {self.name} terminated: {str(e)}")
+                self._restart_engine()
+                result = e
+            except Exception as e:
+                result = e
+            
+            self.pool._finish_job(self, job, result)
+        
+        try:
+            self.engine.quit()
+        except Exception:
+            pass
+    
+    def _restart_engine(self):
+        """Replace a crashed engine process."""
+        try:
+            self.engine = open_engine(self.pool.engine_path, self.pool.backend)
+            self.options = {}
+        except Exception as e:
+            print(f"Could not restart engine: {str(e)}")
+
+
+class EnginePool:
+    """A pool of engine processes behind a priority job scheduler.
+    
+    Urgent jobs (AI moves) always run before background jobs (analysis). If
+    every worker is busy with lower-priority background work when a job
+    arrives, the lowest-priority running job is preempted and put back in the
+    queue; a ponder search yields its worker to any other job this way.
+    """
+    
+    def __init__(self, size=ENGINE_POOL_SIZE, engine_path=STOCKFISH_PATH, backend=ENGINE_BACKEND):
+        """Start the worker threads and their engines."""
+        self.engine_path = engine_path
+        self.backend = backend
+        self._queue = []
+        self._condition = threading.Condition()
+        self._shutdown = False
+        self.workers = [EngineWorker(self, i) for i in range(max(1, size))]
+        for worker in self.workers:
+            worker.start()
+    
+    @property
+    def in_process(self):
+        """Check if the workers run the built-in Python engine rather than Stockfish."""
+        return all(isinstance(worker.engine, PythonEngine) for worker in self.workers)
+    
+    def submit(self, kind, fn, priority, options=None):
+        """Schedule a job and return it; its result is available through job.future."""
+        job = EngineJob(kind, fn, priority, options)
+        with self._condition:
+            if self._shutdown:
+                job.cancel()
+                return job
+            heapq.heappush(self._queue, job)
+            self._preempt_for(job)
+            self._condition.notify()
+        return job
+    
+    def _preempt_for(self, job):
+        """Interrupt a running background job if no worker is free for this one."""
+        if any(worker.current_job is None for worker in self.workers):
+            return
+        
+        running = [worker.current_job for worker in self.workers
+                   if worker.current_job.preemptible and not worker.current_job.stop_event.is_set()]
+        if not running:
+            return
+        
+        victim = max(running)
+        if job < victim:
+            victim.preempted = True
+            victim.stop()
+    
+    def _next_job(self, worker):
+        """Block until a job is available for the worker (None on shutdown)."""
+        with self._condition:
+            while True:
+                if self._shutdown:
+                    return None
+                while self._queue:
+                    job = heapq.heappop(self._queue)
+                    if job.cancelled:
+                        self._resolve_cancelled(job)
+                        continue
+                    if not job.started:
+                        if not job.future.set_running_or_notify_cancel():
+                            continue
+                        job.started = True
+                    worker.current_job = job
+                    return job
+                self._condition.wait()
+    
+    def _finish_job(self, worker, job, result):
+        """Resolve the job's future, or requeue it if it was preempted."""
+        with self._condition:
+            worker.current_job = None
+            
+            if job.preempted and not job.cancelled and not self._shutdown:
+                job.preempted = False
+                job.stop_event.clear()
+                heapq.heappush(self._queue, job)
+                self._condition.notify()
+                return
+        
+        if job.cancelled or self._shutdown:
+            self._resolve_cancelled(job)
+        elif isinstance(result, Exception):
+            job.future.set_exception(result)
+        else:
+            job.future.set_result(result)
+    
+    @staticmethod
+    def _resolve_cancelled(job):
+        """Make sure a cancelled job's future does not stay pending forever."""
+        if not job.future.done():
+            job.future.set_exception(concurrent.futures.CancelledError())
+    
+    def shutdown(self):
+        """Stop all jobs, then quit the worker engines."""
+        with self._condition:
+            self._shutdown = True
+            for job in self._queue:
+                job.cancel()
+                self._resolve_cancelled(job)
+            self._queue = []
+            for worker in self.workers:
+                if worker.current_job:
+                    worker.current_job.cancel()
+            self._condition.notify_all()
+        
+        for worker in self.workers:
+            worker.join()
@@ -0,0 +1,184 @@
+import json
+import os
+import threading
+import time
+from config import TELEMETRY_PATH, TELEMETRY_FLUSH_INTERVAL
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, float("inf")]
+
+
+class OperationStats:
+    """Counters for one type of engine operation (play, analysis, ponder, prefetch)."""
+    
+    def __init__(self):
+        """Initialize empty counters."""
+        self.count = 0
+        self.errors = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.depth_sum = 0
+        self.depth_max = 0
+        self.nodes_sum = 0
+        self.nps = 0
+        self.hashfull = 0
+    
+    def percentile(self, fraction):
+        """Estimate a latency percentile from the histogram (bucket upper bound)."""
+        if self.count == 0:
+            return 0.0
+        target = fraction * self.count
+        seen = 0
+        for bound, bucket_count in zip(LATENCY_BUCKETS, self.buckets):
+            seen += bucket_count
+            if seen >= target:
+                return min(bound, self.latency_max)
+        return self.latency_max
+    
+    def to_dict(self):
+        """Summarize the counters as plain data."""
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "latency_avg": self.latency_sum / self.count if self.count else 0.0,
+            "latency_p50": self.percentile(0.5),
+            "latency_p95": self.percentile(0.95),
+            "latency_max": self.latency_max,
+            "latency_buckets": dict(zip([str(bound) for bound in LATENCY_BUCKETS], self.buckets)),
+            "depth_avg": self.depth_sum / self.count if self.count else 0.0,
+            "depth_max": self.depth_max,
+            "nodes_total": self.nodes_sum,
+            "nps": self.nps,
+            "hashfull": self.hashfull
+        }
+
+
+class EngineTelemetry:
+    """Latency, depth, node and error statistics for every engine operation.
+    
+    Statistics are kept in memory for the in-app stats panel and flushed
+    periodically to TELEMETRY_PATH + ".json" and ".prom" (Prometheus text
+    format) by a background thread.
+    """
+    
+    def __init__(self, path=TELEMETRY_PATH, flush_interval=TELEMETRY_FLUSH_INTERVAL):
+        """Initialize the counters and start the flush thread."""
+        self.path = path
+        self.flush_interval = flush_interval
+        self.started = time.time()
+        self.operations = {}
+        self.version = 0  # Bumped on every change so the UI knows when to re-render
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._flush_thread = None
+        
+        if path and flush_interval:
+            self._flush_thread = threading.Thread(target=self._flush_worker, name="telemetry-flush", daemon=True)
+            self._flush_thread.start()
+    
+    def _stats(self, operation):
+        """Get (or create) the counters for an operation (lock held)."""
+        if operation not in self.operations:
+            self.operations[operation] = OperationStats()
+        return self.operations[operation]
+    
+    def record(self, operation, latency, info=None):
+        """Record a completed engine call and the last info dict it produced."""
+        info = info or {}
+        with self._lock:
+            stats = self._stats(operation)
+            stats.count += 1
+            stats.latency_sum += latency
+            stats.latency_max = max(stats.latency_max, latency)
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if latency <= bound:
+                    stats.buckets[i] += 1
+                    break
+            
+            depth = info.get("depth") or 0
+            stats.depth_sum += depth
+            stats.depth_max = max(stats.depth_max, depth)
+            stats.nodes_sum += info.get("nodes") or 0
+            if info.get("nps"):
+                stats.nps = info["nps"]
+            if info.get("hashfull") is not None:
+                stats.hashfull = info["hashfull"]
+            self.version += 1
+    
+    def record_error(self, operation):
+        """Count a failed engine call."""
+        with self._lock:
+            self._stats(operation).errors += 1
+            self.version += 1
+    
+    def snapshot(self):
+        """Get all statistics as plain data."""
+        with self._lock:
+            return {
+                "uptime": time.time() - self.started,
+                "operations": {name: stats.to_dict() for name, stats in self.operations.items()}
+            }
+    
+    def to_prometheus(self):
+        """Render the statistics in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        lines = [
+            "# TYPE chess_engine_latency_seconds histogram",
+        ]
+        for name, stats in snapshot["operations"].items():
+            cumulative = 0
+            for bound, bucket_count in stats["latency_buckets"].items():
+                cumulative += bucket_count
+                le = "+Inf" if bound == "inf" else bound
+                lines.append(f'chess_engine_latency_seconds_bucket{{op="{name}",le="{le}"}} {cumulative}')
+            lines.append(f'chess_engine_latency_seconds_sum{{op="{name}"}} {stats["latency_avg"] * stats["count"]}')
+            lines.append(f'chess_engine_latency_seconds_count{{op="{name}"}} {stats["count"]}')
+        
+        for metric, key, kind in [
+            ("chess_engine_errors_total", "errors", "counter"),
+            ("chess_engine_nodes_total", "nodes_total", "counter"),
+            ("chess_engine_depth_max", "depth_max", "gauge"),
+            ("chess_engine_depth_avg", "depth_avg", "gauge"),
+            ("chess_engine_nps", "nps", "gauge"),
+            ("chess_engine_hashfull_permill", "hashfull", "gauge")
+        ]:
+            lines.append(f"# TYPE {metric} {kind}")
+            for name, stats in snapshot["operations"].items():
+                lines.append(f'{metric}{{op="{name}"}} {stats[key]}')
+        
+        return "\n".join(lines) + "\n"
+    
+    def flush(self):
+        """Write the JSON and Prometheus files atomically."""
+        if not self.path:
+            return
+        try:
+            self._write_atomic(self.path + ".json", json.dumps(self.snapshot(), indent=2))
+            self._write_atomic(self.path + ".prom", self.to_prometheus())
+        except OSError as e:
+            print(f"Could not write engine statistics: {str(e)}")
+    
+    @staticmethod
+    def _write_atomic(path, text):
+        """Replace a file in one step so readers never see a partial write."""
+        temp_path = path + ".tmp"
+        with open(temp_path, "w") as f:
+            f.write(text)
+        os.replace(temp_path, path)
+    
+    def _flush_worker(self):
+        """Flush the statistics every flush_interval seconds."""
+        last_version = -1
+        while not self._stop_event.wait(self.flush_interval):
+            if self.version != last_version:
+                last_version = self.version
+                self.flush()
+    
+    def close(self):
+        """Stop the flush thread and write the final statistics."""
+        self._stop_event.set()
+        if self._flush_thread:
+            self._flush_thread.join()
+        if self.operations:
+            self.flush()
@@ -0,0 +1,170 @@
+import json
+import os
+import re
+import subprocess
+from config import (STOCKFISH_PATH, ENGINE_THREADS, ENGINE_HASH, ENGINE_POOL_SIZE, ENGINE_PROFILE_PATH,
+                    TUNING_MEMORY_FRACTION, TUNING_BENCH_DEPTH, TUNING_BENCH_TIMEOUT)
+
+# Modes that get their own Threads/Hash profile
+TUNED_MODES = ["easy", "medium", "hard", "analysis", "prefetch"]
+
+# Upper bound for a single Hash table; larger tables only slow down allocation
+MAX_HASH_MB = 32768
+
+
+def detect_cores():
+    """Get the number of CPU cores this process may run on."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def detect_free_memory_mb():
+    """Get the available physical memory in MB, or None if it cannot be determined."""
+    # Linux reports reclaimable memory as MemAvailable
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) // 1024
+    except OSError:
+        pass
+    
+    try:
+        pages = os.sysconf("SC_AVPHYS_PAGES")
+        page_size = os.sysconf("SC_PAGE_SIZE")
+        return pages * page_size // (1024 * 1024)
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def run_bench(engine_path=STOCKFISH_PATH, threads=1, hash_mb=16, depth=TUNING_BENCH_DEPTH):
+    """Run the engine's built-in bench and return its nodes per second, or None on failure."""
+    try:
+        result = subprocess.run(
+            [engine_path, "bench", str(hash_mb), str(threads), str(depth)],
+            stdin=subprocess.DEVNULL,  # Engines that ignore the arguments exit at end of input
+            capture_output=True,
+            text=True,
+            timeout=TUNING_BENCH_TIMEOUT
+        )
+    except (OSError, subprocess.SubprocessError) as e:
+        print(f"Could not run engine bench: {str(e)}")
+        return None
+    
+    # Stockfish prints the bench summary to stderr
+    match = re.search(r"Nodes/second\s*:\s*(\d+)", result.stderr + result.stdout)
+    return int(match.group(1)) if match else None
+
+
+def _power_of_two_at_most(value):
+    """Round a size in MB down to a power of two (at least 1)."""
+    size = 1
+    while size * 2 <= value:
+        size *= 2
+    return size
+
+
+def build_profiles(cores, free_memory_mb, thread_scaling=1.0, pool_size=ENGINE_POOL_SIZE):
+    """Work out per-mode engine options for the given hardware.
+    
+    Each of the pool_size workers runs its own engine, so the memory budget
+    and every core but one are split between them, and all workers
+    searching at once never oversubscribe the CPU. Modes share workers, and
+    Stockfish reallocates and clears its table when Hash or Threads change,
+    so every mode gets the same options: otherwise each switch between an
+    AI move and analysis would clear the table on the AI move's critical
+    path. The difficulties differ by skill level and search limits instead.
+    thread_scaling is the measured multi-threaded speedup per thread; poor
+    scaling (shared or throttled cores) halves the thread counts.
+    """
+    pool_size = max(1, pool_size)
+    if free_memory_mb:
+        budget = free_memory_mb * TUNING_MEMORY_FRACTION / pool_size
+        hash_mb = min(MAX_HASH_MB, max(ENGINE_HASH, _power_of_two_at_most(budget)))
+    else:
+        hash_mb = ENGINE_HASH
+    
+    max_threads = max(1, cores - 1)  # Leave a core for the game window
+    if thread_scaling < 0.5:
+        max_threads = max(1, max_threads // 2)
+    worker_threads = max(ENGINE_THREADS, max_threads // pool_size)
+    
+    return {mode: {"Threads": worker_threads, "Hash": hash_mb} for mode in TUNED_MODES}
+
+
+def tune(engine_path=STOCKFISH_PATH, bench=True, pool_size=ENGINE_POOL_SIZE):
+    """Detect the hardware, optionally calibrate with bench, and return the tuning result."""
+    cores = detect_cores()
+    free_memory_mb = detect_free_memory_mb()
+    single_nps = None
+    multi_nps = None
+    thread_scaling = 1.0
+    
+    if bench:
+        single_nps = run_bench(engine_path, threads=1)
+        threads = max(1, cores - 1)
+        if single_nps and threads > 1:
+            multi_nps = run_bench(engine_path, threads=threads)
+            if multi_nps:
+                thread_scaling = multi_nps / (single_nps * threads)
+    
+    return {
+        "hardware": {"cores": cores, "free_memory_mb": free_memory_mb, "engine": engine_path,
+                     "pool_size": pool_size},
+        "bench": {"single_thread_nps": single_nps, "multi_thread_nps": multi_nps,
+                  "thread_scaling": round(thread_scaling, 3)},
+        "profiles": build_profiles(cores, free_memory_mb, thread_scaling, pool_size)
+    }
+
+
+def save_profiles(result, path=ENGINE_PROFILE_PATH):
+    """Persist a tuning result as JSON."""
+    temp_path = path + ".tmp"
+    with open(temp_path, "w") as f:
+        json.dump(result, f, indent=2)
+    os.replace(temp_path, path)
+
+
+def load_profiles(path=ENGINE_PROFILE_PATH, engine_path=STOCKFISH_PATH, pool_size=ENGINE_POOL_SIZE):
+    """Get the per-mode engine profiles for a pool of pool_size engines on this machine.
+    
+    While the core count and engine are unchanged, the profiles are built
+    from the saved calibration (so they follow the pool size and the current
+    rules, not the ones the file was written with). Otherwise they are
+    derived from the detected hardware without a bench run; run this module
+    directly to calibrate and save them.
+    """
+    try:
+        with open(path) as f:
+            saved = json.load(f)
+        hardware = saved["hardware"]
+        if hardware["cores"] == detect_cores() and hardware["engine"] == engine_path:
+            return build_profiles(hardware["cores"], hardware["free_memory_mb"],
+                                  saved["bench"]["thread_scaling"], pool_size)
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Ignoring engine profiles in {path}: {str(e)}")
+    
+    return tune(engine_path, bench=False, pool_size=pool_size)["profiles"]
+
+
+if __name__ == "__main__":
+    from provision_engine import resolve_engine_path
+    result = tune(resolve_engine_path())
+    save_profiles(result)
+    
+    hardware = result["hardware"]
+    print(f"Cores: {hardware['cores']}, free memory: {hardware['free_memory_mb']} MB")
+    if result["bench"]["single_thread_nps"]:
+        print(f"Bench: {result['bench']['single_thread_nps']} nps (1 thread), "
+              f"{result['bench']['multi_thread_nps']} nps (all threads), "
+              f"scaling {result['bench']['thread_scaling']}")
+    else:
+        print("Bench unavailable; profiles are based on the detected hardware only")
+    for mode in TUNED_MODES:
+        profile = result["profiles"][mode]
+        print(f"{mode:>8}: Threads {profile['Threads']}, Hash {profile['Hash']} MB")
+    print(f"Saved to {ENGINE_PROFILE_PATH}")
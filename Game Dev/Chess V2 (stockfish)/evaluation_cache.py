@@ -0,0 +1,75 @@
+import threading
+from collections import OrderedDict, namedtuple
+import chess.polyglot
+from config import EVAL_CACHE_SIZE
+
+# A stored engine result. evaluation is in centipawns from white's point of view
+# (+/-30000 for mates), pv is a list of chess.Move starting with the best move.
+CachedEvaluation = namedtuple("CachedEvaluation", ["evaluation", "mate_in", "pv", "depth"])
+
+
+class EvaluationCache:
+    """In-memory LRU cache of engine evaluations keyed by Zobrist hash.
+    
+    When a position is stored twice, the deeper result is kept, so revisiting
+    a position never replaces a long search with a shallow one.
+    """
+    
+    def __init__(self, max_size=EVAL_CACHE_SIZE):
+        """Initialize an empty cache holding at most max_size positions."""
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def key(board):
+        """Get the cache key for a board position."""
+        return chess.polyglot.zobrist_hash(board)
+    
+    def get(self, board, key=None):
+        """Get the cached evaluation for a position, or None."""
+        key = self.key(board) if key is None else key
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+    
+    def store(self, board, entry, key=None):
+        """Store an evaluation and return the entry that is kept for the position."""
+        key = self.key(board) if key is None else key
+        with self._lock:
+            existing = self._entries.get(key)
+            if existing is not None and (existing.depth or 0) > (entry.depth or 0):
+                entry = existing
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            
+            # Evict the least recently used positions
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            return entry
+    
+    def update(self, items):
+        """Store many (key, entry) pairs at once, e.g. a restored snapshot (deeper entries win)."""
+        with self._lock:
+            for key, entry in items:
+                existing = self._entries.get(key)
+                if existing is None or (existing.depth or 0) <= (entry.depth or 0):
+                    self._entries[key] = entry
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+    
+    def items(self):
+        """Get a snapshot of the (key, entry) pairs, least recently used first."""
+        with self._lock:
+            return list(self._entries.items())
+    
+    def clear(self):
+        """Remove all cached evaluations."""
+        with self._lock:
+            self._entries.clear()
+    
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,105 @@
+import sqlite3
+import threading
+import time
+import chess
+from config import EVAL_STORE_PATH, EVAL_STORE_MAX_ENTRIES
+from evaluation_cache import CachedEvaluation
+
+# Compact the store after this many writes
+COMPACT_INTERVAL = 1000
+
+
+class EvaluationStore:
+    """Engine evaluations persisted in a local SQLite file shared across sessions.
+    
+    The database runs in WAL mode, so several game windows can read it while
+    one of them writes. Keys are the Zobrist hashes used by EvaluationCache,
+    and a row is only replaced by a search that is at least as deep.
+    """
+    
+    def __init__(self, path=EVAL_STORE_PATH, max_entries=EVAL_STORE_MAX_ENTRIES):
+        """Open (or create) the store at the given path."""
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._writes = 0
+        
+        self.conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS evaluations ("
+            " key INTEGER PRIMARY KEY,"
+            " evaluation INTEGER NOT NULL,"
+            " mate_in INTEGER,"
+            " pv TEXT NOT NULL,"
+            " depth INTEGER NOT NULL,"
+            " updated REAL NOT NULL)"
+        )
+        self.compact()
+    
+    @staticmethod
+    def _to_sql_key(key):
+        """Map an unsigned 64-bit Zobrist hash onto SQLite's signed integers."""
+        return key - (1 << 64) if key >= (1 << 63) else key
+    
+    def get(self, key):
+        """Get the stored evaluation for a Zobrist key, or None."""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT evaluation, mate_in, pv, depth FROM evaluations WHERE key = ?",
+                (self._to_sql_key(key),)
+            ).fetchone()
+        
+        if row is None:
+            return None
+        
+        evaluation, mate_in, pv, depth = row
+        moves = [chess.Move.from_uci(uci) for uci in pv.split()]
+        return CachedEvaluation(evaluation, mate_in, moves, depth)
+    
+    def put(self, key, entry):
+        """Write an evaluation back unless a deeper one is already stored."""
+        with self._lock:
+            self.conn.execute(
+                "INSERT INTO evaluations (key, evaluation, mate_in, pv, depth, updated)"
+                " VALUES (?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT(key) DO UPDATE SET"
+                " evaluation = excluded.evaluation, mate_in = excluded.mate_in,"
+                " pv = excluded.pv, depth = excluded.depth, updated = excluded.updated"
+                " WHERE excluded.depth >= evaluations.depth",
+                (self._to_sql_key(key), entry.evaluation, entry.mate_in,
+                 " ".join(move.uci() for move in entry.pv), entry.depth, time.time())
+            )
+            self._writes += 1
+            due = self._writes % COMPACT_INTERVAL == 0
+        
+        if due:
+            self.compact()
+    
+    def compact(self):
+        """Trim the store to its size cap, dropping the shallowest and oldest rows first."""
+        with self._lock:
+            try:
+                count = self.conn.execute("SELECT COUNT(*) FROM evaluations").fetchone()[0]
+                if count <= self.max_entries:
+                    return
+                
+                # Leave some headroom so we don't compact again on the next write
+                excess = count - int(self.max_entries * 0.9)
+                self.conn.execute(
+                    "DELETE FROM evaluations WHERE key IN"
+                    " (SELECT key FROM evaluations ORDER BY depth ASC, updated ASC LIMIT ?)",
+                    (excess,)
+                )
+                self.conn.execute("PRAGMA incremental_vacuum")
+                self.conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+            except sqlite3.OperationalError as e:
+                # Another process may hold the write lock; try again later
+                print(f"Could not compact evaluation store: {str(e)}")
+    
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self.conn.close()
@@ -0,0 +1,111 @@
+import chess
+import chess.polyglot
+from config import REPETITION_DRAW_COUNT, MOVE_RULE_DRAW_PLIES
+
+# Same keys as chess.polyglot.zobrist_hash, so tracker keys match the evaluation cache
+HASHER = chess.polyglot.ZobristHasher(chess.polyglot.POLYGLOT_RANDOM_ARRAY)
+
+
+def _piece_key(piece, square):
+    """Get the Zobrist key of a piece standing on a square."""
+    # Polyglot orders pieces black pawn, white pawn, black knight, ...
+    return HASHER.array[64 * ((piece.piece_type - 1) * 2 + int(piece.color)) + square]
+
+
+# Castling rights are read straight from the rook squares in board.castling_rights, which
+# is much cheaper than the has_*_castling_rights checks and the same in standard chess
+CASTLING_KEYS = [(chess.BB_H1, HASHER.array[768]), (chess.BB_A1, HASHER.array[769]),
+                 (chess.BB_H8, HASHER.array[770]), (chess.BB_A8, HASHER.array[771])]
+
+
+def _state_key(board):
+    """Get the Zobrist key of the castling rights, en passant file and side to move."""
+    key = HASHER.array[780] if board.turn == chess.WHITE else 0
+    rights = board.castling_rights
+    if rights:
+        for mask, castling_key in CASTLING_KEYS:
+            if rights & mask:
+                key ^= castling_key
+    if board.ep_square is not None:
+        key ^= HASHER.hash_ep_square(board)
+    return key
+
+
+class GameEndTracker:
+    """Keeps what is needed to decide the end of a game up to date move by move.
+    
+    The Zobrist key is updated from the squares a move changes instead of
+    being recomputed, and a table counts how often each key occurred on
+    the current line, so repetitions are found without rescanning the move
+    stack. The move rule uses the board's halfmove clock, and checkmate and
+    stalemate are a single look at the position's legal move count.
+    """
+    
+    def __init__(self, board=None):
+        """Start tracking from a position (the standard starting position by default)."""
+        self.reset(board if board is not None else chess.Board())
+    
+    def reset(self, board):
+        """Start over from a board, replaying its move stack to fill the repetition table."""
+        replay = board.root()
+        self.key = chess.polyglot.zobrist_hash(replay)
+        self.keys = [self.key]
+        self.counts = {self.key: 1}
+        for move in board.move_stack:
+            self.push(replay, move)
+    
+    def push(self, board, move):
+        """Play a move on the board and record the position it leads to."""
+        # Squares whose contents the move can change
+        squares = [move.from_square, move.to_square]
+        if board.is_castling(move):
+            back_rank = chess.square_rank(move.from_square) * 8
+            squares = range(back_rank, back_rank + 8)
+        elif board.is_en_passant(move):
+            squares.append(chess.square(chess.square_file(move.to_square), chess.square_rank(move.from_square)))
+        
+        key = self.key ^ _state_key(board)
+        before = [board.piece_at(square) for square in squares]
+        board.push(move)
+        for square, piece in zip(squares, before):
+            after = board.piece_at(square)
+            if piece != after:
+                if piece:
+                    key ^= _piece_key(piece, square)
+                if after:
+                    key ^= _piece_key(after, square)
+        key ^= _state_key(board)
+        
+        self.key = key
+        self.keys.append(key)
+        self.counts[key] = self.counts.get(key, 0) + 1
+    
+    def pop(self, board):
+        """Take back the last move on the board and forget its position."""
+        board.pop()
+        self.counts[self.key] -= 1
+        self.keys.pop()
+        self.key = self.keys[-1]
+    
+    def repetitions(self):
+        """Get how many times the current position has occurred (at least 1)."""
+        return self.counts[self.key]
+    
+    def result(self, board, legal_move_count):
+        """Get the result if the game is over at the current position, or None.
+        
+        legal_move_count is the number of legal moves of board (e.g. the
+        length of its move index), so no moves are generated here.
+        """
+        if legal_move_count == 0:
+            if board.is_check():
+                winner = "Black" if board.turn == chess.WHITE else "White"
+                return f"{winner} wins by checkmate"
+            return "Game drawn by stalemate"
+        if board.is_insufficient_material():
+            return "Game drawn due to insufficient material"
+        if board.halfmove_clock >= MOVE_RULE_DRAW_PLIES:
+            return "Game drawn by fifty-move rule"
+        if self.repetitions() >= REPETITION_DRAW_COUNT:
+            return "Game drawn by repetition"
+        return None
@@ -0,0 +1,343 @@
+import argparse
+import asyncio
+import itertools
+import json
+import time
+import chess
+from config import (SERVER_HOST, SERVER_PORT, SERVER_ENGINE_POOL_SIZE, SERVER_MAX_SESSIONS,
+                    SERVER_MAX_ENGINE_REQUESTS, SERVER_MAX_WAITING_REQUESTS, SERVER_MAX_INFLIGHT,
+                    SERVER_ANALYSIS_DEPTH, SERVER_MAX_ANALYSIS_DEPTH, DIFFICULTY_SETTINGS, TIME_CONTROLS,
+                    DEFAULT_TIME_CONTROL)
+from engine_manager import EngineManager
+from engine_telemetry import EngineTelemetry
+from game_state import GameState
+
+# Protocol: one JSON object per line in each direction. Every request has an "op" and may
+# carry an "id", which is echoed in its response so a client can pipeline requests.
+#   {"op": "new", "difficulty": "medium" | null, "color": "white" | "black", "time_control": index}
+#   {"op": "move", "session": id, "move": "e2e4"}  (without "move", the AI plays if it is its turn)
+#   {"op": "analyse", "session": id, "depth": 12}
+#   {"op": "state" | "resign" | "close", "session": id}
+#   {"op": "stats"}
+# Responses have "ok": true and the results, or "ok": false and an "error".
+
+# Latency figures reported per session and operation
+LATENCY_FIELDS = ["count", "errors", "latency_avg", "latency_p50", "latency_p95", "latency_max"]
+
+# Operations on an existing game; their session is resolved before the handler runs
+SESSION_OPERATIONS = {"move", "analyse", "state", "resign", "close"}
+
+
+class RequestError(Exception):
+    """A request that cannot be served; the message is sent back to the client."""
+
+
+class ServerSession:
+    """One hosted game: its GameState, a lock serializing its requests, and its latencies."""
+    
+    def __init__(self, session_id, owner, difficulty, player_color, time_control):
+        """Start a game; difficulty None is a game between two clients' moves."""
+        self.id = session_id
+        self.owner = owner
+        self.game_state = GameState()
+        self.game_state.player_color = player_color
+        self.game_state.time_control = time_control
+        self.game_state.start_game("singleplayer" if difficulty else "multiplayer", difficulty)
+        self.lock = asyncio.Lock()
+        self.latency = EngineTelemetry(path=None)  # Per-operation request latencies (no files)
+    
+    def ai_to_move(self):
+        """Check if the engine plays the next move."""
+        game_state = self.game_state
+        return (game_state.game_state == "playing" and game_state.difficulty is not None
+                and game_state.board.turn != game_state.player_color)
+    
+    def describe(self):
+        """Get the position and the game status as plain data."""
+        game_state = self.game_state
+        return {
+            "session": self.id,
+            "fen": game_state.board.fen(),
+            "state": game_state.game_state,
+            "result": game_state.result,
+            "clocks": [game_state.get_clock(chess.WHITE), game_state.get_clock(chess.BLACK)]
+            if game_state.time_control else None
+        }
+    
+    def latency_report(self):
+        """Summarize the request latencies of each operation."""
+        operations = self.latency.snapshot()["operations"]
+        return {operation: {field: stats[field] for field in LATENCY_FIELDS}
+                for operation, stats in operations.items()}
+
+
+class GameServer:
+    """Hosts many concurrent games and multiplexes their engine searches onto one pool.
+    
+    Backpressure works at three levels: at most max_engine_requests searches
+    are handed to the engine pool at once (the rest wait here, in arrival
+    order), searches beyond max_waiting are refused as busy, and a connection
+    with SERVER_MAX_INFLIGHT unanswered requests is not read from until one
+    completes, so TCP flow control slows the client down.
+    """
+    
+    def __init__(self, manager, max_sessions=SERVER_MAX_SESSIONS, max_engine_requests=SERVER_MAX_ENGINE_REQUESTS,
+                 max_waiting=SERVER_MAX_WAITING_REQUESTS):
+        """Serve games with the engines, cache and book of an EngineManager."""
+        self.manager = manager
+        self.max_sessions = max_sessions
+        self.max_waiting = max_waiting
+        self.sessions = {}
+        self.waiting = 0  # Searches waiting for an engine slot
+        self.running = 0  # Searches handed to the engine pool
+        self._engine_slots = asyncio.Semaphore(max_engine_requests)
+        self._session_ids = itertools.count(1)
+        self._handlers = {
+            "new": self._op_new,
+            "move": self._op_move,
+            "analyse": self._op_analyse,
+            "state": self._op_state,
+            "resign": self._op_resign,
+            "close": self._op_close,
+            "stats": self._op_stats
+        }
+    
+    async def handle_connection(self, reader, writer):
+        """Serve the requests of one client until it disconnects."""
+        inflight = asyncio.Semaphore(SERVER_MAX_INFLIGHT)
+        write_lock = asyncio.Lock()
+        tasks = set()
+        try:
+            while True:
+                await inflight.acquire()
+                line = await reader.readline()
+                if not line:
+                    break
+                task = asyncio.create_task(self._respond(line, writer, write_lock, inflight))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (ConnectionError, ValueError) as e:
+            print(f"Error reading from client: {str(e)}")
+        finally:
+            # Pending searches of a client that left are cancelled in the engine pool too
+            for task in tasks:
+                task.cancel()
+            for session in [session for session in self.sessions.values() if session.owner is writer]:
+                self._close_session(session)
+            writer.close()
+    
+    async def _respond(self, line, writer, write_lock, inflight):
+        """Run one request and write its response."""
+        start = time.monotonic()
+        request = None
+        request_id = None
+        operation = None
+        session = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise RequestError("a request must be a JSON object")
+            request_id = request.get("id")
+            operation = request.get("op")
+            handler = self._handlers.get(operation)
+            if handler is None:
+                raise RequestError(f"unknown op {operation!r}")
+            if operation in SESSION_OPERATIONS:
+                session = self._session(request, writer)
+            # A failed request keeps the session resolved above, so its error is recorded there
+            session, response = await handler(request, writer, session)
+            response["ok"] = True
+        except (RequestError, ValueError) as e:
+            response = {"ok": False, "error": str(e)}
+        except Exception as e:
+            print(f"Error serving {operation}: {str(e)}")
+            response = {"ok": False, "error": "internal error"}
+        finally:
+            inflight.release()
+        
+        latency = time.monotonic() - start
+        if session is not None:
+            session.latency.record(operation, latency)
+            if not response["ok"]:
+                session.latency.record_error(operation)
+        response["id"] = request_id
+        response["latency_ms"] = round(latency * 1000, 2)
+        
+        try:
+            async with write_lock:
+                writer.write(json.dumps(response).encode("utf-8") + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass  # The client is gone; handle_connection cleans up
+    
+    async def _engine(self, request):
+        """Run an engine request (a function returning a concurrent future) within the pool limits."""
+        if self.waiting >= self.max_waiting:
+            raise RequestError("server busy, retry later")
+        self.waiting += 1
+        try:
+            await self._engine_slots.acquire()
+        finally:
+            self.waiting -= 1
+        
+        self.running += 1
+        try:
+            future = request()
+            try:
+                return await asyncio.wrap_future(future)
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+        finally:
+            self.running -= 1
+            self._engine_slots.release()
+    
+    def _session(self, request, writer):
+        """Get the session a request refers to (only the connection that started it may use it)."""
+        session_id = request.get("session")
+        if not isinstance(session_id, int) or isinstance(session_id, bool):
+            raise RequestError(f"session must be a session id, not {session_id!r}")
+        session = self.sessions.get(session_id)
+        if session is None or session.owner is not writer:
+            raise RequestError(f"unknown session {session_id!r}")
+        return session
+    
+    def _close_session(self, session):
+        """Forget a session and log its latencies."""
+        if self.sessions.pop(session.id, None) is None:
+            return
+        summary = ", ".join(f"{operation} p95 {stats['latency_p95'] * 1000:.0f} ms ({stats['count']})"
+                            for operation, stats in session.latency_report().items())
+        print(f"Session {session.id} closed: {summary or 'no requests'}")
+    
+    async def _play_ai(self, session):
+        """Play the engine's move if it is its turn. Returns the move in UCI, or None."""
+        if not session.ai_to_move():
+            return None
+        game_state = session.game_state
+        board = game_state.board
+        move = await self._engine(lambda: self.manager.request_best_move(
+            board, game_state.difficulty, game_state.get_engine_clocks(), ponder=False))
+        
+        # The clock may have run out while the engine was thinking
+        if game_state.check_flag():
+            return None
+        if move is None or move not in game_state.move_index:
+            raise RequestError("the engine did not return a move; send the move op again")
+        game_state.make_move(move)
+        return move.uci()
+    
+    async def _op_new(self, request, writer, session):
+        """Start a game, with the AI's first move if it plays white."""
+        if len(self.sessions) >= self.max_sessions:
+            raise RequestError("too many sessions")
+        difficulty = request.get("difficulty")
+        if difficulty is not None and difficulty not in DIFFICULTY_SETTINGS:
+            raise RequestError(f"unknown difficulty {difficulty!r}")
+        color = request.get("color", "white")
+        if color not in ("white", "black"):
+            raise RequestError(f"unknown color {color!r}")
+        time_control = request.get("time_control", DEFAULT_TIME_CONTROL)
+        if not isinstance(time_control, int) or not 0 <= time_control < len(TIME_CONTROLS):
+            raise RequestError(f"time_control must be an index from 0 to {len(TIME_CONTROLS) - 1}")
+        
+        session = ServerSession(next(self._session_ids), writer, difficulty, color == "white",
+                                TIME_CONTROLS[time_control])
+        self.sessions[session.id] = session
+        async with session.lock:
+            ai_move = await self._play_ai(session)
+            return session, dict(session.describe(), ai_move=ai_move)
+    
+    async def _op_move(self, request, writer, session):
+        """Play the client's move, then the AI's reply."""
+        async with session.lock:
+            game_state = session.game_state
+            if "move" in request and not game_state.check_flag():
+                if game_state.game_state != "playing":
+                    raise RequestError("the game is over")
+                if session.ai_to_move():
+                    raise RequestError("it is the AI's turn")
+                try:
+                    move = chess.Move.from_uci(str(request["move"]))
+                except ValueError:
+                    raise RequestError(f"invalid move {request['move']!r}")
+                if move not in game_state.move_index:
+                    raise RequestError(f"illegal move {move.uci()}")
+                game_state.make_move(move)
+            
+            ai_move = await self._play_ai(session)
+            return session, dict(session.describe(), ai_move=ai_move)
+    
+    async def _op_analyse(self, request, writer, session):
+        """Search the current position to a fixed depth."""
+        try:
+            depth = min(max(int(request.get("depth", SERVER_ANALYSIS_DEPTH)), 1), SERVER_MAX_ANALYSIS_DEPTH)
+        except (TypeError, ValueError):
+            raise RequestError("depth must be a number")
+        
+        async with session.lock:
+            board = session.game_state.board
+            if board.is_game_over():
+                raise RequestError("the position is already decided")
+            entry = await self._engine(lambda: self.manager.request_analysis(board, depth))
+            return session, {
+                "session": session.id,
+                "fen": board.fen(),
+                "evaluation": entry.evaluation,
+                "mate_in": entry.mate_in,
+                "depth": entry.depth,
+                "pv": [move.uci() for move in entry.pv]
+            }
+    
+    async def _op_state(self, request, writer, session):
+        """Get the position, the moves so far and the game status."""
+        moves = [node.move.uci() for node in session.game_state.tree.line()[1:]]
+        return session, dict(session.describe(), moves=moves, difficulty=session.game_state.difficulty)
+    
+    async def _op_resign(self, request, writer, session):
+        """Resign the game for the side to move."""
+        async with session.lock:
+            if session.game_state.game_state == "playing":
+                session.game_state.resign()
+            return session, session.describe()
+    
+    async def _op_close(self, request, writer, session):
+        """End a session."""
+        self._close_session(session)
+        return None, {"session": session.id}
+    
+    async def _op_stats(self, request, writer, session):
+        """Report engine load and the latencies of every session."""
+        return None, {
+            "engines": len(self.manager.pool.workers),
+            "running": self.running,
+            "waiting": self.waiting,
+            "sessions": {session.id: session.latency_report() for session in self.sessions.values()}
+        }
+
+
+async def serve(manager, host=SERVER_HOST, port=SERVER_PORT, max_sessions=SERVER_MAX_SESSIONS):
+    """Accept clients until cancelled."""
+    server = GameServer(manager, max_sessions=max_sessions)
+    listener = await asyncio.start_server(server.handle_connection, host, port)
+    print(f"Serving games on {host}:{port} with {len(manager.pool.workers)} engines")
+    async with listener:
+        await listener.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Host many chess games without a window")
+    parser.add_argument("--host", default=SERVER_HOST, help="address to listen on (localhost by default)")
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--engines", type=int, default=SERVER_ENGINE_POOL_SIZE, help="engine processes to share")
+    parser.add_argument("--max-sessions", type=int, default=SERVER_MAX_SESSIONS)
+    args = parser.parse_args()
+    
+    # Every difficulty plays on the shared engine processes, not in the server's own process
+    engine_manager = EngineManager(pool_size=args.engines, in_process_play=False)
+    try:
+        asyncio.run(serve(engine_manager, args.host, args.port, args.max_sessions))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        engine_manager.quit()
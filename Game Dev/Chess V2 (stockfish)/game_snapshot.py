@@ -0,0 +1,226 @@
+import math
+import os
+import struct
+import zlib
+import chess
+from config import TIME_CONTROLS
+from evaluation_cache import CachedEvaluation
+
+# File layout: fixed header (with a CRC32 of the body), then the body: start FEN and result
+# text (length-prefixed UTF-8), the game tree as 16-bit tokens, and the cached evaluations.
+MAGIC = b"CGS1"
+HEADER_FORMAT = "<4sIBBBBBBddIIIH"  # Magic, body CRC, state, player color, difficulty, time control,
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)  # clock turn, flags, white/black clock, game count, cursor ply
+# Evaluations are stored column by column (keys, scores, mate distances, depths, PV lengths,
+# then every PV move), so each column is packed and unpacked in one call
+EVALUATION_COLUMNS = "QihBB"
+
+# States that are resumed; menus in between games come back as the main menu
+STATES = ["menu", "playing", "game_over", "analysis"]
+DIFFICULTIES = [None, "easy", "medium", "hard"]
+NO_TIME_CONTROL = 255
+FLAG_EVALUATION_MODE = 1
+FLAG_SHOW_BEST_MOVE = 2
+NO_MATE = -32768
+NO_DEPTH = 255
+
+# Moves are from-square (6 bits), to-square (6 bits) and promotion piece type - 1 (3 bits).
+# The top bit marks the continuation "forward" follows; 0 (a1a1) ends the current variation.
+END_OF_VARIATION = 0
+SELECTED = 0x8000
+MOVE_MASK = 0x7FFF
+
+
+def encode_move(move):
+    """Pack a move into 15 bits."""
+    promotion = move.promotion - 1 if move.promotion else 0
+    return move.from_square | (move.to_square << 6) | (promotion << 12)
+
+
+def decode_move(code):
+    """Unpack a move packed by encode_move."""
+    move = _decoded_moves.get(code)
+    if move is None:
+        promotion = (code >> 12) & 7
+        move = _decoded_moves[code] = chess.Move(code & 63, (code >> 6) & 63, promotion + 1 if promotion else None)
+    return move
+
+
+# Decoded moves are shared, since the same few thousand moves make up every PV
+_decoded_moves = {}
+
+
+def _pack_text(text):
+    """Encode a string with a 16-bit length prefix."""
+    data = text.encode("utf-8")
+    return struct.pack("<H", len(data)) + data
+
+
+def _unpack_text(body, offset):
+    """Decode a length-prefixed string; returns (text, next offset)."""
+    (length,) = struct.unpack_from("<H", body, offset)
+    offset += 2
+    return body[offset:offset + length].decode("utf-8"), offset + length
+
+
+def _encode_tree(tree):
+    """Write the tree depth-first, main continuations first."""
+    tokens = []
+    pending = [(tree.root, iter(tree.root.children))]
+    while pending:
+        parent, children = pending[-1]
+        child = next(children, None)
+        if child is None:
+            pending.pop()
+            tokens.append(END_OF_VARIATION)
+            continue
+        tokens.append(encode_move(child.move) | (SELECTED if parent.selected is child else 0))
+        pending.append((child, iter(child.children)))
+    return tokens
+
+
+def _decode_tree(tree, tokens):
+    """Rebuild the nodes of a tree from its tokens; no board is touched."""
+    pending = [tree.root]
+    for token in tokens:
+        if token == END_OF_VARIATION:
+            pending.pop()
+            continue
+        parent = pending[-1]
+        child = tree.add_variation(parent, decode_move(token & MOVE_MASK))
+        if token & SELECTED:
+            parent.selected = child
+        pending.append(child)
+
+
+def save_session(path, game_state, cache=None):
+    """Write the game, the session statistics and the cached evaluations to path.
+    
+    The snapshot is written to a temporary file and moved into place, so an
+    interrupted save leaves the previous snapshot intact.
+    """
+    tree = game_state.tree
+    tokens = _encode_tree(tree)
+    parts = [_pack_text(tree.start.fen()), _pack_text(game_state.result or ""),
+             struct.pack(f"<I{len(tokens)}H", len(tokens), *tokens)]
+    
+    entries = cache.items() if cache is not None else []
+    pvs = [entry.pv[:255] for _, entry in entries]
+    columns = [
+        [key for key, _ in entries],
+        [entry.evaluation for _, entry in entries],
+        [NO_MATE if entry.mate_in is None else entry.mate_in for _, entry in entries],
+        [NO_DEPTH if entry.depth is None else min(entry.depth, NO_DEPTH - 1) for _, entry in entries],
+        [len(pv) for pv in pvs]
+    ]
+    parts.append(struct.pack("<I", len(entries)))
+    for code, column in zip(EVALUATION_COLUMNS, columns):
+        parts.append(struct.pack(f"<{len(column)}{code}", *column))
+    moves = [encode_move(move) for pv in pvs for move in pv]
+    parts.append(struct.pack(f"<I{len(moves)}H", len(moves), *moves))
+    body = b"".join(parts)
+    
+    state = game_state.game_state if game_state.game_state in STATES else "menu"
+    time_control = TIME_CONTROLS.index(game_state.time_control) if game_state.time_control in TIME_CONTROLS \
+        else NO_TIME_CONTROL
+    clocks = [game_state.get_clock(color) for color in (chess.WHITE, chess.BLACK)]
+    flags = (FLAG_EVALUATION_MODE if game_state.evaluation_mode else 0) | \
+        (FLAG_SHOW_BEST_MOVE if game_state.show_best_move else 0)
+    counts = game_state.game_count
+    header = struct.pack(
+        HEADER_FORMAT, MAGIC, zlib.crc32(body), STATES.index(state), int(game_state.player_color),
+        DIFFICULTIES.index(game_state.difficulty), time_control, int(game_state.clock_turn), flags,
+        math.nan if clocks[0] is None else clocks[0], math.nan if clocks[1] is None else clocks[1],
+        counts["player"], counts["stockfish"], counts["draw"], game_state.current_move_index
+    )
+    
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(header)
+        f.write(body)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+def _read_evaluations(body, offset):
+    """Decode the cached evaluations at offset into (key, entry) pairs."""
+    (count,) = struct.unpack_from("<I", body, offset)
+    offset += 4
+    columns = []
+    for code in EVALUATION_COLUMNS:
+        columns.append(struct.unpack_from(f"<{count}{code}", body, offset))
+        offset += count * struct.calcsize(code)
+    (move_count,) = struct.unpack_from("<I", body, offset)
+    moves = [decode_move(code) for code in struct.unpack_from(f"<{move_count}H", body, offset + 4)]
+    
+    entries = []
+    start = 0
+    for key, evaluation, mate_in, depth, pv_length in zip(*columns):
+        entries.append((key, CachedEvaluation(evaluation, None if mate_in == NO_MATE else mate_in,
+                                              moves[start:start + pv_length], None if depth == NO_DEPTH else depth)))
+        start += pv_length
+    return entries
+
+
+def load_session(path, game_state, cache=None):
+    """Restore a snapshot written by save_session into a GameState (and cache).
+    
+    Only the tree nodes are rebuilt up front; the one board that is needed,
+    the cursor position, is replayed from the start, and every other
+    position is built when it is visited. Returns the saved game state name.
+    Raises ValueError if the file is not a valid snapshot.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    try:
+        return _restore(data, game_state, cache)
+    except (struct.error, IndexError, UnicodeDecodeError, ValueError) as e:
+        raise ValueError(f"{path} is not a valid session snapshot ({str(e)})")
+
+
+def _restore(data, game_state, cache):
+    """Restore a snapshot from its bytes (see load_session)."""
+    (magic, crc, state, player_color, difficulty, time_control, clock_turn, flags,
+     white_clock, black_clock, player_wins, engine_wins, draws, cursor_ply) = \
+        struct.unpack_from(HEADER_FORMAT, data)
+    body = memoryview(data)[HEADER_SIZE:]
+    if magic != MAGIC or zlib.crc32(body) != crc:
+        raise ValueError("bad header or checksum")
+    
+    fen, offset = _unpack_text(bytes(body), 0)
+    result, offset = _unpack_text(bytes(body), offset)
+    (token_count,) = struct.unpack_from("<I", body, offset)
+    offset += 4
+    tokens = struct.unpack_from(f"<{token_count}H", body, offset)
+    offset += 2 * token_count
+    
+    # The game tree, with the cursor where it was
+    game_state.reset_game()
+    tree = game_state.tree
+    tree.reset(chess.Board(fen))
+    _decode_tree(tree, tokens)
+    cursor = tree.root
+    for _ in range(cursor_ply):
+        cursor = cursor.next() or cursor
+    tree.go_to(cursor)
+    game_state.last_move = cursor.move
+    
+    game_state.result = result or None
+    game_state.player_color = bool(player_color)
+    game_state.difficulty = DIFFICULTIES[difficulty]
+    game_state.time_control = TIME_CONTROLS[time_control] if time_control != NO_TIME_CONTROL else None
+    game_state.game_count = {"player": player_wins, "stockfish": engine_wins, "draw": draws}
+    game_state.evaluation_mode = bool(flags & FLAG_EVALUATION_MODE)
+    game_state.show_best_move = bool(flags & FLAG_SHOW_BEST_MOVE)
+    
+    # Clocks come back stopped; resuming a game starts the clock of the side to move
+    game_state.reset_clocks()
+    if game_state.time_control:
+        game_state.clocks = {chess.WHITE: white_clock, chess.BLACK: black_clock}
+        game_state.clock_turn = bool(clock_turn)
+    
+    if cache is not None:
+        cache.update(_read_evaluations(body, offset))
+    
+    return STATES[state]
@@ -1,23 +1,30 @@
 import chess
 import threading
+import time
+from config import TIME_CONTROLS, DEFAULT_TIME_CONTROL
+from variation_tree import VariationTree
+from move_index import MoveIndex
 
 class GameState:
     """Manages the game state and transitions between different states."""
     
     def __init__(self):
         """Initialize the game state."""
-        self.board = chess.Board()
         self.player_color = chess.WHITE
         self.difficulty = None
         self.game_state = "menu"  # menu, color_select, difficulty, playing, game_over, analysis
+        self.network_game = False  # Two-player game against an opponent on another computer
         self.result = None
         self.promotion_choice = None
         
-        # Move history for navigating backward/forward
-        self.move_history = [self.board.copy()]
-        self.current_move_index = 0
+        # Moves and variations for navigating backward/forward; the cursor board is self.board
+        self.tree = VariationTree()
         self.last_move = None
         
+        # Legal moves of the cursor position, rebuilt when the cursor node changes
+        self._move_index = None
+        self._move_index_node = None
+        
         # Game statistics
         self.game_count = {"player": 0, "stockfish": 0, "draw": 0}
         
@@ -28,6 +35,7 @@ class GameState:
         # Evaluation
         self.evaluation_mode = False
         self.show_best_move = False
+        self.show_stats = False
         
         # Promotion handling
         self.pending_promotion = None
@@ -35,10 +43,39 @@ class GameState:
         # Draw request handling
         self.draw_requested = False
         
+        # Clocks (remaining seconds per color); the running clock is charged on each move
+        self.time_control = TIME_CONTROLS[DEFAULT_TIME_CONTROL]
+        self.clocks = {}
+        self.clock_turn = chess.WHITE
+        self.clock_started = None
+        self.reset_clocks()
+        
         # Callbacks for when state or position changes
         self.state_change_callback = None
         self.position_change_callback = None
     
+    @property
+    def board(self):
+        """The board at the cursor of the game tree."""
+        return self.tree.board
+    
+    @property
+    def current_move_index(self):
+        """The ply of the cursor (0 at the starting position)."""
+        return self.tree.current.ply
+    
+    @property
+    def move_index(self):
+        """The legal move index of the cursor position."""
+        if self._move_index_node is not self.tree.current:
+            self._move_index = MoveIndex(self.tree.board)
+            self._move_index_node = self.tree.current
+        return self._move_index
+    
+    def get_line_length(self):
+        """Get the number of positions in the selected line, including the start."""
+        return len(self.tree.line())
+    
     def set_state_change_callback(self, callback):
         """Set a callback function to be called when the game state changes."""
         self.state_change_callback = callback
@@ -61,35 +98,144 @@ class GameState:
     
     def reset_game(self):
         """Reset the game to its initial state."""
-        self.board.reset()
-        self.move_history = [self.board.copy()]
-        self.current_move_index = 0
+        self.tree.reset()
         self.last_move = None
         self.selected_square = None
         self.evaluation_mode = False
         self.show_best_move = False
         self.legal_moves_squares = []
         self.draw_requested = False
+        self.reset_clocks()
+    
+    def load_game(self, game):
+        """Load a chess.pgn game with its variations for review in analysis mode."""
+        self.reset_game()
+        self.difficulty = None
+        self.tree.reset(game.board())
+        
+        # Depth-first walk over the variations; the cursor returns to the start when done
+        pending = [iter(game.variations)]
+        while pending:
+            variation = next(pending[-1], None)
+            if variation is None:
+                pending.pop()
+                if pending:
+                    self.tree.go_back()
+                continue
+            self.tree.push(variation.move)
+            pending.append(iter(variation.variations))
+        
+        # Forward follows the main line (pushing the variations selected them)
+        self.tree.select_main_line()
+        
+        headers = game.headers
+        self.result = f"{headers.get('White', '?')} - {headers.get('Black', '?')}: {headers.get('Result', '*')}"
+        self.set_game_state("analysis")
+    
+    def cycle_time_control(self):
+        """Switch to the next time control in TIME_CONTROLS."""
+        index = (TIME_CONTROLS.index(self.time_control) + 1) % len(TIME_CONTROLS)
+        self.time_control = TIME_CONTROLS[index]
+        self.reset_clocks()
+    
+    def get_time_control_text(self):
+        """Get the time control in the usual "minutes+increment" notation."""
+        if not self.time_control:
+            return "No clock"
+        base, increment = self.time_control
+        minutes = f"{base // 60}" if base % 60 == 0 else f"{base / 60:g}"
+        return f"{minutes}+{increment}"
+    
+    def reset_clocks(self):
+        """Set both clocks to the base time and stop them."""
+        self.clocks = {}
+        self.clock_turn = chess.WHITE
+        self.clock_started = None
+        if self.time_control:
+            base, _ = self.time_control
+            self.clocks = {chess.WHITE: float(base), chess.BLACK: float(base)}
+    
+    def start_clocks(self):
+        """Start the clock of the side to move."""
+        if self.time_control:
+            self.clock_turn = self.board.turn
+            self.clock_started = time.monotonic()
+    
+    def stop_clocks(self):
+        """Charge the running clock for the time used so far and stop it."""
+        if self.clock_started is not None:
+            self.clocks[self.clock_turn] = self.get_clock(self.clock_turn)
+            self.clock_started = None
+    
+    def get_clock(self, color):
+        """Get the remaining time in seconds for a color (None without a time control)."""
+        if not self.time_control:
+            return None
+        remaining = self.clocks[color]
+        if self.clock_started is not None and color == self.clock_turn:
+            remaining -= time.monotonic() - self.clock_started
+        return max(0.0, remaining)
+    
+    def get_engine_clocks(self):
+        """Get the clocks as chess.engine.Limit arguments, or None without a time control."""
+        if not self.time_control:
+            return None
+        _, increment = self.time_control
+        return {
+            "white_clock": self.get_clock(chess.WHITE),
+            "black_clock": self.get_clock(chess.BLACK),
+            "white_inc": increment,
+            "black_inc": increment
+        }
+    
+    def check_flag(self):
+        """End the game if the running clock has reached zero. Returns True if it did."""
+        if self.clock_started is None or self.game_state != "playing":
+            return False
+        if self.get_clock(self.clock_turn) > 0:
+            return False
+        
+        self.flag(self.clock_turn)
+        return True
+    
+    def flag(self, color):
+        """End the game as a loss on time for color."""
+        self.stop_clocks()
+        self.clocks[color] = 0.0
+        
+        # A flag only loses if the opponent could still deliver mate
+        winner = not color
+        if self.board.has_insufficient_material(winner):
+            self.end_game("Game drawn by timeout vs insufficient material")
+        else:
+            self.end_game(f"{'White' if winner == chess.WHITE else 'Black'} wins on time")
+    
+    def set_clock(self, color, remaining):
+        """Set the remaining time of a stopped clock (reported by the opponent of a network game)."""
+        if self.time_control:
+            self.clocks[color] = remaining
     
     def make_move(self, move):
         """Make a move on the board."""
-        self.board.push(move)
-        self.last_move = move
+        # Charge the mover's clock and add the increment
+        if self.clock_started is not None and self.game_state == "playing":
+            now = time.monotonic()
+            self.clocks[self.clock_turn] -= now - self.clock_started
+            self.clocks[self.clock_turn] += self.time_control[1]
+            self.clock_turn = not self.clock_turn
+            self.clock_started = now
         
-        # Update move history
-        self.move_history = self.move_history[:self.current_move_index + 1]
-        self.move_history.append(self.board.copy())
-        self.current_move_index = len(self.move_history) - 1
+        # From an earlier position this starts (or follows) a variation
+        self.tree.push(move)
+        self.last_move = move
         
         self.check_game_end()
         self.legal_moves_squares = []
     
     def go_back(self):
         """Navigate backward in move history."""
-        if self.current_move_index > 0:
-            self.current_move_index -= 1
-            self.board = self.move_history[self.current_move_index].copy()
-            self.last_move = self.board.move_stack[-1] if self.board.move_stack else None
+        if self.tree.go_back():
+            self.last_move = self.tree.current.move
             
             # Notify position change for evaluation updates
             if self.position_change_callback:
@@ -97,10 +243,17 @@ class GameState:
     
     def go_forward(self):
         """Navigate forward in move history."""
-        if self.current_move_index < len(self.move_history) - 1:
-            self.current_move_index += 1
-            self.board = self.move_history[self.current_move_index].copy()
-            self.last_move = self.board.move_stack[-1] if self.board.move_stack else None
+        if self.tree.go_forward():
+            self.last_move = self.tree.current.move
+            
+            # Notify position change for evaluation updates
+            if self.position_change_callback:
+                self.position_change_callback(self.board)
+    
+    def switch_variation(self, step=1):
+        """Switch the move at the cursor to the next (or previous) variation played from the position before it."""
+        if self.tree.switch_variation(step):
+            self.last_move = self.tree.current.move
             
             # Notify position change for evaluation updates
             if self.position_change_callback:
@@ -116,25 +269,20 @@ class GameState:
             self.difficulty = difficulty
         else:
             self.difficulty = None
+        self.network_game = mode == "lan"
+        
+        self.start_clocks()
     
     def check_game_end(self):
         """Check if the game has ended and set the appropriate result."""
-        if self.board.is_game_over():
-            if self.board.is_checkmate():
-                winner = "Black" if self.board.turn == chess.WHITE else "White"
-                self.end_game(f"{winner} wins by checkmate")
-            elif self.board.is_stalemate():
-                self.end_game("Game drawn by stalemate")
-            elif self.board.is_insufficient_material():
-                self.end_game("Game drawn due to insufficient material")
-            elif self.board.is_fifty_moves():
-                self.end_game("Game drawn by fifty-move rule")
-            elif self.board.is_repetition():
-                self.end_game("Game drawn by repetition")
+        # The move index is built once per position and shared with the board clicks
+        result = self.tree.tracker.result(self.board, len(self.move_index))
+        if result:
+            self.end_game(result)
     
     def end_game(self, result):
         """End the game with the specified result."""
-        self.game_state = "game_over"
+        self.stop_clocks()
         self.result = result
         
         # Update game statistics
@@ -144,12 +292,39 @@ class GameState:
             self.game_count["player" if self.player_color == chess.BLACK else "stockfish"] += 1
         else:
             self.game_count["draw"] += 1
+        
+        # Through the callback, so the engine work of the game (pondering, evaluation) stops too
+        self.set_game_state("game_over")
     
-    def resign(self):
-        """Resign the current game."""
-        winner = "Black" if self.board.turn == chess.WHITE else "White"
+    def resign(self, color=None):
+        """Resign the current game for color (the side to move by default)."""
+        if color is None:
+            color = self.board.turn
+        winner = "Black" if color == chess.WHITE else "White"
         self.end_game(f"{winner} wins by resignation")
     
+    def abandon(self, reason):
+        """End the game without a result, leaving the statistics unchanged."""
+        self.stop_clocks()
+        self.result = reason
+        self.set_game_state("game_over")
+    
+    def replay_moves(self, moves):
+        """Replace the game with these moves from the starting position (illegal moves end the replay)."""
+        self.stop_clocks()
+        self.tree.reset()
+        for move in moves:
+            if move not in self.move_index:
+                print(f"Error replaying moves: {move.uci()} is illegal")
+                break
+            self.tree.push(move)
+        self.last_move = self.tree.current.move
+        self.selected_square = None
+        self.legal_moves_squares = []
+        self.check_game_end()
+        if self.game_state == "playing":
+            self.start_clocks()
+    
     def offer_draw(self):
         """Offer a draw in the current game."""
         self.end_game("Game drawn by agreement")
@@ -162,16 +337,31 @@ class GameState:
         """Toggle showing best move on/off."""
         self.show_best_move = not self.show_best_move
     
+    def toggle_stats(self):
+        """Toggle the engine statistics panel on/off."""
+        self.show_stats = not self.show_stats
+    
     def reset_and_play(self):
         """Reset the game and start playing again."""
         old_state = self.game_state
         self.reset_game()
         self.game_state = "playing"
+        self.start_clocks()
         
         # Trigger state change callback to reset engine state
         if self.state_change_callback:
             self.state_change_callback(old_state, "playing")
     
+    def get_neighbouring_positions(self, radius):
+        """Get the positions within radius moves of the cursor on the selected line, nearest first."""
+        line = self.tree.line()
+        boards = []
+        for distance in range(1, radius + 1):
+            for index in (self.current_move_index + distance, self.current_move_index - distance):
+                if 0 <= index < len(line):
+                    boards.append(self.tree.board_at(line[index]))
+        return boards
+    
     def get_legal_moves_from_square(self, square):
-        """Get all legal moves from a specific square."""
-        return [move.to_square for move in self.board.legal_moves if move.from_square == square] 
\ No newline at end of file
+        """Get the destination squares of all legal moves from a specific square."""
+        return self.move_index.targets(square) 
\ No newline at end of file
@@ -11,6 +11,13 @@ class InputHandler:
         self.engine_manager = engine_manager
         self.ui_manager = ui_manager
         
+        # Pending AI move (a future resolved by the engine pool)
+        self.ai_move_future = None
+        self.ai_move_position = None
+        
+        # Opponent on another computer (a LanGame), if one was set up
+        self.lan_game = None
+    
     def handle_event(self, event):
         """Handle a pygame event."""
         if event.type == pygame.QUIT:
@@ -42,6 +49,8 @@ class InputHandler:
             self.game_state.set_game_state("color_select")
         elif buttons["two player"].is_clicked(pos):
             self.game_state.start_game("multiplayer")
+        elif buttons["time control"].is_clicked(pos):
+            self.game_state.cycle_time_control()
         elif buttons["quit"].is_clicked(pos):
             return False  # Signal to quit the game
     
@@ -64,19 +73,16 @@ class InputHandler:
         
         if buttons["easy"].is_clicked(pos):
             self.game_state.start_game("singleplayer", "easy")
-            self.engine_manager.set_difficulty("easy")
             # If player is black, AI should move first
             if self.game_state.player_color == chess.BLACK:
                 self.make_ai_move()
         elif buttons["medium"].is_clicked(pos):
             self.game_state.start_game("singleplayer", "medium")
-            self.engine_manager.set_difficulty("medium")
             # If player is black, AI should move first
             if self.game_state.player_color == chess.BLACK:
                 self.make_ai_move()
         elif buttons["hard"].is_clicked(pos):
             self.game_state.start_game("singleplayer", "hard")
-            self.engine_manager.set_difficulty("hard")
             # If player is black, AI should move first
             if self.game_state.player_color == chess.BLACK:
                 self.make_ai_move()
@@ -94,93 +100,65 @@ class InputHandler:
     
     def handle_board_click(self, pos):
         """Handle a click on the chess board."""
+        # The board is locked while the AI is thinking, and during the remote opponent's turn
+        if self.is_ai_thinking():
+            return
+        if self.game_state.network_game and self.game_state.game_state == "playing" and not self.lan_game.can_move():
+            return
+        
         # Allow board interaction in playing mode, or in analysis mode, or when evaluation is active
         if not (self.game_state.game_state == "playing" or 
                 self.game_state.game_state == "analysis" or
-                (self.game_state.current_move_index == len(self.game_state.move_history) - 1) or
+                not self.game_state.tree.can_go_forward() or
                 self.game_state.evaluation_mode):
             return
         
         square = coords_to_square(pos[0], pos[1])
         
-        # In analysis mode or when navigating with evaluation, allow move editing
+        # In analysis mode or when navigating with evaluation, moves edit the game (adding a variation)
         if (self.game_state.game_state == "analysis" or 
-            (self.game_state.evaluation_mode and self.game_state.current_move_index < len(self.game_state.move_history) - 1)):
+            (self.game_state.evaluation_mode and self.game_state.tree.can_go_forward())):
             # In pure analysis mode, allow all moves; in game evaluation mode, restrict to player color
             if (self.game_state.game_state == "playing" and 
                 self.game_state.board.turn != self.game_state.player_color):
                 return  # Don't allow editing bot's moves during gameplay
-            
-            # We're in the middle of the game, allow editing
-            if self.game_state.selected_square is None:
-                piece = self.game_state.board.piece_at(square)
-                if piece and piece.color == self.game_state.board.turn:
-                    self.game_state.selected_square = square
-                    self.game_state.legal_moves_squares = self.game_state.get_legal_moves_from_square(square)
-            else:
-                move = chess.Move(self.game_state.selected_square, square)
-                
-                # Check for pawn promotion first (before checking if move is legal)
-                piece = self.game_state.board.piece_at(self.game_state.selected_square)
-                if (piece and piece.piece_type == chess.PAWN and
-                    ((self.game_state.board.turn == chess.WHITE and chess.square_rank(square) == 7) or
-                     (self.game_state.board.turn == chess.BLACK and chess.square_rank(square) == 0))):
-                    
-                    # Check if any promotion move to this square is legal
-                    promotion_moves = [chess.Move(self.game_state.selected_square, square, promotion=p) 
-                                     for p in [chess.QUEEN, chess.ROOK, chess.BISHOP, chess.KNIGHT]]
-                    
-                    if any(pm in self.game_state.board.legal_moves for pm in promotion_moves):
-                        self.handle_promotion_dialog(move)
-                        return  # Wait for promotion choice before making move
-                
-                # Normal move (non-promotion)
-                if move in self.game_state.board.legal_moves:
-                    self.game_state.make_move(move)
-                    # Truncate move history and continue from this point
-                    self.game_state.move_history = self.game_state.move_history[:self.game_state.current_move_index + 1]
-                    
-                    # Only make AI move if we're in playing mode and it's AI's turn
-                    if (self.game_state.difficulty and 
-                        self.game_state.game_state == "playing" and
-                        self.game_state.board.turn != self.game_state.player_color):
-                        self.make_ai_move()
-                
-                self.game_state.selected_square = None
-                self.game_state.legal_moves_squares = []
-        else:
-            # Normal gameplay
-            if self.game_state.selected_square is None:
-                piece = self.game_state.board.piece_at(square)
-                if piece and piece.color == self.game_state.board.turn:
-                    self.game_state.selected_square = square
-                    self.game_state.legal_moves_squares = self.game_state.get_legal_moves_from_square(square)
-            else:
-                move = chess.Move(self.game_state.selected_square, square)
-                
-                # Check for pawn promotion first (before checking if move is legal)
-                piece = self.game_state.board.piece_at(self.game_state.selected_square)
-                if (piece and piece.piece_type == chess.PAWN and
-                    ((self.game_state.board.turn == chess.WHITE and chess.square_rank(square) == 7) or
-                     (self.game_state.board.turn == chess.BLACK and chess.square_rank(square) == 0))):
-                    
-                    # Check if any promotion move to this square is legal
-                    promotion_moves = [chess.Move(self.game_state.selected_square, square, promotion=p) 
-                                     for p in [chess.QUEEN, chess.ROOK, chess.BISHOP, chess.KNIGHT]]
-                    
-                    if any(pm in self.game_state.board.legal_moves for pm in promotion_moves):
-                        self.handle_promotion_dialog(move)
-                        return  # Wait for promotion choice before making move
-                
-                # Normal move (non-promotion)
-                if move in self.game_state.board.legal_moves:
-                    self.game_state.make_move(move)
-                    
-                    if self.game_state.difficulty and self.game_state.board.turn != self.game_state.player_color:
-                        self.make_ai_move()
-                
-                self.game_state.selected_square = None
-                self.game_state.legal_moves_squares = []
+        
+        # Every lookup goes through the legal move index of the current position
+        move_index = self.game_state.move_index
+        
+        if self.game_state.selected_square is None:
+            piece = self.game_state.board.piece_at(square)
+            if piece and piece.color == self.game_state.board.turn:
+                self.game_state.selected_square = square
+                self.game_state.legal_moves_squares = move_index.targets(square)
+            return
+        
+        from_square = self.game_state.selected_square
+        
+        # Promotions wait for the player's choice of piece
+        if move_index.is_promotion(from_square, square):
+            self.handle_promotion_dialog(chess.Move(from_square, square))
+            return
+        
+        move = chess.Move(from_square, square)
+        if move in move_index:
+            self.play_move(move)
+        
+        self.game_state.selected_square = None
+        self.game_state.legal_moves_squares = []
+    
+    def play_move(self, move):
+        """Play the local player's move and hand the turn to the AI or the remote opponent."""
+        network_turn = self.game_state.network_game and self.game_state.game_state == "playing"
+        self.game_state.make_move(move)
+        
+        if network_turn:
+            self.lan_game.send_move(move)
+        # Only make AI move if we're in playing mode and it's AI's turn
+        elif (self.game_state.difficulty and
+              self.game_state.game_state == "playing" and
+              self.game_state.board.turn != self.game_state.player_color):
+            self.make_ai_move()
     
     def handle_promotion_dialog(self, move):
         """Handle pawn promotion dialog."""
@@ -195,9 +173,18 @@ class InputHandler:
     def handle_ui_click(self, pos):
         """Handle a click on the UI elements."""
         buttons = self.ui_manager.buttons
+        network_game = self.game_state.network_game
         
         if buttons["resign"].is_clicked(pos):
-            self.game_state.resign()
+            self.cancel_ai_move()
+            if network_game:
+                self.lan_game.resign()
+            else:
+                self.game_state.resign()
+        elif buttons["draw"].is_clicked(pos) and network_game:
+            self.lan_game.draw()
+        elif buttons["decline draw"].is_clicked(pos) and network_game:
+            self.lan_game.decline_draw()
         elif buttons["draw"].is_clicked(pos) and self.game_state.difficulty is None:
             # Handle draw request/accept for two-player games
             if not self.game_state.draw_requested:
@@ -211,15 +198,18 @@ class InputHandler:
             self.game_state.draw_requested = False
         elif buttons["menu"].is_clicked(pos):
             self.game_state.set_game_state("menu")
-        elif buttons["back"].is_clicked(pos):
+        # Both sides of a network game stay on the latest position
+        elif buttons["back"].is_clicked(pos) and not self.is_ai_thinking() and not network_game:
             self.game_state.go_back()
-        elif buttons["forward"].is_clicked(pos):
+        elif buttons["forward"].is_clicked(pos) and not self.is_ai_thinking() and not network_game:
             self.game_state.go_forward()
         elif buttons["evaluate"].is_clicked(pos):
             self.game_state.toggle_evaluation()
             self.handle_evaluation_toggle()
         elif buttons["best move"].is_clicked(pos) and self.game_state.evaluation_mode:
             self.game_state.toggle_best_move()
+        elif buttons["stats"].is_clicked(pos):
+            self.game_state.toggle_stats()
     
     def handle_game_over_click(self, pos):
         """Handle a click on the game over screen."""
@@ -230,7 +220,12 @@ class InputHandler:
             self.game_state.evaluation_mode = True
             self.handle_evaluation_toggle()
         elif buttons["play again"].is_clicked(pos):
-            self.game_state.reset_and_play()
+            if not self.game_state.network_game:
+                self.game_state.reset_and_play()
+            elif self.lan_game.connection.status == "connected":
+                self.lan_game.new_game()
+            else:
+                self.game_state.set_game_state("menu")  # The opponent is gone
         elif buttons["main menu"].is_clicked(pos):
             self.game_state.set_game_state("menu")
     
@@ -242,11 +237,15 @@ class InputHandler:
             self.game_state.go_back()
         elif buttons["forward"].is_clicked(pos):
             self.game_state.go_forward()
+        elif buttons["variation"].is_clicked(pos):
+            self.game_state.switch_variation()
         elif buttons["evaluate"].is_clicked(pos):
             self.game_state.toggle_evaluation()
             self.handle_evaluation_toggle()
         elif buttons["best move"].is_clicked(pos) and self.game_state.evaluation_mode:
             self.game_state.toggle_best_move()
+        elif buttons["stats"].is_clicked(pos):
+            self.game_state.toggle_stats()
         elif buttons["menu"].is_clicked(pos):
             self.game_state.set_game_state("menu")
         elif buttons["back to end"].is_clicked(pos):
@@ -262,7 +261,42 @@ class InputHandler:
             self.engine_manager.stop_evaluation()
     
     def make_ai_move(self):
-        """Make a move for the AI."""
-        move = self.engine_manager.get_best_move(self.game_state.board, self.game_state.difficulty)
-        if move:
-            self.game_state.make_move(move) 
\ No newline at end of file
+        """Ask the engine for the AI move without blocking the event loop."""
+        if self.ai_move_future is not None or self.game_state.game_state != "playing":
+            return
+        
+        self.ai_move_position = self.game_state.board.fen()
+        self.ai_move_future = self.engine_manager.request_best_move(
+            self.game_state.board,
+            self.game_state.difficulty,
+            self.game_state.get_engine_clocks()
+        )
+    
+    def is_ai_thinking(self):
+        """Check if an AI move is being computed."""
+        return self.ai_move_future is not None
+    
+    def poll_ai_move(self):
+        """Apply the AI move once its future has resolved (called every frame)."""
+        future = self.ai_move_future
+        if future is None or not future.done():
+            return
+        
+        self.ai_move_future = None
+        if future.cancelled():
+            return
+        
+        move = future.result()
+        
+        # Ignore the result if the game moved on while the engine was thinking
+        if (move and self.game_state.game_state == "playing" and
+            self.game_state.board.fen() == self.ai_move_position and
+            move in self.game_state.move_index):
+            self.game_state.make_move(move)
+            self.engine_manager.update_evaluation_position(self.game_state.board)
+    
+    def cancel_ai_move(self):
+        """Cancel a pending AI move (on resign, menu, new game or quit)."""
+        if self.ai_move_future is not None:
+            self.ai_move_future.cancel()
+            self.ai_move_future = None 
\ No newline at end of file
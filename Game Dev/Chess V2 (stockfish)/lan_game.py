@@ -0,0 +1,456 @@
+import asyncio
+import queue
+import socket
+import struct
+import threading
+import time
+from collections import namedtuple
+import chess
+from config import LAN_LISTEN_ADDRESS, LAN_CONNECT_TIMEOUT, LAN_PING_INTERVAL, TIME_CONTROLS
+from game_snapshot import encode_move, decode_move
+
+PROTOCOL_VERSION = 2
+
+# Frames are a type byte and fixed little-endian fields; a SYNC frame is followed by its moves.
+# Moves are packed in 16 bits as in session snapshots, and positions are identified by the
+# Zobrist key the game end tracker keeps.
+HELLO, MOVE, PING, PONG, ACTION, SYNC_REQUEST, SYNC = range(1, 8)
+FRAME_FORMATS = {
+    HELLO: "<BBBB",  # Type, protocol version, color the guest plays, time control index
+    MOVE: "<BHHQI",  # Type, sequence number (the ply the move leads to), move, key after the move, mover's time (ms)
+    PING: "<BQHQ",  # Type, sender timestamp (ns), sender ply, sender key
+    PONG: "<BQHQ",  # Type, the ping's timestamp echoed back, responder ply, responder key
+    ACTION: "<BB",  # Type, action code
+    SYNC_REQUEST: "<B",
+    SYNC: "<BHQ"  # Type, ply, key, then ply 16-bit moves from the starting position
+}
+FRAME_SIZES = {frame_type: struct.calcsize(fmt) for frame_type, fmt in FRAME_FORMATS.items()}
+
+# Action codes
+RESIGN = 1
+DRAW_OFFER = 2
+DRAW_ACCEPT = 3
+DRAW_DECLINE = 4
+NEW_GAME = 5
+WHITE_FLAGGED = 6  # Only the host decides flags
+BLACK_FLAGGED = 7
+
+# Weight of a new round-trip sample in the smoothed round-trip time
+RTT_SMOOTHING = 0.2
+
+# Something that happened on the connection, handed to the game loop. kind is "connected",
+# "hello", "move", "action", "sync_request", "sync", "peer_position" or "disconnected".
+LanMessage = namedtuple("LanMessage", ["kind", "data"])
+
+
+class LanConnection:
+    """The network side of a two-player game over TCP.
+    
+    An asyncio event loop runs on a background thread: it accepts or opens
+    the connection, decodes frames into LanMessage tuples for the game loop
+    (which takes them with poll() once per frame), answers pings and measures
+    the round-trip time. Sends are handed to the loop thread, so nothing here
+    blocks the caller. notify is called from the loop thread whenever a
+    message needs handling, so an idle game loop can wake up for it.
+    """
+    
+    def __init__(self, notify=None):
+        """Start the network thread; call host() or join() to connect."""
+        self.notify = notify
+        self.messages = queue.SimpleQueue()
+        self.status = "idle"  # idle, waiting, connecting, connected or disconnected
+        self.status_text = ""
+        self.peer = None
+        self.rtt = None  # Smoothed round-trip time in seconds
+        self.position = (0, 0)  # (ply, key) of the local game, sent with every ping
+        self._writer = None
+        self._server = None
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="lan-connection", daemon=True)
+        self._thread.start()
+    
+    def host(self, port):
+        """Wait for an opponent to connect on port."""
+        self.status = "waiting"
+        self.status_text = f"Waiting for an opponent on port {port}"
+        asyncio.run_coroutine_threadsafe(self._host(port), self._loop)
+    
+    def join(self, address, port):
+        """Connect to a game hosted at address."""
+        self.status = "connecting"
+        self.status_text = f"Connecting to {address}:{port}"
+        asyncio.run_coroutine_threadsafe(self._join(address, port), self._loop)
+    
+    def poll(self):
+        """Take the messages received since the last call."""
+        while True:
+            try:
+                yield self.messages.get_nowait()
+            except queue.Empty:
+                return
+    
+    def send_hello(self, guest_color, time_control):
+        """Tell the guest which color it plays and the time control."""
+        self._send(struct.pack(FRAME_FORMATS[HELLO], HELLO, PROTOCOL_VERSION, int(guest_color),
+                               TIME_CONTROLS.index(time_control)))
+    
+    def send_move(self, ply, move, key, remaining=None):
+        """Send a move with the ply and position key it leads to, and the mover's remaining time."""
+        remaining_ms = round(remaining * 1000) if remaining is not None else 0
+        self._send(struct.pack(FRAME_FORMATS[MOVE], MOVE, ply, encode_move(move), key, remaining_ms))
+    
+    def send_action(self, code):
+        """Send a resignation, draw offer or answer, new game request or flag."""
+        self._send(struct.pack(FRAME_FORMATS[ACTION], ACTION, code))
+    
+    def request_sync(self):
+        """Ask the peer for its moves."""
+        self._send(struct.pack(FRAME_FORMATS[SYNC_REQUEST], SYNC_REQUEST))
+    
+    def send_sync(self, moves, key):
+        """Send every move of the game, for a peer whose position differs."""
+        codes = [encode_move(move) for move in moves]
+        self._send(struct.pack(FRAME_FORMATS[SYNC], SYNC, len(codes), key) +
+                   struct.pack(f"<{len(codes)}H", *codes))
+    
+    def close(self):
+        """Close the connection and stop the network thread."""
+        self._loop.call_soon_threadsafe(self._shutdown)
+        self._thread.join(timeout=1.0)
+    
+    def _send(self, data):
+        """Queue a frame for the loop thread to write."""
+        self._loop.call_soon_threadsafe(self._write, data)
+    
+    def _write(self, data):
+        """Write a frame (loop thread)."""
+        if self._writer is not None and not self._writer.is_closing():
+            self._writer.write(data)
+    
+    def _put(self, kind, data=None, wake=True):
+        """Hand a message to the game loop (loop thread)."""
+        self.messages.put(LanMessage(kind, data))
+        if wake and self.notify:
+            self.notify()
+    
+    def _disconnected(self, reason):
+        """Record that the connection is gone (loop thread)."""
+        self.status = "disconnected"
+        self.status_text = reason
+        self.rtt = None
+        self._put("disconnected", reason)
+    
+    async def _host(self, port):
+        """Listen for the opponent (loop thread)."""
+        try:
+            self._server = await asyncio.start_server(self._accept, LAN_LISTEN_ADDRESS, port)
+        except OSError as e:
+            self._disconnected(f"Could not listen on port {port}: {str(e)}")
+    
+    async def _accept(self, reader, writer):
+        """Take the first client as the opponent and stop listening (loop thread)."""
+        if self._writer is not None:
+            writer.close()
+            return
+        self._server.close()
+        self._connected(writer)
+        self._put("connected")
+        await self._serve(reader, writer)
+    
+    async def _join(self, address, port):
+        """Connect to the host, retrying until LAN_CONNECT_TIMEOUT (loop thread)."""
+        deadline = time.monotonic() + LAN_CONNECT_TIMEOUT
+        while True:
+            try:
+                reader, writer = await asyncio.wait_for(asyncio.open_connection(address, port),
+                                                        max(0.1, deadline - time.monotonic()))
+                break
+            except (OSError, asyncio.TimeoutError) as e:
+                if time.monotonic() >= deadline:
+                    self._disconnected(f"Could not connect to {address}:{port}: {str(e) or 'timed out'}")
+                    return
+                await asyncio.sleep(0.5)
+        
+        self._connected(writer)
+        self._put("connected")
+        await self._serve(reader, writer)
+    
+    def _connected(self, writer):
+        """Set up a new connection for low latency (loop thread)."""
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._writer = writer
+        self.peer = writer.get_extra_info("peername")[0]
+        self.status = "connected"
+        self.status_text = f"Connected to {self.peer}"
+    
+    async def _serve(self, reader, writer):
+        """Read frames until the connection closes (loop thread)."""
+        pinger = asyncio.create_task(self._ping_loop())
+        try:
+            while True:
+                frame_type, fields = await self._read_frame(reader)
+                if frame_type == PING:
+                    timestamp, peer_ply, peer_key = fields
+                    ply, key = self.position
+                    self._write(struct.pack(FRAME_FORMATS[PONG], PONG, timestamp, ply, key))
+                    self._put("peer_position", (peer_ply, peer_key), wake=False)
+                elif frame_type == PONG:
+                    timestamp, ply, key = fields
+                    sample = (time.monotonic_ns() - timestamp) / 1e9
+                    self.rtt = sample if self.rtt is None else self.rtt + RTT_SMOOTHING * (sample - self.rtt)
+                    self._put("peer_position", (ply, key), wake=False)
+                elif frame_type == HELLO:
+                    version, guest_color, time_control = fields
+                    if version != PROTOCOL_VERSION:
+                        raise ValueError(f"the opponent uses protocol version {version}, not {PROTOCOL_VERSION}")
+                    self._put("hello", (bool(guest_color), TIME_CONTROLS[time_control]))
+                elif frame_type == MOVE:
+                    seq, code, key, remaining_ms = fields
+                    self._put("move", (seq, decode_move(code), key, remaining_ms / 1000))
+                elif frame_type == ACTION:
+                    self._put("action", fields[0])
+                elif frame_type == SYNC_REQUEST:
+                    self._put("sync_request")
+                elif frame_type == SYNC:
+                    _, key, codes = fields
+                    self._put("sync", ([decode_move(code) for code in codes], key))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            self._disconnected("The opponent left the game")
+        except (ValueError, IndexError, struct.error) as e:
+            self._disconnected(f"Bad data from the opponent: {str(e)}")
+        finally:
+            pinger.cancel()
+            self._writer = None
+            writer.close()
+    
+    @staticmethod
+    async def _read_frame(reader):
+        """Read one frame; returns (type, fields) (loop thread)."""
+        frame_type = (await reader.readexactly(1))[0]
+        if frame_type not in FRAME_FORMATS:
+            raise ValueError(f"unknown frame type {frame_type}")
+        data = bytes([frame_type]) + await reader.readexactly(FRAME_SIZES[frame_type] - 1)
+        fields = struct.unpack(FRAME_FORMATS[frame_type], data)[1:]
+        if frame_type == SYNC:
+            count = fields[0]
+            fields += (struct.unpack(f"<{count}H", await reader.readexactly(2 * count)),)
+        return frame_type, fields
+    
+    async def _ping_loop(self):
+        """Measure the round-trip time and exchange position keys (loop thread)."""
+        while True:
+            ply, key = self.position
+            self._write(struct.pack(FRAME_FORMATS[PING], PING, time.monotonic_ns(), ply, key))
+            await asyncio.sleep(LAN_PING_INTERVAL)
+    
+    def _shutdown(self):
+        """Close everything and stop the loop (loop thread)."""
+        if self._server is not None:
+            self._server.close()
+        if self._writer is not None:
+            self._writer.close()
+        for task in asyncio.all_tasks(self._loop):
+            task.cancel()
+        self._loop.call_soon(self._loop.stop)
+
+
+class LanGame:
+    """Plays a GameState against an opponent on another computer.
+    
+    Each move is sent with a sequence number (the ply it leads to) and the
+    position's Zobrist key. A move that arrives out of order or leads to a
+    different position, or a ping showing a different position at the same
+    ply, makes the two sides resynchronize: the host's moves are
+    authoritative, and the guest replays them. Moves also carry the mover's
+    remaining time, which the receiver adopts, and only the host decides
+    when a clock has run out.
+    """
+    
+    def __init__(self, game_state, connection, is_host, host_color=chess.WHITE):
+        """Set up a game over a connection; the host picks the colors and the time control."""
+        self.game_state = game_state
+        self.connection = connection
+        self.is_host = is_host
+        self.host_color = host_color
+        self.notice = None  # Last thing the opponent did (draw offer, resignation...)
+        self._ply_mismatches = 0  # Position reports in a row at a different ply
+    
+    @property
+    def active(self):
+        """Check if a game against the remote opponent is in progress."""
+        return self.game_state.network_game and self.game_state.game_state == "playing"
+    
+    def can_move(self):
+        """Check if the local player may move now."""
+        return (self.active and self.connection.status == "connected" and
+                self.game_state.board.turn == self.game_state.player_color)
+    
+    def update(self):
+        """Handle everything that arrived since the last frame (called every frame)."""
+        for message in self.connection.poll():
+            handler = getattr(self, f"_on_{message.kind}")
+            handler(message.data)
+        self.connection.position = (self.game_state.current_move_index, self.game_state.tree.tracker.key)
+    
+    def send_move(self, move):
+        """Send a move the local player just made."""
+        game_state = self.game_state
+        self.notice = None
+        self.connection.send_move(game_state.current_move_index, move, game_state.tree.tracker.key,
+                                  game_state.get_clock(not game_state.board.turn))
+    
+    def check_flag(self):
+        """On the host, end the game when a clock runs out and tell the guest (called every frame)."""
+        game_state = self.game_state
+        if not self.is_host or not self.active:
+            return
+        flagged = game_state.clock_turn
+        if game_state.check_flag():
+            # A move the guest sent meanwhile is not played: the guest replays the final position
+            self._resync()
+            self.connection.send_action(WHITE_FLAGGED if flagged == chess.WHITE else BLACK_FLAGGED)
+    
+    def resign(self):
+        """Resign for the local player."""
+        self.game_state.resign(self.game_state.player_color)
+        self.connection.send_action(RESIGN)
+    
+    def draw(self):
+        """Accept the opponent's draw offer, or offer a draw."""
+        if self.game_state.draw_requested:
+            self.game_state.offer_draw()
+            self.connection.send_action(DRAW_ACCEPT)
+        else:
+            self.notice = "Draw offered"
+            self.connection.send_action(DRAW_OFFER)
+    
+    def decline_draw(self):
+        """Decline the opponent's draw offer."""
+        self.game_state.draw_requested = False
+        self.connection.send_action(DRAW_DECLINE)
+    
+    def leave(self, resign=False):
+        """Close the connection, resigning a game in progress first if resign is set."""
+        if resign and self.connection.status == "connected":
+            self.connection.send_action(RESIGN)
+        self.connection.close()
+    
+    def new_game(self):
+        """Start another game with the same colors on both sides."""
+        self.notice = None
+        self.game_state.reset_and_play()
+        self.connection.send_action(NEW_GAME)
+    
+    def status_lines(self):
+        """Get the connection state, the round-trip time and the last notice for display."""
+        lines = [self.connection.status_text]
+        if self.connection.status == "connected":
+            color = "White" if self.game_state.player_color == chess.WHITE else "Black"
+            lines[0] = f"LAN: {color} vs {self.connection.peer}"
+            rtt = self.connection.rtt
+            lines.append(f"Ping: {rtt * 1000:.0f} ms" if rtt is not None else "Ping: ...")
+        if self.notice:
+            lines.append(self.notice)
+        return lines
+    
+    def _start(self, player_color, time_control):
+        """Start a game against the opponent."""
+        self.notice = None
+        self.game_state.player_color = player_color
+        self.game_state.time_control = time_control
+        self.game_state.start_game("lan")
+    
+    def _resync(self):
+        """Bring the two positions back together: the host sends its moves, the guest asks for them."""
+        if self.is_host:
+            line = self.game_state.tree.line()[1:self.game_state.current_move_index + 1]
+            self.connection.send_sync([node.move for node in line], self.game_state.tree.tracker.key)
+        else:
+            self.connection.request_sync()
+    
+    def _on_connected(self, data):
+        """The host starts the game as soon as the guest is there."""
+        if self.is_host:
+            self.connection.send_hello(not self.host_color, self.game_state.time_control)
+            self._start(self.host_color, self.game_state.time_control)
+    
+    def _on_hello(self, data):
+        """The guest starts the game with the colors and time control the host chose."""
+        player_color, time_control = data
+        self._start(player_color, time_control)
+    
+    def _on_move(self, data):
+        """Play the opponent's move, or resynchronize if it does not fit the local game."""
+        seq, move, key, remaining = data
+        game_state = self.game_state
+        if not self.active or seq <= game_state.current_move_index:
+            return  # Game over here already, or a move a resync has already played
+        
+        if (seq != game_state.current_move_index + 1 or game_state.board.turn == game_state.player_color or
+                move not in game_state.move_index):
+            self._resync()
+            return
+        
+        self.notice = None
+        game_state.make_move(move)
+        game_state.set_clock(not game_state.board.turn, remaining)
+        if game_state.tree.tracker.key != key:
+            self._resync()
+    
+    def _on_action(self, code):
+        """Apply the opponent's resignation, draw offer or answer, new game, or the host's flag."""
+        game_state = self.game_state
+        if code == NEW_GAME:
+            self.notice = None
+            game_state.reset_and_play()
+        elif not self.active:
+            return
+        elif code == RESIGN:
+            game_state.resign(not game_state.player_color)
+        elif code == DRAW_OFFER:
+            self.notice = None  # The draw request text takes over
+            game_state.draw_requested = True
+        elif code == DRAW_ACCEPT:
+            game_state.offer_draw()
+        elif code == DRAW_DECLINE:
+            self.notice = "Draw declined"
+        elif code in (WHITE_FLAGGED, BLACK_FLAGGED) and not self.is_host:
+            game_state.flag(chess.WHITE if code == WHITE_FLAGGED else chess.BLACK)
+    
+    def _on_sync_request(self, data):
+        """Send the host's moves to a guest that lost track."""
+        if self.is_host:
+            self._resync()
+    
+    def _on_sync(self, data):
+        """Replace the guest's moves with the host's."""
+        moves, key = data
+        if self.is_host or not self.game_state.network_game:
+            return
+        self.game_state.replay_moves(moves)
+        if self.game_state.tree.tracker.key != key:
+            print("Error resynchronizing LAN game: positions still differ")
+    
+    def _on_peer_position(self, data):
+        """Compare the opponent's position key with the local one at the same ply."""
+        ply, key = data
+        if self.is_host or not self.active:
+            return  # Only the guest asks, so two syncs never cross
+        
+        # A move in flight makes the plies differ for one report at most
+        if ply != self.game_state.current_move_index:
+            self._ply_mismatches += 1
+            if self._ply_mismatches >= 2:
+                self._ply_mismatches = 0
+                self.connection.request_sync()
+        else:
+            self._ply_mismatches = 0
+            if key != self.game_state.tree.tracker.key:
+                self.connection.request_sync()
+    
+    def _on_disconnected(self, reason):
+        """End a game in progress when the opponent is gone."""
+        if self.active:
+            self.game_state.abandon("Opponent disconnected")
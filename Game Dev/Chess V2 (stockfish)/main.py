@@ -1,13 +1,25 @@
+import argparse
+import os
 import pygame
 import sys
 import chess
-from config import SCREEN_WIDTH, SCREEN_HEIGHT, WHITE
+from config import (SCREEN_WIDTH, SCREEN_HEIGHT, WHITE, PREFETCH_RADIUS, EVAL_GRAPH_REFRESH_INTERVAL, SESSION_PATH,
+                    LAN_PORT)
 
 from game_state import GameState
 from engine_manager import EngineManager
 from board_renderer import BoardRenderer
 from ui_elements import UIManager
 from input_handler import InputHandler
+from power_manager import PowerManager
+from batch_evaluator import evaluate_boards
+from pgn_database import PgnDatabase, header_filter
+from position_explorer import PositionExplorer
+from game_snapshot import save_session, load_session
+from lan_game import LanConnection, LanGame
+
+# Posted by the network thread so an idle main loop wakes up for a remote move
+LAN_EVENT = pygame.event.custom_type()
 
 class ChessGame:
     """Main game class that ties all components together."""
@@ -28,6 +40,22 @@ class ChessGame:
         self.board_renderer = BoardRenderer(self.screen)
         self.ui_manager = UIManager(self.screen)
         self.input_handler = InputHandler(self.game_state, self.engine_manager, self.ui_manager)
+        self.power_manager = PowerManager()
+        self.explorer = PositionExplorer()
+        self.lan_game = None
+        
+        # Explorer results for the analysis cursor, looked up again only when the position changes
+        self._explorer_key = None
+        self._explorer_moves = []
+        
+        # Evaluation graph for analysis mode: static evaluations of the selected
+        # line, overlaid with engine results as they come in
+        self._graph_line_end = None
+        self._graph_boards = []
+        self._graph_static = []
+        self._graph_keys = []
+        self._graph_refreshed_at = None
+        self._graph_data = ([], [])
         
         # Set up callbacks for state and position changes
         self.game_state.set_state_change_callback(self.on_state_change)
@@ -35,6 +63,18 @@ class ChessGame:
     
     def on_state_change(self, old_state, new_state):
         """Handle state changes in the game."""
+        # A pending AI move belongs to the game that is being left
+        if new_state in ["menu", "playing"]:
+            self.input_handler.cancel_ai_move()
+        
+        # The ponder search runs until it is cancelled, so it ends with the game
+        if old_state == "playing" and new_state != "playing":
+            self.engine_manager.cancel_ponder()
+        
+        # Leaving a network game for the menu resigns it and ends the connection, so the opponent is not left waiting
+        if new_state == "menu" and self.game_state.network_game:
+            self.close_lan_game(resign=old_state == "playing")
+        
         # Stop evaluation when leaving a state that might have it active
         if old_state in ["playing", "analysis"] and new_state not in ["playing", "analysis"]:
             if self.game_state.evaluation_mode:
@@ -49,12 +89,75 @@ class ChessGame:
         if new_state == "analysis" and not self.game_state.evaluation_mode:
             self.game_state.evaluation_mode = True
             self.engine_manager.start_evaluation(self.game_state.board, self._on_evaluation_update)
+        
+        # Analyse neighbouring moves ahead of time while reviewing a game
+        if new_state == "analysis":
+            self.prefetch_neighbours()
+        elif old_state == "analysis":
+            self.engine_manager.cancel_prefetch()
     
     def on_position_change(self, board):
         """Handle position changes during navigation."""
         # Update evaluation for the new position if evaluation is active
         if self.game_state.evaluation_mode:
             self.engine_manager.update_evaluation_position(board)
+            
+            if self.game_state.game_state == "analysis":
+                self.prefetch_neighbours()
+    
+    def prefetch_neighbours(self):
+        """Queue shallow searches of the positions around the analysis cursor."""
+        self.engine_manager.prefetch_positions(
+            self.game_state.get_neighbouring_positions(PREFETCH_RADIUS)
+        )
+    
+    def get_evaluation_graph(self):
+        """Get the evaluation curve of the reviewed game and which points came from the engine.
+        
+        Every position is scored at once by the batch evaluator when the game
+        changes; engine results replace those scores as analysis and prefetch
+        reach them, merged in every EVAL_GRAPH_REFRESH_INTERVAL ms.
+        """
+        # The last node identifies the line (it changes when a move is added or another variation is chosen)
+        tree = self.game_state.tree
+        line = tree.line()
+        if line[-1] is not self._graph_line_end:
+            self._graph_line_end = line[-1]
+            self._graph_boards = tree.line_boards()
+            self._graph_static = evaluate_boards(self._graph_boards).tolist()
+            self._graph_keys = [self.engine_manager.cache.key(board) for board in self._graph_boards]
+            self._graph_refreshed_at = None
+        
+        now = pygame.time.get_ticks()
+        if self._graph_refreshed_at is None or now - self._graph_refreshed_at >= EVAL_GRAPH_REFRESH_INTERVAL:
+            self._graph_refreshed_at = now
+            known = self.engine_manager.known_evaluations(self._graph_boards, self._graph_keys)
+            evaluations = [static if engine is None else engine for static, engine in zip(self._graph_static, known)]
+            engine_known = [engine is not None for engine in known]
+            # Keep the same list objects while nothing changed, so the UI reuses its rendering
+            if (evaluations, engine_known) != self._graph_data:
+                self._graph_data = (evaluations, engine_known)
+        
+        return self._graph_data
+    
+    def update_power_state(self):
+        """Suspend background analysis while nobody is watching, and resume it on return."""
+        if self.power_manager.should_pause_analysis():
+            self.engine_manager.pause()
+        elif self.engine_manager.paused:
+            self.engine_manager.resume()
+            if self.game_state.game_state == "analysis":
+                self.prefetch_neighbours()
+    
+    def is_busy(self):
+        """Check if something on screen changes quickly and needs the full frame rate."""
+        if self.input_handler.is_ai_thinking():
+            return True
+        
+        # Clocks show tenths of a second when time is low
+        if self.game_state.clock_started is not None:
+            return self.game_state.get_clock(self.game_state.clock_turn) < 10
+        return False
     
     def handle_promotion_event(self, event):
         """Handle events during promotion dialog."""
@@ -80,24 +183,19 @@ class ChessGame:
                     self.game_state.selected_square = None
                     self.game_state.legal_moves_squares = []
                     
-                    # Make the move
-                    self.game_state.make_move(promoted_move)
-                    
-                    # Make AI move if appropriate
-                    if (self.game_state.difficulty and 
-                        self.game_state.game_state == "playing" and
-                        self.game_state.board.turn != self.game_state.player_color):
-                        self.input_handler.make_ai_move()
-                    
+                    # Make the move (and the AI's or remote opponent's turn follows)
+                    self.input_handler.play_move(promoted_move)
                     break
     
-    def _on_evaluation_update(self, best_move, evaluation, pv_line, mate_in=None):
+    def _on_evaluation_update(self, best_move, evaluation, pv_line, mate_in=None, depth=None, lines=None):
         """Callback for evaluation updates."""
         # Store updated evaluation data - no lock needed since we're already in the locked section
         self.engine_manager.best_move = best_move
         self.engine_manager.evaluation = evaluation
         self.engine_manager.pv_line = pv_line
         self.engine_manager.mate_in = mate_in
+        self.engine_manager.depth = depth
+        self.engine_manager.lines = lines or []
     
     def run(self):
         """Run the main game loop."""
@@ -114,9 +212,14 @@ class ChessGame:
         
         self.input_handler.handle_evaluation_toggle = new_handle_evaluation_toggle
         
+        woken_by = None  # Event the frame wait took off the queue, handled first
         while running:
             # Process events
-            for event in pygame.event.get():
+            events = pygame.event.get()
+            if woken_by is not None:
+                events.insert(0, woken_by)
+            for event in events:
+                self.power_manager.handle_event(event)
                 if event.type == pygame.QUIT:
                     running = False
                     continue
@@ -128,12 +231,33 @@ class ChessGame:
                     if not self.input_handler.handle_event(event):
                         running = False
             
+            # Pause or resume analysis depending on focus and activity
+            self.update_power_state()
+            
+            # Apply the AI move as soon as the engine has answered
+            self.input_handler.poll_ai_move()
+            
+            # Apply the remote opponent's moves on the frame they arrive
+            if self.lan_game:
+                self.lan_game.update()
+            
+            # End the game when a clock runs out (the host decides for both sides of a network game)
+            if self.game_state.network_game:
+                self.lan_game.check_flag()
+            elif self.game_state.check_flag():
+                self.input_handler.cancel_ai_move()
+            
+            # Nothing to render while the window is minimized
+            if not self.power_manager.visible:
+                woken_by = self.power_manager.wait_for_next_frame(self.clock, self.is_busy())
+                continue
+            
             # Clear the screen
             self.screen.fill(WHITE)
             
             # Render the current state
             if self.game_state.game_state == "menu":
-                self.ui_manager.draw_menu()
+                self.ui_manager.draw_menu(self.game_state.get_time_control_text())
             elif self.game_state.game_state == "color_select":
                 self.ui_manager.draw_color_menu()
             elif self.game_state.game_state == "difficulty":
@@ -144,6 +268,10 @@ class ChessGame:
                 self.draw_game()
                 self.ui_manager.draw_game_over(self.game_state.result)
             
+            # Connection state and round-trip time of a network game
+            if self.lan_game:
+                self.ui_manager.draw_network_status(self.lan_game.status_lines())
+            
             # Draw promotion dialog if active
             if self.game_state.pending_promotion:
                 self.ui_manager.show_promotion_dialog()
@@ -151,8 +279,8 @@ class ChessGame:
             # Update the display
             pygame.display.flip()
             
-            # Cap the frame rate
-            self.clock.tick(60)
+            # Cap the frame rate (lower when idle or in the background)
+            woken_by = self.power_manager.wait_for_next_frame(self.clock, self.is_busy())
         
         # Clean up
         self.quit_game()
@@ -187,6 +315,17 @@ class ChessGame:
             self.game_state.difficulty
         )
         
+        # Below the board: the evaluation graph when reviewing a game, the clocks otherwise
+        if self.game_state.game_state == "analysis":
+            evaluations, engine_known = self.get_evaluation_graph()
+            self.ui_manager.draw_evaluation_graph(evaluations, engine_known, self.game_state.current_move_index)
+            
+            # Games from the collection that reached this position
+            if self.explorer.available:
+                self.ui_manager.draw_explorer(self.get_explorer_moves(), self.game_state.board)
+        else:
+            self.ui_manager.draw_clocks(self.game_state)
+        
         # Draw evaluation elements if evaluation mode is active
         if self.game_state.evaluation_mode:
             with self.engine_manager.evaluation_lock:
@@ -198,28 +337,149 @@ class ChessGame:
                 
                 # Show best move if requested
                 if self.game_state.show_best_move:
-                    if self.engine_manager.best_move and self.engine_manager.best_move in self.game_state.board.legal_moves:
+                    if len(self.engine_manager.lines) > 1:
+                        # Ranked arrows for every candidate line
+                        self.board_renderer.draw_candidate_moves(
+                            [line.move for line in self.engine_manager.lines
+                             if line.move and line.move in self.game_state.move_index]
+                        )
+                    elif self.engine_manager.best_move and self.engine_manager.best_move in self.game_state.move_index:
                         self.board_renderer.draw_best_move(self.engine_manager.best_move)
                     
                     self.ui_manager.draw_evaluation_info(
                         self.engine_manager.best_move,
                         self.game_state.board,
-                        self.engine_manager.pv_line
+                        self.engine_manager.pv_line,
+                        self.engine_manager.depth
                     )
+                    self.ui_manager.draw_candidate_lines(self.engine_manager.lines)
+        
+        # Engine statistics panel
+        if self.game_state.show_stats:
+            self.ui_manager.draw_stats_panel(self.engine_manager.telemetry)
+        
+        # Show that the AI is computing its move
+        if self.input_handler.is_ai_thinking():
+            self.ui_manager.draw_thinking_indicator()
         
         # In analysis mode, show the move counter
         if self.game_state.game_state == "analysis":
             self.ui_manager.draw_move_counter(
                 self.game_state.current_move_index,
-                len(self.game_state.move_history)
+                self.game_state.get_line_length()
             )
     
+    def open_database_game(self, path, number=None, filters=None):
+        """Load a game from a PGN file into analysis mode, by number or by the first header match."""
+        try:
+            database = PgnDatabase(path)
+            try:
+                if filters:
+                    matches = database.find(**filters)
+                    if not matches:
+                        print(f"No game in {path} matches {filters}")
+                        return False
+                    number = matches[0]
+                game = database.game(number or 0)
+            finally:
+                database.close()
+        except (OSError, IndexError, ValueError) as e:
+            print(f"Error opening game from {path}: {str(e)}")
+            return False
+        
+        self.game_state.load_game(game)
+        return True
+    
+    def get_explorer_moves(self):
+        """Get how the current position continued in the game collection."""
+        # The tracker's Zobrist key is kept up to date on every move, so this costs nothing per frame
+        key = self.game_state.tree.tracker.key
+        if key != self._explorer_key:
+            self._explorer_key = key
+            self._explorer_moves = self.explorer.lookup(key)
+        return self._explorer_moves
+    
+    def start_lan_game(self, join_address=None, port=LAN_PORT, color=chess.WHITE):
+        """Host a game for an opponent on the local network, or join one at join_address."""
+        connection = LanConnection(notify=lambda: pygame.event.post(pygame.event.Event(LAN_EVENT)))
+        self.lan_game = LanGame(self.game_state, connection, is_host=join_address is None, host_color=color)
+        self.input_handler.lan_game = self.lan_game
+        if join_address is None:
+            connection.host(port)
+        else:
+            connection.join(join_address, port)
+    
+    def close_lan_game(self, resign=False):
+        """Disconnect from the remote opponent, resigning a game in progress if resign is set."""
+        self.lan_game.leave(resign)
+        self.lan_game = None
+        self.input_handler.lan_game = None
+        self.game_state.network_game = False
+    
+    def save_session(self):
+        """Save the game and session so the next start can pick up from here."""
+        try:
+            save_session(SESSION_PATH, self.game_state, self.engine_manager.cache)
+        except OSError as e:
+            print(f"Error saving session: {str(e)}")
+    
+    def resume_session(self):
+        """Restore the session saved on the last quit, if there is one."""
+        if not os.path.exists(SESSION_PATH):
+            return
+        try:
+            state = load_session(SESSION_PATH, self.game_state, self.engine_manager.cache)
+        except (OSError, ValueError) as e:
+            print(f"Error restoring session: {str(e)}")
+            self.game_state.reset_game()
+            return
+        
+        evaluation_mode = self.game_state.evaluation_mode
+        
+        if state == "playing":
+            self.game_state.game_state = "playing"
+            self.game_state.start_clocks()
+            if evaluation_mode:
+                self.engine_manager.start_evaluation(self.game_state.board, self._on_evaluation_update)
+            if self.game_state.difficulty and self.game_state.board.turn != self.game_state.player_color:
+                self.input_handler.make_ai_move()
+        elif state == "analysis":
+            # Entering analysis starts the evaluation and the prefetch
+            self.game_state.evaluation_mode = False
+            self.game_state.set_game_state("analysis")
+        else:
+            self.game_state.game_state = state
+    
     def quit_game(self):
         """Clean up resources and quit the game."""
+        self.input_handler.cancel_ai_move()
+        # A network game cannot be resumed without the opponent, so it is resigned and saved as finished
+        if self.lan_game and self.lan_game.active:
+            self.lan_game.resign()
+        self.save_session()
+        if self.lan_game:
+            self.close_lan_game()
         self.engine_manager.quit()
+        self.explorer.close()
         pygame.quit()
         sys.exit()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Python Chess Game")
+    parser.add_argument("pgn", nargs="?", help="PGN file to open a game from for analysis")
+    parser.add_argument("--game", type=int, help="number of the game in the file (0-based)")
+    parser.add_argument("--find", nargs="*", type=header_filter, default=[], metavar="TAG=VALUE",
+                        help="open the first game matching headers")
+    parser.add_argument("--lan-host", action="store_true", help="wait for an opponent on the local network")
+    parser.add_argument("--lan-join", metavar="ADDRESS", help="play against the opponent hosting at ADDRESS")
+    parser.add_argument("--lan-port", type=int, default=LAN_PORT)
+    parser.add_argument("--lan-color", choices=["white", "black"], default="white", help="color the host plays")
+    args = parser.parse_args()
+    
     game = ChessGame()
+    game.resume_session()
+    if args.pgn:
+        game.open_database_game(args.pgn, args.game, dict(args.find))
+    if args.lan_host or args.lan_join:
+        game.start_lan_game(args.lan_join, args.lan_port, args.lan_color == "white")
     game.run() 
\ No newline at end of file
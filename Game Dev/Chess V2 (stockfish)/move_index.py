@@ -0,0 +1,49 @@
+class MoveIndex:
+    """The legal moves of one position, indexed for constant-time lookups.
+    
+    Built once per position (the legal move generator runs a single time)
+    and shared by piece selection, move highlighting, promotion detection
+    and move validation.
+    """
+    
+    def __init__(self, board):
+        """Index the legal moves of a board."""
+        self.moves = set()
+        self.by_from = {}  # From-square -> legal moves starting there
+        self.by_to = {}  # To-square -> legal moves ending there
+        self.promotions = set()  # (from-square, to-square) pairs that promote
+        
+        for move in board.legal_moves:
+            self.moves.add(move)
+            self.by_from.setdefault(move.from_square, []).append(move)
+            self.by_to.setdefault(move.to_square, []).append(move)
+            if move.promotion:
+                self.promotions.add((move.from_square, move.to_square))
+        
+        # Destination squares to highlight, one entry per square even with four promotion moves
+        self._targets = {square: list(dict.fromkeys(move.to_square for move in moves))
+                         for square, moves in self.by_from.items()}
+    
+    def __contains__(self, move):
+        """Check if a move is legal."""
+        return move in self.moves
+    
+    def __len__(self):
+        """Get the number of legal moves."""
+        return len(self.moves)
+    
+    def moves_from(self, square):
+        """Get the legal moves starting on a square."""
+        return self.by_from.get(square, [])
+    
+    def moves_to(self, square):
+        """Get the legal moves ending on a square."""
+        return self.by_to.get(square, [])
+    
+    def targets(self, square):
+        """Get the destination squares of the legal moves from a square."""
+        return self._targets.get(square, [])
+    
+    def is_promotion(self, from_square, to_square):
+        """Check if moving from one square to another is a legal promotion."""
+        return (from_square, to_square) in self.promotions
@@ -0,0 +1,49 @@
+import os
+import random
+import chess.polyglot
+from config import OPENING_BOOK_PATH
+
+
+class OpeningBook:
+    """Polyglot opening book answering book positions without the engine.
+    
+    The .bin file is memory-mapped and searched by binary search on the
+    Zobrist key (chess.polyglot.MemoryMappedReader), so lookups take
+    microseconds and the book is never loaded into memory as a whole.
+    """
+    
+    def __init__(self, path=OPENING_BOOK_PATH):
+        """Open the book if the file exists; otherwise the book stays empty."""
+        self.reader = None
+        if path and os.path.exists(path):
+            try:
+                self.reader = chess.polyglot.open_reader(path)
+            except (OSError, ValueError) as e:
+                print(f"Could not open opening book {path}: {str(e)}")
+    
+    def choose_move(self, board, selection="weighted"):
+        """Pick a book move for the position, or None if it is out of book.
+        
+        selection is "best" (highest weight), "weighted" (random, proportional
+        to weight) or "uniform" (any book move with equal probability).
+        """
+        if self.reader is None:
+            return None
+        
+        entries = list(self.reader.find_all(board))
+        if not entries:
+            return None
+        
+        if selection == "best":
+            return max(entries, key=lambda entry: entry.weight).move
+        if selection == "uniform":
+            return random.choice(entries).move
+        
+        weights = [entry.weight for entry in entries]
+        return random.choices(entries, weights=weights)[0].move
+    
+    def close(self):
+        """Release the memory-mapped file."""
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
@@ -0,0 +1,233 @@
+import argparse
+import hashlib
+import io
+import mmap
+import os
+import re
+import struct
+import time
+import zlib
+from array import array
+import numpy as np
+import chess.pgn
+from config import PGN_INDEX_SUFFIX, PGN_INDEX_HEADERS
+
+# Index layout: header, (game count + 1) game start offsets (the last one is the file size),
+# then for each indexed header the value keys of all games in sorted order, followed by
+# the game numbers in the same order
+MAGIC = b"PGI1"
+HEADER_FORMAT = "<4s4xQQQQ"  # Magic, game count, PGN size, PGN mtime (ns), CRC of the indexed header names
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+# A game starts with a block of tag pair lines like [White "Carlsen, Magnus"]. Blocks are
+# searched for after a newline (a literal prefix lets the regex engine skip the moves quickly);
+# only the first game of the file can start without one
+TAG_LINES = rb'(?:\[[A-Za-z0-9_]+[ \t]+"[^\r\n]*\][ \t]*\r?\n)+'
+TAG_BLOCK = re.compile(TAG_LINES)
+NEXT_TAG_BLOCK = re.compile(rb'\n(' + TAG_LINES + rb')')
+FIRST_TAG_BLOCK = re.compile(rb'(?:\xef\xbb\xbf)?(' + TAG_LINES + rb')')
+TAG_PAIR = re.compile(rb'\[([A-Za-z0-9_]+)[ \t]+"((?:[^"\\\r\n]|\\.)*)"[ \t]*\]')
+
+
+def read_games(path):
+    """Stream the games of a PGN file one at a time, without loading the file."""
+    with open(path, encoding="utf-8-sig", errors="replace") as pgn:
+        while True:
+            game = chess.pgn.read_game(pgn)
+            if game is None:
+                return
+            yield game
+
+
+def header_key(value):
+    """Get the 64-bit lookup key of a header value (case and surrounding spaces are ignored)."""
+    digest = hashlib.blake2b(value.strip().lower().encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+def header_filter(item):
+    """Parse a TAG=VALUE command line argument into a (tag, value) pair (an argparse type)."""
+    tag, separator, value = item.partition("=")
+    if not separator or not tag.strip():
+        raise argparse.ArgumentTypeError(f"expected TAG=VALUE, got {item!r}")
+    return tag.strip(), value
+
+
+def _decode(value):
+    """Decode a tag pair value, undoing the PGN escapes."""
+    return value.decode("utf-8", errors="replace").replace('\\"', '"').replace("\\\\", "\\")
+
+
+def _parse_tags(block):
+    """Parse a tag pair block into a dict of header values."""
+    return {name.decode("ascii"): _decode(value) for name, value in TAG_PAIR.findall(block)}
+
+
+def _tag_blocks(data):
+    """Find the tag pair block of every game; yields (offset, block)."""
+    first = FIRST_TAG_BLOCK.match(data)
+    if first:
+        yield first.start(1), first.group(1)
+    for match in NEXT_TAG_BLOCK.finditer(data, first.end() if first else 0):
+        yield match.start(1), match.group(1)
+
+
+def _tags_crc():
+    """Checksum of the indexed header names, so changing PGN_INDEX_HEADERS rebuilds old indexes."""
+    return zlib.crc32(",".join(PGN_INDEX_HEADERS).encode("ascii"))
+
+
+def build_index(pgn_path, index_path=None):
+    """Scan a PGN file once and write its game offset and header index.
+    
+    The file is memory-mapped and searched for tag pair blocks, so the moves
+    themselves are never parsed. Returns the number of games found.
+    """
+    index_path = index_path or pgn_path + PGN_INDEX_SUFFIX
+    stat = os.stat(pgn_path)
+    offsets = array("Q")
+    keys = {tag.encode("ascii"): array("Q") for tag in PGN_INDEX_HEADERS}
+    missing = header_key("")
+    
+    if stat.st_size:
+        with open(pgn_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for offset, block in _tag_blocks(data):
+                offsets.append(offset)
+                # Only the indexed values are decoded and hashed
+                found = {name: value for name, value in TAG_PAIR.findall(block) if name in keys}
+                for tag, tag_keys in keys.items():
+                    value = found.get(tag)
+                    tag_keys.append(header_key(_decode(value)) if value is not None else missing)
+    
+    count = len(offsets)
+    offsets.append(stat.st_size)
+    
+    temp_path = index_path + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(struct.pack(HEADER_FORMAT, MAGIC, count, stat.st_size, stat.st_mtime_ns, _tags_crc()))
+        f.write(np.frombuffer(offsets, dtype="<u8").tobytes())
+        for tag_keys in keys.values():
+            tag_keys = np.frombuffer(tag_keys, dtype="<u8")
+            order = np.argsort(tag_keys, kind="stable")
+            f.write(tag_keys[order].tobytes())
+            f.write(order.astype("<u8").tobytes())
+    os.replace(temp_path, index_path)
+    return count
+
+
+class PgnDatabase:
+    """Random access to the games of a large PGN file through its index.
+    
+    The PGN file and its index (written next to it with PGN_INDEX_SUFFIX,
+    rebuilt when the PGN file changes) are both memory-mapped: game N is a
+    slice between two offsets, and the indexed headers are sorted tables
+    searched by binary search, so nothing is loaded up front.
+    """
+    
+    def __init__(self, path):
+        """Open a PGN file, building its index first if it is missing or stale."""
+        self.path = path
+        self.index_path = path + PGN_INDEX_SUFFIX
+        if not self._index_is_current():
+            start = time.monotonic()
+            count = build_index(path, self.index_path)
+            print(f"Indexed {count} games in {path} ({time.monotonic() - start:.1f}s)")
+        
+        index = np.memmap(self.index_path, dtype=np.uint8, mode="r")
+        _, self.count, _, _, _ = struct.unpack(HEADER_FORMAT, bytes(index[:HEADER_SIZE]))
+        offsets_end = HEADER_SIZE + 8 * (self.count + 1)
+        self.offsets = index[HEADER_SIZE:offsets_end].view("<u8")
+        
+        # Per indexed header: (sorted value keys, game numbers)
+        column_size = 8 * self.count
+        self.tables = {}
+        for i, tag in enumerate(PGN_INDEX_HEADERS):
+            start = offsets_end + 2 * i * column_size
+            self.tables[tag] = (index[start:start + column_size].view("<u8"),
+                                index[start + column_size:start + 2 * column_size].view("<u8"))
+        
+        self._file = open(path, "rb")
+        self.data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.count else b""
+    
+    def _index_is_current(self):
+        """Check if the index file exists and matches the PGN file and indexed headers."""
+        try:
+            with open(self.index_path, "rb") as f:
+                header = f.read(HEADER_SIZE)
+            magic, _, size, mtime, crc = struct.unpack(HEADER_FORMAT, header)
+        except (OSError, struct.error):
+            return False
+        stat = os.stat(self.path)
+        return magic == MAGIC and size == stat.st_size and mtime == stat.st_mtime_ns and crc == _tags_crc()
+    
+    def __len__(self):
+        """Get the number of games."""
+        return self.count
+    
+    def raw(self, number):
+        """Get the PGN text of a game by number (0-based)."""
+        if not 0 <= number < self.count:
+            raise IndexError(f"game {number} is out of range (0-{self.count - 1})")
+        return bytes(self.data[int(self.offsets[number]):int(self.offsets[number + 1])])
+    
+    def game(self, number):
+        """Parse a game by number (0-based)."""
+        text = self.raw(number).decode("utf-8-sig", errors="replace")
+        return chess.pgn.read_game(io.StringIO(text))
+    
+    def headers(self, number):
+        """Get the headers of a game without parsing its moves."""
+        block = TAG_BLOCK.match(self.data, int(self.offsets[number]), int(self.offsets[number + 1]))
+        return _parse_tags(block.group()) if block else {}
+    
+    def games(self, start=0):
+        """Stream parsed games from a game number on."""
+        for number in range(start, self.count):
+            yield self.game(number)
+    
+    def find(self, **filters):
+        """Get the numbers of the games whose headers equal all the given values, in order.
+        
+        Indexed headers (PGN_INDEX_HEADERS) are looked up by binary search;
+        any other header falls back to scanning the headers of the candidates.
+        """
+        candidates = None
+        for tag, value in filters.items():
+            if tag in self.tables:
+                keys, game_numbers = self.tables[tag]
+                key = np.uint64(header_key(value))
+                low = np.searchsorted(keys, key, side="left")
+                high = np.searchsorted(keys, key, side="right")
+                games = set(game_numbers[low:high].tolist())
+                candidates = games if candidates is None else candidates & games
+        
+        numbers = sorted(candidates) if candidates is not None else range(self.count)
+        scanned = {tag: value for tag, value in filters.items() if tag not in self.tables}
+        if scanned:
+            numbers = [number for number in numbers
+                       if all(self.headers(number).get(tag, "").strip().lower() == value.strip().lower()
+                              for tag, value in scanned.items())]
+        return list(numbers)
+    
+    def close(self):
+        """Release the memory maps."""
+        if self.count:
+            self.data.close()
+        self._file.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index a PGN file and look up its games")
+    parser.add_argument("pgn", help="PGN file (the index is written next to it)")
+    parser.add_argument("--find", nargs="*", type=header_filter, default=[], metavar="TAG=VALUE",
+                        help="list the games matching headers")
+    args = parser.parse_args()
+    
+    database = PgnDatabase(args.pgn)
+    print(f"{len(database)} games")
+    if args.find:
+        for number in database.find(**dict(args.find)):
+            headers = database.headers(number)
+            print(f"#{number}: {headers.get('White', '?')} - {headers.get('Black', '?')} "
+                  f"{headers.get('Result', '*')} ({headers.get('Event', '?')}, {headers.get('Date', '?')})")
+    database.close()
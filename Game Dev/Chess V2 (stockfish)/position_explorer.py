@@ -0,0 +1,224 @@
+import argparse
+import concurrent.futures
+import io
+import os
+import sqlite3
+import time
+from collections import namedtuple
+import chess
+import chess.pgn
+from config import EXPLORER_PATH, EXPLORER_MAX_PLY, EXPLORER_CHUNK_GAMES
+from game_end_tracker import GameEndTracker
+from pgn_database import PgnDatabase
+
+# One continuation of a position; games counts every game, the others only decided ones.
+# The move is None for games that ended in the position.
+ExplorerMove = namedtuple("ExplorerMove", ["move", "games", "white", "draws", "black"])
+
+# Result header -> index of the counter it increments (after the game count)
+RESULT_COLUMNS = {"1-0": 1, "1/2-1/2": 2, "0-1": 3}
+
+
+def _to_sql_key(key):
+    """Map an unsigned 64-bit Zobrist hash onto SQLite's signed integers."""
+    return key - (1 << 64) if key >= (1 << 63) else key
+
+
+class _StopGame(Exception):
+    """Raised to stop parsing a game once EXPLORER_MAX_PLY moves are read."""
+
+
+class _MainlineVisitor(chess.pgn.BaseVisitor):
+    """Collects the result, the starting position and the first moves of a game's main line.
+    
+    Variations are skipped, and parsing stops after max_ply + 1 moves so
+    the rest of a long game is never read.
+    """
+    
+    def __init__(self, max_ply):
+        self.max_ply = max_ply
+        self.moves = []
+        self.outcome = None
+        self.fen = None
+    
+    def visit_header(self, tagname, tagvalue):
+        if tagname == "Result":
+            self.outcome = tagvalue
+        elif tagname == "FEN":
+            self.fen = tagvalue
+    
+    def begin_variation(self):
+        return chess.pgn.SKIP
+    
+    def visit_move(self, board, move):
+        self.moves.append(move)
+        if len(self.moves) > self.max_ply:
+            raise _StopGame()
+    
+    def result(self):
+        return self.moves, self.outcome
+
+
+def _index_chunk(pgn_path, start, stop, max_ply):
+    """Count the positions and continuations of games start..stop-1 (runs in a worker process).
+    
+    Returns {(Zobrist key, UCI move or ""): [games, white wins, draws, black wins]}.
+    """
+    counts = {}
+    database = PgnDatabase(pgn_path)
+    try:
+        for number in range(start, stop):
+            visitor = _MainlineVisitor(max_ply)
+            text = database.raw(number).decode("utf-8-sig", errors="replace")
+            try:
+                chess.pgn.read_game(io.StringIO(text), Visitor=lambda: visitor)
+            except _StopGame:
+                pass
+            try:
+                board = chess.Board(visitor.fen) if visitor.fen else chess.Board()
+            except ValueError:
+                continue  # Broken setup position; nothing to count
+            
+            column = RESULT_COLUMNS.get(visitor.outcome)
+            tracker = GameEndTracker(board)
+            seen = set()  # A position counts once per game even if it repeats
+            
+            # A game that ends within max_ply also counts for its final position
+            moves = visitor.moves
+            if len(moves) <= max_ply:
+                moves = moves + [None]
+            for move in moves[:max_ply]:
+                if tracker.key not in seen:
+                    seen.add(tracker.key)
+                    row = counts.setdefault((tracker.key, move.uci() if move else ""), [0, 0, 0, 0])
+                    row[0] += 1
+                    if column:
+                        row[column] += 1
+                if move:
+                    tracker.push(board, move)
+    finally:
+        database.close()
+    return counts
+
+
+def _connect(path):
+    """Open (or create) the explorer database."""
+    conn = sqlite3.connect(path, timeout=5.0, isolation_level=None)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS positions ("
+        " key INTEGER NOT NULL,"
+        " move TEXT NOT NULL,"
+        " games INTEGER NOT NULL,"
+        " white INTEGER NOT NULL,"
+        " draws INTEGER NOT NULL,"
+        " black INTEGER NOT NULL,"
+        " PRIMARY KEY (key, move)) WITHOUT ROWID"
+    )
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS sources ("
+        " path TEXT PRIMARY KEY,"
+        " size INTEGER NOT NULL,"
+        " mtime INTEGER NOT NULL,"
+        " games INTEGER NOT NULL)"
+    )
+    return conn
+
+
+def build_explorer(pgn_paths, path=EXPLORER_PATH, workers=None, max_ply=EXPLORER_MAX_PLY,
+                   chunk_games=EXPLORER_CHUNK_GAMES):
+    """Add the games of PGN files to the explorer database.
+    
+    Each file is split into chunks of games through its offset index, the
+    chunks are counted in a process pool, and the counts are merged into
+    SQLite as they arrive. Files already added unchanged are skipped.
+    """
+    conn = _connect(path)
+    try:
+        for pgn_path in pgn_paths:
+            source = os.path.abspath(pgn_path)
+            stat = os.stat(source)
+            row = conn.execute("SELECT size, mtime FROM sources WHERE path = ?", (source,)).fetchone()
+            if row == (stat.st_size, stat.st_mtime_ns):
+                print(f"{pgn_path} is already in the explorer")
+                continue
+            if row is not None:
+                print(f"{pgn_path} changed since it was added; delete {path} and rebuild")
+                continue
+            
+            database = PgnDatabase(source)
+            count = len(database)
+            database.close()
+            
+            start = time.monotonic()
+            chunks = [(first, min(first + chunk_games, count)) for first in range(0, count, chunk_games)]
+            conn.execute("BEGIN")
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(_index_chunk, source, first, stop, max_ply) for first, stop in chunks]
+                for done, future in enumerate(concurrent.futures.as_completed(futures), 1):
+                    conn.executemany(
+                        "INSERT INTO positions (key, move, games, white, draws, black) VALUES (?, ?, ?, ?, ?, ?)"
+                        " ON CONFLICT(key, move) DO UPDATE SET"
+                        " games = games + excluded.games, white = white + excluded.white,"
+                        " draws = draws + excluded.draws, black = black + excluded.black",
+                        ((_to_sql_key(key), move, *row) for (key, move), row in future.result().items())
+                    )
+                    print(f"\r{pgn_path}: {done}/{len(chunks)} chunks", end="", flush=True)
+            conn.execute("INSERT INTO sources (path, size, mtime, games) VALUES (?, ?, ?, ?)",
+                         (source, stat.st_size, stat.st_mtime_ns, count))
+            conn.execute("COMMIT")
+            print(f"\r{pgn_path}: {count} games added in {time.monotonic() - start:.1f}s")
+    finally:
+        conn.close()
+
+
+class PositionExplorer:
+    """Read-only lookups of how the positions of a game continued in the game collection.
+    
+    Built with `python position_explorer.py games.pgn`; positions are keyed by
+    the same Zobrist hash as the evaluation cache, and each lookup is one
+    primary key range scan.
+    """
+    
+    def __init__(self, path=EXPLORER_PATH):
+        """Open the explorer if the database exists; otherwise every lookup is empty."""
+        self.conn = None
+        self.games = 0
+        if path and os.path.exists(path):
+            try:
+                self.conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+                self.games = self.conn.execute("SELECT COALESCE(SUM(games), 0) FROM sources").fetchone()[0]
+            except sqlite3.Error as e:
+                print(f"Could not open position explorer {path}: {str(e)}")
+                self.conn = None
+    
+    @property
+    def available(self):
+        """Check if there is a game collection to look positions up in."""
+        return self.conn is not None
+    
+    def lookup(self, key):
+        """Get the continuations of a position by Zobrist key, most played first."""
+        if self.conn is None:
+            return []
+        rows = self.conn.execute(
+            "SELECT move, games, white, draws, black FROM positions WHERE key = ? ORDER BY games DESC",
+            (_to_sql_key(key),)
+        ).fetchall()
+        return [ExplorerMove(chess.Move.from_uci(move) if move else None, games, white, draws, black)
+                for move, games, white, draws, black in rows]
+    
+    def close(self):
+        """Close the database connection."""
+        if self.conn is not None:
+            self.conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the position explorer from PGN files")
+    parser.add_argument("pgn", nargs="+", help="PGN files to add")
+    parser.add_argument("--workers", type=int, help="worker processes (all cores by default)")
+    parser.add_argument("--max-ply", type=int, default=EXPLORER_MAX_PLY, help="plies of each game to index")
+    args = parser.parse_args()
+    
+    build_explorer(args.pgn, workers=args.workers, max_ply=args.max_ply)
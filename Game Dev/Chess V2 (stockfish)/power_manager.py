@@ -0,0 +1,84 @@
+import time
+import pygame
+from config import ACTIVE_FPS, IDLE_FPS, UNFOCUSED_FPS, IDLE_TIMEOUT, ANALYSIS_IDLE_TIMEOUT
+
+# Events that count as the player being present
+INPUT_EVENTS = {pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP, pygame.MOUSEMOTION, pygame.MOUSEWHEEL,
+                pygame.KEYDOWN, pygame.KEYUP}
+
+
+class PowerManager:
+    """Decides how fast to render and when to suspend background analysis.
+    
+    The game renders at ACTIVE_FPS while the player is interacting, drops to
+    IDLE_FPS after IDLE_TIMEOUT seconds without input, and to UNFOCUSED_FPS
+    when the window is in the background. Analysis is suspended while the
+    window is unfocused or minimized, or after ANALYSIS_IDLE_TIMEOUT seconds
+    without input. Low frame rates wait on the event queue rather than
+    sleeping, so the next click or key press is handled at once.
+    """
+    
+    def __init__(self):
+        """Start out focused and active."""
+        self.focused = True
+        self.minimized = False
+        self.last_input = time.monotonic()
+    
+    def handle_event(self, event):
+        """Track focus, visibility and input activity from a pygame event."""
+        if event.type in INPUT_EVENTS:
+            self.last_input = time.monotonic()
+        elif event.type == pygame.WINDOWFOCUSLOST:
+            self.focused = False
+        elif event.type == pygame.WINDOWFOCUSGAINED:
+            self.focused = True
+            self.last_input = time.monotonic()
+        elif event.type in (pygame.WINDOWMINIMIZED, pygame.WINDOWHIDDEN):
+            self.minimized = True
+        elif event.type in (pygame.WINDOWRESTORED, pygame.WINDOWSHOWN, pygame.WINDOWEXPOSED):
+            self.minimized = False
+    
+    @property
+    def visible(self):
+        """Check if frames are worth rendering at all."""
+        return not self.minimized
+    
+    def idle_time(self):
+        """Get the seconds since the last input."""
+        return time.monotonic() - self.last_input
+    
+    def should_pause_analysis(self):
+        """Check if background analysis should be suspended."""
+        return not self.focused or self.minimized or self.idle_time() > ANALYSIS_IDLE_TIMEOUT
+    
+    def frame_rate(self, busy=False):
+        """Get the frame rate to run at; busy frames (AI thinking, low clock) always run at full speed."""
+        if busy:
+            return ACTIVE_FPS
+        if self.minimized or not self.focused:
+            return UNFOCUSED_FPS
+        if self.idle_time() > IDLE_TIMEOUT:
+            return IDLE_FPS
+        return ACTIVE_FPS
+    
+    def wait_for_next_frame(self, clock, busy=False):
+        """Wait until the next frame is due, waking up early on any event.
+        
+        Returns the event that ended the wait (None if there was none), which
+        the caller handles before the events queued behind it.
+        """
+        fps = self.frame_rate(busy)
+        if fps >= ACTIVE_FPS:
+            clock.tick(fps)
+            return None
+        
+        # Events are already waiting: handle them now
+        if pygame.event.peek():
+            clock.tick()
+            return None
+        
+        # Block on the event queue instead of sleeping; the event is taken off the
+        # queue, so it is handed back rather than posted behind later events
+        event = pygame.event.wait(1000 // fps)
+        clock.tick()
+        return event if event.type != pygame.NOEVENT else None
@@ -0,0 +1,195 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+from config import STOCKFISH_PATH, STOCKFISH_SOURCE_DIR, ENGINE_BUILD_DIR, ENGINE_BUILD_PATH
+from engine_tuning import detect_cores, run_bench
+
+# x86-64 targets of the Stockfish Makefile, fastest first, with the CPU flags each one needs
+X86_64_ARCHS = [
+    ("x86-64-vnni512", {"avx512vnni", "avx512f", "avx512bw", "avx512dq", "avx512vl", "bmi2"}),
+    ("x86-64-avx512", {"avx512f", "avx512bw", "bmi2"}),
+    ("x86-64-avxvnni", {"avx_vnni", "avx2", "bmi2"}),
+    ("x86-64-bmi2", {"avx2", "bmi2"}),
+    ("x86-64-avx2", {"avx2", "popcnt", "sse4_1"}),
+    ("x86-64-sse41-popcnt", {"sse4_1", "popcnt"}),
+    ("x86-64-ssse3", {"ssse3"}),
+    ("x86-64-sse3-popcnt", {"pni", "popcnt"}),
+    ("x86-64", set())
+]
+
+ARM64_ARCHS = [
+    ("armv8-dotprod", {"asimddp"}),
+    ("armv8", set())
+]
+
+# macOS spells some CPU features differently from /proc/cpuinfo
+FLAG_ALIASES = {"sse4.1": "sse4_1", "sse4.2": "sse4_2", "sse3": "pni", "avxvnni": "avx_vnni"}
+
+
+def detect_cpu():
+    """Get the CPU vendor, family and feature flags (lowercase, /proc/cpuinfo names)."""
+    vendor = ""
+    family = 0
+    flags = set()
+    
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                name = name.strip()
+                if name == "vendor_id":
+                    vendor = value.strip()
+                elif name == "cpu family":
+                    family = int(value)
+                elif name in ("flags", "Features"):
+                    flags.update(value.split())
+                    break  # Every core reports the same flags
+    except OSError:
+        pass
+    
+    # macOS has no /proc; ask sysctl instead
+    if not flags and platform.system() == "Darwin":
+        for key in ["machdep.cpu.features", "machdep.cpu.leaf7_features"]:
+            try:
+                output = subprocess.run(["sysctl", "-n", key], capture_output=True, text=True).stdout
+                flags.update(output.lower().split())
+            except OSError:
+                pass
+    
+    flags = {FLAG_ALIASES.get(flag.lower(), flag.lower()) for flag in flags}
+    return vendor, family, flags
+
+
+def candidate_archs():
+    """List the Makefile ARCH values this machine can run, fastest first."""
+    machine = platform.machine().lower()
+    vendor, family, flags = detect_cpu()
+    
+    if machine in ("x86_64", "amd64"):
+        archs = [arch for arch, required in X86_64_ARCHS if required <= flags]
+        # pext is microcoded on AMD before Zen 3, so bmi2 builds are slower there
+        if vendor == "AuthenticAMD" and family < 0x19:
+            archs = [arch for arch in archs if arch != "x86-64-bmi2"]
+        return archs
+    if machine in ("arm64", "aarch64"):
+        if platform.system() == "Darwin":
+            return ["apple-silicon", "armv8"]
+        return [arch for arch, required in ARM64_ARCHS if required <= flags]
+    if machine.startswith(("i386", "i686", "x86")):
+        return ["x86-32-sse41-popcnt", "x86-32-sse2", "x86-32"] if "sse4_1" in flags else ["x86-32"]
+    return ["general-64", "general-32"]
+
+
+def detect_compiler():
+    """Get the Makefile COMP value for the available C++ compiler, or None."""
+    if platform.system() == "Darwin" or shutil.which("g++") is None:
+        return "clang" if shutil.which("clang++") else None
+    return "gcc"
+
+
+def build(arch, compiler, pgo=True, jobs=None):
+    """Build the bundled source for one ARCH and return the binary path, or None on failure.
+    
+    The source is copied to ENGINE_BUILD_DIR so object files and the
+    downloaded network stay out of the repository.
+    """
+    build_dir = os.path.join(ENGINE_BUILD_DIR, "src")
+    shutil.copytree(STOCKFISH_SOURCE_DIR, build_dir, dirs_exist_ok=True)
+    
+    exe = "stockfish.exe" if os.name == "nt" else "stockfish"
+    target = "profile-build" if pgo else "build"
+    command = ["make", f"-j{jobs or detect_cores()}", target, f"ARCH={arch}", f"COMP={compiler}"]
+    
+    try:
+        subprocess.run(["make", "clean"], cwd=build_dir, capture_output=True)
+        result = subprocess.run(command, cwd=build_dir, capture_output=True, text=True)
+    except OSError as e:
+        print(f"Could not run make: {str(e)}")
+        return None
+    
+    if result.returncode != 0 or not os.path.exists(os.path.join(build_dir, exe)):
+        last_lines = (result.stderr or result.stdout).strip().splitlines()[-3:]
+        print(f"  {arch}: build failed")
+        for line in last_lines:
+            print(f"    {line}")
+        return None
+    
+    binary = os.path.join(ENGINE_BUILD_DIR, f"stockfish-{arch}" + (".exe" if os.name == "nt" else ""))
+    shutil.copy2(os.path.join(build_dir, exe), binary)
+    return os.path.abspath(binary)
+
+
+def provision(candidates=2, pgo=True, jobs=None):
+    """Build the best ARCH targets, bench them and record the fastest working binary.
+    
+    ARCH targets are tried fastest first. A build that fails, or crashes on
+    this CPU during bench, falls through to the next one, until `candidates`
+    working binaries exist. The engine on PATH (STOCKFISH_PATH) is benched
+    too, so a provisioned build is only used if it is actually faster.
+    """
+    compiler = detect_compiler()
+    archs = candidate_archs()
+    results = []
+    
+    if compiler is None:
+        print("No C++ compiler found (g++ or clang++); skipping the build")
+    else:
+        os.makedirs(ENGINE_BUILD_DIR, exist_ok=True)
+        print(f"Compiler: {compiler}, ARCH candidates: {', '.join(archs)}")
+        for arch in archs:
+            binary = build(arch, compiler, pgo, jobs)
+            if binary is None:
+                continue
+            
+            nps = run_bench(binary)
+            print(f"  {arch}: " + (f"{nps} nps" if nps else "bench failed"))
+            if nps:
+                results.append({"path": binary, "arch": arch, "nps": nps})
+                if len(results) >= candidates:
+                    break
+    
+    # Compare against whatever engine is already installed
+    system_engine = shutil.which(STOCKFISH_PATH)
+    if system_engine:
+        nps = run_bench(system_engine)
+        print(f"  {STOCKFISH_PATH} on PATH: " + (f"{nps} nps" if nps else "bench failed"))
+        if nps:
+            results.append({"path": STOCKFISH_PATH, "arch": None, "nps": nps})
+    
+    if not results:
+        print("No working engine found")
+        return None
+    
+    best = max(results, key=lambda result: result["nps"])
+    with open(ENGINE_BUILD_PATH, "w") as f:
+        json.dump({"path": best["path"], "arch": best["arch"], "nps": best["nps"], "candidates": results}, f, indent=2)
+    return best
+
+
+def resolve_engine_path():
+    """Get the engine binary to run: the provisioned build if it still exists, else STOCKFISH_PATH."""
+    try:
+        with open(ENGINE_BUILD_PATH) as f:
+            path = json.load(f)["path"]
+    except (OSError, ValueError, KeyError):
+        return STOCKFISH_PATH
+    
+    if path == STOCKFISH_PATH or (os.path.isfile(path) and os.access(path, os.X_OK)):
+        return path
+    return STOCKFISH_PATH
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the bundled Stockfish for this machine")
+    parser.add_argument("--candidates", type=int, default=2, help="working builds to compare by bench NPS")
+    parser.add_argument("--no-pgo", action="store_true", help="skip profile-guided optimization (faster build)")
+    parser.add_argument("--jobs", type=int, default=None, help="parallel make jobs")
+    args = parser.parse_args()
+    
+    best = provision(args.candidates, not args.no_pgo, args.jobs)
+    if best:
+        print(f"Using {best['path']} ({best['nps']} nps), saved to {ENGINE_BUILD_PATH}")
+        print("Run engine_tuning.py again to calibrate the engine profiles for this binary")
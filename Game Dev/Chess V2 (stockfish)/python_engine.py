@@ -0,0 +1,578 @@
+import random
+import threading
+import time
+import chess
+import chess.engine
+from config import PYTHON_ENGINE_HASH, PYTHON_ENGINE_BENCH_DEPTH
+
+# Scores are in centipawns from the side to move's point of view
+MATE_SCORE = 100000
+MATE_THRESHOLD = MATE_SCORE - 1000
+MAX_PLY = 64
+
+PIECE_VALUES = [0, 100, 320, 330, 500, 900, 0]
+
+# Relative piece values for MVV-LVA capture ordering (indexed by piece type)
+ORDER_VALUES = [0, 1, 3, 3, 5, 9, 10]
+
+# Transposition table entries per MB of the "Hash" option (a dict entry takes about 200 bytes)
+TT_ENTRIES_PER_MB = 5000
+TT_EXACT, TT_LOWER, TT_UPPER = 0, 1, 2
+
+# Skill Level below 20 picks randomly among the top lines within this margin per level
+SKILL_MULTIPV = 4
+SKILL_MARGIN = 15
+
+# Piece-square tables from white's point of view, rank 8 first (a8..h8, ..., a1..h1)
+PAWN_TABLE = [
+    0, 0, 0, 0, 0, 0, 0, 0,
+    50, 50, 50, 50, 50, 50, 50, 50,
+    10, 10, 20, 30, 30, 20, 10, 10,
+    5, 5, 10, 25, 25, 10, 5, 5,
+    0, 0, 0, 20, 20, 0, 0, 0,
+    5, -5, -10, 0, 0, -10, -5, 5,
+    5, 10, 10, -20, -20, 10, 10, 5,
+    0, 0, 0, 0, 0, 0, 0, 0
+]
+
+KNIGHT_TABLE = [
+    -50, -40, -30, -30, -30, -30, -40, -50,
+    -40, -20, 0, 0, 0, 0, -20, -40,
+    -30, 0, 10, 15, 15, 10, 0, -30,
+    -30, 5, 15, 20, 20, 15, 5, -30,
+    -30, 0, 15, 20, 20, 15, 0, -30,
+    -30, 5, 10, 15, 15, 10, 5, -30,
+    -40, -20, 0, 5, 5, 0, -20, -40,
+    -50, -40, -30, -30, -30, -30, -40, -50
+]
+
+BISHOP_TABLE = [
+    -20, -10, -10, -10, -10, -10, -10, -20,
+    -10, 0, 0, 0, 0, 0, 0, -10,
+    -10, 0, 5, 10, 10, 5, 0, -10,
+    -10, 5, 5, 10, 10, 5, 5, -10,
+    -10, 0, 10, 10, 10, 10, 0, -10,
+    -10, 10, 10, 10, 10, 10, 10, -10,
+    -10, 5, 0, 0, 0, 0, 5, -10,
+    -20, -10, -10, -10, -10, -10, -10, -20
+]
+
+ROOK_TABLE = [
+    0, 0, 0, 0, 0, 0, 0, 0,
+    5, 10, 10, 10, 10, 10, 10, 5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    0, 0, 0, 5, 5, 0, 0, 0
+]
+
+QUEEN_TABLE = [
+    -20, -10, -10, -5, -5, -10, -10, -20,
+    -10, 0, 0, 0, 0, 0, 0, -10,
+    -10, 0, 5, 5, 5, 5, 0, -10,
+    -5, 0, 5, 5, 5, 5, 0, -5,
+    0, 0, 5, 5, 5, 5, 0, -5,
+    -10, 5, 5, 5, 5, 5, 0, -10,
+    -10, 0, 5, 0, 0, 0, 0, -10,
+    -20, -10, -10, -5, -5, -10, -10, -20
+]
+
+KING_MIDDLEGAME_TABLE = [
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -20, -30, -30, -40, -40, -30, -30, -20,
+    -10, -20, -20, -20, -20, -20, -20, -10,
+    20, 20, 0, 0, 0, 0, 20, 20,
+    20, 30, 10, 0, 0, 10, 30, 20
+]
+
+KING_ENDGAME_TABLE = [
+    -50, -40, -30, -20, -20, -30, -40, -50,
+    -30, -20, -10, 0, 0, -10, -20, -30,
+    -30, -10, 20, 30, 30, 20, -10, -30,
+    -30, -10, 30, 40, 40, 30, -10, -30,
+    -30, -10, 30, 40, 40, 30, -10, -30,
+    -30, -10, 20, 30, 30, 20, -10, -30,
+    -30, -30, 0, 0, 0, 0, -30, -30,
+    -50, -30, -30, -30, -30, -30, -30, -50
+]
+
+PIECE_TABLES = {
+    chess.PAWN: PAWN_TABLE,
+    chess.KNIGHT: KNIGHT_TABLE,
+    chess.BISHOP: BISHOP_TABLE,
+    chess.ROOK: ROOK_TABLE,
+    chess.QUEEN: QUEEN_TABLE
+}
+
+# Non-pawn material (both sides) at or below which kings use the endgame table
+ENDGAME_MATERIAL = 2600
+BISHOP_PAIR_BONUS = 30
+
+
+def _square_tables(color):
+    """Combine piece values and piece-square tables into per-square scores for one color."""
+    # The tables list rank 8 first, so white squares are mirrored
+    flip = 56 if color == chess.WHITE else 0
+    tables = {piece_type: [PIECE_VALUES[piece_type] + table[square ^ flip] for square in chess.SQUARES]
+              for piece_type, table in PIECE_TABLES.items()}
+    tables["king_middlegame"] = [KING_MIDDLEGAME_TABLE[square ^ flip] for square in chess.SQUARES]
+    tables["king_endgame"] = [KING_ENDGAME_TABLE[square ^ flip] for square in chess.SQUARES]
+    return tables
+
+
+SQUARE_TABLES = {chess.WHITE: _square_tables(chess.WHITE), chess.BLACK: _square_tables(chess.BLACK)}
+
+
+def evaluate(board):
+    """Static evaluation (material, piece-square tables, bishop pair) for the side to move."""
+    non_pawn = board.knights | board.bishops | board.rooks | board.queens
+    non_pawn_material = (chess.popcount(board.knights) * PIECE_VALUES[chess.KNIGHT] +
+                         chess.popcount(board.bishops) * PIECE_VALUES[chess.BISHOP] +
+                         chess.popcount(board.rooks) * PIECE_VALUES[chess.ROOK] +
+                         chess.popcount(board.queens) * PIECE_VALUES[chess.QUEEN])
+    king_table = "king_endgame" if non_pawn_material <= ENDGAME_MATERIAL or not non_pawn else "king_middlegame"
+    
+    score = 0
+    for color, sign in ((chess.WHITE, 1), (chess.BLACK, -1)):
+        own = board.occupied_co[color]
+        tables = SQUARE_TABLES[color]
+        for piece_type, mask in ((chess.PAWN, board.pawns), (chess.KNIGHT, board.knights),
+                                 (chess.BISHOP, board.bishops), (chess.ROOK, board.rooks),
+                                 (chess.QUEEN, board.queens)):
+            table = tables[piece_type]
+            for square in chess.scan_forward(mask & own):
+                score += sign * table[square]
+        
+        score += sign * tables[king_table][chess.msb(board.kings & own)]
+        if chess.popcount(board.bishops & own) >= 2:
+            score += sign * BISHOP_PAIR_BONUS
+    
+    return score if board.turn == chess.WHITE else -score
+
+
+def _pov_score(score, turn):
+    """Convert an internal score into a chess.engine.PovScore."""
+    if score >= MATE_THRESHOLD:
+        return chess.engine.PovScore(chess.engine.Mate((MATE_SCORE - score + 1) // 2), turn)
+    if score <= -MATE_THRESHOLD:
+        return chess.engine.PovScore(chess.engine.Mate(-((MATE_SCORE + score) // 2)), turn)
+    return chess.engine.PovScore(chess.engine.Cp(score), turn)
+
+
+class SearchAborted(Exception):
+    """Raised inside the search when it runs out of time or nodes, or is stopped."""
+
+
+class PythonAnalysis:
+    """Streaming search handle, used like chess.engine.SimpleAnalysisResult.
+    
+    Iterating yields one info dict per line each time a depth completes.
+    stop() may be called from any thread.
+    """
+    
+    def __init__(self, engine, board, limit, multipv):
+        """Prepare the search; it runs while the handle is iterated."""
+        self._stop_event = threading.Event()
+        self._depths = engine._iterate(board, limit, multipv, self._stop_event)
+        self.multipv = []
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        self._depths.close()
+    
+    def __iter__(self):
+        for lines in self._depths:
+            self.multipv = lines
+            yield from lines
+    
+    def stop(self):
+        """Ask the search to return as soon as possible."""
+        self._stop_event.set()
+
+
+class PythonEngine:
+    """In-process alpha-beta engine offering the parts of SimpleEngine the game uses.
+    
+    The search runs on python-chess bitboards: negamax alpha-beta with
+    principal variation search, iterative deepening, a transposition table,
+    null-move pruning, check extensions and a capture-only quiescence search.
+    Moves are ordered by the transposition table move, MVV-LVA for captures,
+    then killer moves. It is far weaker and slower than Stockfish, but needs
+    no external process, which suits low difficulties and machines without
+    Stockfish.
+    """
+    
+    def __init__(self, hash_mb=PYTHON_ENGINE_HASH):
+        """Initialize an engine with an empty transposition table."""
+        self.id = {"name": "Python Chess Engine"}
+        self.skill_level = 20
+        self.tt = {}
+        self.tt_capacity = hash_mb * TT_ENTRIES_PER_MB
+        self.nodes = 0
+        self.killers = []
+        self._seen = set()
+        self._stop_event = threading.Event()
+        self._deadline = None
+        self._node_limit = None
+    
+    def configure(self, options):
+        """Apply UCI-style options; "Hash" and "Skill Level" are supported, others are ignored."""
+        if "Hash" in options:
+            self.tt_capacity = int(options["Hash"]) * TT_ENTRIES_PER_MB
+            self.tt.clear()
+        if "Skill Level" in options:
+            self.skill_level = int(options["Skill Level"])
+    
+    def play(self, board, limit, info=chess.engine.INFO_NONE, **kwargs):
+        """Search the position and return a chess.engine.PlayResult."""
+        multipv = SKILL_MULTIPV if self.skill_level < 20 else 1
+        lines = []
+        for lines in self._iterate(board, limit, multipv, threading.Event()):
+            pass
+        
+        if not lines:
+            # Out of time before depth 1 finished: fall back to move ordering
+            moves = self._ordered_moves(board.copy(), None, 0)
+            return chess.engine.PlayResult(moves[0] if moves else None, None, {})
+        
+        chosen = lines[0]
+        if self.skill_level < 20 and len(lines) > 1:
+            # Weaker levels play any line within a margin of the best one
+            margin = (20 - self.skill_level) * SKILL_MARGIN
+            best = lines[0]["score"].relative.score(mate_score=MATE_SCORE)
+            chosen = random.choice([line for line in lines
+                                    if best - line["score"].relative.score(mate_score=MATE_SCORE) <= margin])
+        
+        pv = chosen["pv"]
+        return chess.engine.PlayResult(pv[0], pv[1] if len(pv) > 1 else None, chosen if info else {})
+    
+    def analyse(self, board, limit, multipv=None, **kwargs):
+        """Search the position and return the info dict (a list of them if multipv is given)."""
+        lines = []
+        for lines in self._iterate(board, limit, multipv or 1, threading.Event()):
+            pass
+        if multipv is None:
+            return lines[0] if lines else {}
+        return lines
+    
+    def analysis(self, board, limit=None, multipv=None, **kwargs):
+        """Start a streaming search; iterate the returned handle for updates."""
+        return PythonAnalysis(self, board, limit, multipv or 1)
+    
+    def quit(self):
+        """Release the transposition table."""
+        self.tt.clear()
+    
+    def _iterate(self, board, limit, multipv, stop_event):
+        """Iterative deepening; yields the ranked info dicts after every completed depth."""
+        root = board.copy()
+        start = time.monotonic()
+        max_depth = limit.depth if limit and limit.depth else MAX_PLY
+        budget = self._time_budget(root, limit)
+        self._deadline = start + budget if budget else None
+        self._node_limit = limit.nodes if limit and limit.nodes else None
+        self._stop_event = stop_event
+        self.nodes = 0
+        self.killers = [[None, None] for _ in range(MAX_PLY + 2)]
+        
+        # Earlier positions of the game count as repetitions (draws) in the search
+        self._seen = set()
+        replay = root.copy()
+        while replay.move_stack:
+            replay.pop()
+            self._seen.add(replay._transposition_key())
+        
+        line_count = min(multipv, root.legal_moves.count())
+        if line_count == 0:
+            return
+        
+        root_scores = {}
+        for depth in range(1, max_depth + 1):
+            results = []
+            try:
+                for _ in range(line_count):
+                    excluded = [move for _, move in results]
+                    results.append(self._search_root(root, depth, excluded, root_scores))
+            except SearchAborted:
+                return
+            
+            for score, move in results:
+                root_scores[move] = score
+            
+            elapsed = time.monotonic() - start
+            lines = []
+            for rank, (score, move) in enumerate(results, 1):
+                lines.append({
+                    "depth": depth,
+                    "multipv": rank,
+                    "score": _pov_score(score, root.turn),
+                    "pv": self._principal_variation(root, move, depth),
+                    "nodes": self.nodes,
+                    "nps": int(self.nodes / elapsed) if elapsed > 0 else 0,
+                    "time": elapsed,
+                    "hashfull": min(1000, len(self.tt) * 1000 // max(1, self.tt_capacity))
+                })
+            yield lines
+            
+            # A forced mate will not get any better, and another depth will not finish in time
+            if abs(results[0][0]) >= MATE_THRESHOLD and MATE_SCORE - abs(results[0][0]) <= depth:
+                return
+            if budget and elapsed > budget * 0.5:
+                return
+    
+    @staticmethod
+    def _time_budget(board, limit):
+        """Get the seconds to spend on this search, or None for no time limit."""
+        if limit is None:
+            return None
+        
+        budgets = []
+        if limit.time:
+            budgets.append(limit.time)
+        
+        clock = limit.white_clock if board.turn == chess.WHITE else limit.black_clock
+        if clock is not None:
+            increment = (limit.white_inc if board.turn == chess.WHITE else limit.black_inc) or 0
+            budgets.append(max(0.01, min(clock / 2, clock / 30 + increment * 0.75)))
+        
+        return min(budgets) if budgets else None
+    
+    def _check_limits(self):
+        """Abort the search when it is stopped or out of time or nodes."""
+        if (self._stop_event.is_set() or
+                (self._deadline is not None and time.monotonic() >= self._deadline) or
+                (self._node_limit is not None and self.nodes >= self._node_limit)):
+            raise SearchAborted()
+    
+    def _search_root(self, board, depth, excluded, root_scores):
+        """Search every root move except the excluded ones; returns (score, best move)."""
+        alpha = -MATE_SCORE - 1
+        beta = MATE_SCORE + 1
+        best_move = None
+        
+        moves = [move for move in self._ordered_moves(board, None, 0) if move not in excluded]
+        # Search last iteration's best moves first
+        moves.sort(key=lambda move: root_scores.get(move, -MATE_SCORE - 1), reverse=True)
+        
+        self._seen.add(board._transposition_key())
+        for move in moves:
+            board.push(move)
+            if best_move is None:
+                score = -self._negamax(board, depth - 1, -beta, -alpha, 1)
+            else:
+                score = -self._negamax(board, depth - 1, -alpha - 1, -alpha, 1)
+                if alpha < score < beta:
+                    score = -self._negamax(board, depth - 1, -beta, -alpha, 1)
+            board.pop()
+            
+            if best_move is None or score > alpha:
+                alpha = score
+                best_move = move
+        self._seen.discard(board._transposition_key())
+        
+        return alpha, best_move
+    
+    def _negamax(self, board, depth, alpha, beta, ply):
+        """Alpha-beta search with a transposition table; returns the score for the side to move."""
+        self.nodes += 1
+        if not self.nodes & 255:
+            self._check_limits()
+        
+        key = board._transposition_key()
+        if key in self._seen or board.halfmove_clock >= 100:
+            return 0  # Repetition or fifty-move rule
+        if ply >= MAX_PLY:
+            return evaluate(board)
+        
+        in_check = board.is_check()
+        if in_check:
+            depth += 1
+        if depth <= 0:
+            return self._quiescence(board, alpha, beta, ply)
+        
+        # Transposition table cutoff
+        tt_move = None
+        entry = self.tt.get(key)
+        if entry is not None:
+            entry_depth, flag, entry_score, tt_move = entry
+            if entry_depth >= depth:
+                # Mate scores are stored relative to the node
+                if entry_score >= MATE_THRESHOLD:
+                    entry_score -= ply
+                elif entry_score <= -MATE_THRESHOLD:
+                    entry_score += ply
+                
+                if flag == TT_EXACT:
+                    return entry_score
+                if flag == TT_LOWER and entry_score >= beta:
+                    return entry_score
+                if flag == TT_UPPER and entry_score <= alpha:
+                    return entry_score
+        
+        # Null move pruning: if passing still fails high, the position is good enough
+        if (depth >= 3 and not in_check and beta < MATE_THRESHOLD and
+                board.occupied_co[board.turn] & ~(board.pawns | board.kings)):
+            board.push(chess.Move.null())
+            score = -self._negamax(board, depth - 3, -beta, -beta + 1, ply + 1)
+            board.pop()
+            if score >= beta:
+                return beta
+        
+        original_alpha = alpha
+        best_score = -MATE_SCORE - 1
+        best_move = None
+        
+        self._seen.add(key)
+        for move in self._ordered_moves(board, tt_move, ply):
+            board.push(move)
+            if best_move is None:
+                score = -self._negamax(board, depth - 1, -beta, -alpha, ply + 1)
+            else:
+                score = -self._negamax(board, depth - 1, -alpha - 1, -alpha, ply + 1)
+                if alpha < score < beta:
+                    score = -self._negamax(board, depth - 1, -beta, -alpha, ply + 1)
+            board.pop()
+            
+            if score > best_score:
+                best_score = score
+                best_move = move
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                # Remember quiet moves that refute the opponent's move
+                if not board.is_capture(move):
+                    killers = self.killers[ply]
+                    if killers[0] != move:
+                        killers[1] = killers[0]
+                        killers[0] = move
+                break
+        self._seen.discard(key)
+        
+        if best_move is None:
+            return -MATE_SCORE + ply if in_check else 0  # Checkmate or stalemate
+        
+        if best_score <= original_alpha:
+            flag = TT_UPPER
+        elif best_score >= beta:
+            flag = TT_LOWER
+        else:
+            flag = TT_EXACT
+        
+        stored_score = best_score
+        if stored_score >= MATE_THRESHOLD:
+            stored_score += ply
+        elif stored_score <= -MATE_THRESHOLD:
+            stored_score -= ply
+        
+        if len(self.tt) >= self.tt_capacity:
+            self.tt.clear()
+        self.tt[key] = (depth, flag, stored_score, best_move)
+        return best_score
+    
+    def _quiescence(self, board, alpha, beta, ply):
+        """Search captures only, so the static evaluation is not taken mid-exchange."""
+        self.nodes += 1
+        if not self.nodes & 255:
+            self._check_limits()
+        
+        stand_pat = evaluate(board)
+        if stand_pat >= beta or ply >= MAX_PLY:
+            return stand_pat
+        if stand_pat > alpha:
+            alpha = stand_pat
+        
+        for move in self._ordered_captures(board):
+            board.push(move)
+            score = -self._quiescence(board, -beta, -alpha, ply + 1)
+            board.pop()
+            
+            if score >= beta:
+                return score
+            if score > alpha:
+                alpha = score
+        return alpha
+    
+    def _ordered_moves(self, board, tt_move, ply):
+        """Order legal moves: TT move, captures by MVV-LVA, promotions, killers, then the rest."""
+        killers = self.killers[ply] if ply < len(self.killers) else [None, None]
+        
+        def priority(move):
+            if move == tt_move:
+                return 1 << 20
+            if board.is_capture(move):
+                victim = board.piece_type_at(move.to_square) or chess.PAWN  # En passant
+                return (1 << 16) + ORDER_VALUES[victim] * 16 - ORDER_VALUES[board.piece_type_at(move.from_square)]
+            if move.promotion:
+                return (1 << 15) + ORDER_VALUES[move.promotion]
+            if move == killers[0] or move == killers[1]:
+                return 1 << 14
+            return 0
+        
+        return sorted(board.legal_moves, key=priority, reverse=True)
+    
+    @staticmethod
+    def _ordered_captures(board):
+        """Order legal captures by MVV-LVA."""
+        def priority(move):
+            victim = board.piece_type_at(move.to_square) or chess.PAWN
+            return ORDER_VALUES[victim] * 16 - ORDER_VALUES[board.piece_type_at(move.from_square)]
+        
+        return sorted(board.generate_legal_captures(), key=priority, reverse=True)
+    
+    def _principal_variation(self, board, first_move, depth):
+        """Follow transposition table moves from the root to build the principal variation."""
+        pv = [first_move]
+        board.push(first_move)
+        seen = {board._transposition_key()}
+        while len(pv) < depth:
+            entry = self.tt.get(board._transposition_key())
+            if entry is None or entry[3] is None or not board.is_legal(entry[3]):
+                break
+            board.push(entry[3])
+            pv.append(entry[3])
+            key = board._transposition_key()
+            if key in seen:
+                break
+            seen.add(key)
+        
+        for _ in pv:
+            board.pop()
+        return pv
+
+
+# Positions searched by bench(): opening, middlegame, tactical and endgame
+BENCH_FENS = [
+    chess.STARTING_FEN,
+    "r1bqkb1r/pppp1ppp/2n2n2/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4",
+    "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+    "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+    "6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1"
+]
+
+
+def bench(depth=PYTHON_ENGINE_BENCH_DEPTH):
+    """Search the bench positions to a fixed depth; returns (nodes, seconds, nodes per second)."""
+    engine = PythonEngine()
+    nodes = 0
+    start = time.monotonic()
+    for fen in BENCH_FENS:
+        engine.tt.clear()
+        info = engine.analyse(chess.Board(fen), chess.engine.Limit(depth=depth))
+        nodes += info.get("nodes", 0)
+    elapsed = time.monotonic() - start
+    return nodes, elapsed, int(nodes / elapsed) if elapsed > 0 else 0
+
+
+if __name__ == "__main__":
+    nodes, elapsed, nps = bench()
+    print(f"Nodes searched  : {nodes}")
+    print(f"Total time (ms) : {int(elapsed * 1000)}")
+    print(f"Nodes/second    : {nps}")
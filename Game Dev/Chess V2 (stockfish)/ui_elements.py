@@ -1,6 +1,7 @@
 import pygame
 import chess
-from config import BOARD_SIZE, SCREEN_WIDTH, SCREEN_HEIGHT, WHITE, BLACK, GREY
+from config import (BOARD_SIZE, SCREEN_WIDTH, SCREEN_HEIGHT, WHITE, BLACK, GREY, HIGHLIGHT, BEST_MOVE_COLOR,
+                    CANDIDATE_MOVE_COLORS, EXPLORER_MOVES_SHOWN)
 
 class Button:
     """A simple button class for UI interaction."""
@@ -43,8 +44,41 @@ class UIManager:
         self.font = pygame.font.Font(None, 24)
         self.title_font = pygame.font.Font(None, 36)
         self.large_font = pygame.font.Font(None, 48)
+        self.mono_font = pygame.font.SysFont("monospace", 16)
         self.buttons = {}
         self.create_buttons()
+        
+        # Pre-rendered "thinking" frames, so the indicator costs a blit per frame
+        self.thinking_surfaces = [
+            self.font.render("Stockfish is thinking" + "." * dots, True, BLACK)
+            for dots in range(4)
+        ]
+        
+        # Rendered candidate list, reused until the engine publishes new lines
+        self._candidate_lines = None
+        self._candidate_surfaces = []
+        
+        # Rendered clock texts per color, re-rendered only when the shown time changes
+        self._clock_surfaces = {}
+        
+        # Rendered stats panel, refreshed at most twice a second
+        self._stats_version = None
+        self._stats_rendered_at = 0
+        self._stats_surfaces = []
+        self._stats_overlay = None  # Background, rebuilt only when the number of rows changes
+        
+        # Rendered explorer panel, redrawn only when the explorer results change
+        self._explorer_moves = None
+        self._explorer_surface = None
+        
+        # Rendered network status lines, re-rendered only when their text changes
+        self._network_lines = None
+        self._network_surfaces = []
+        
+        # Rendered evaluation graph, redrawn only when its data or the cursor changes
+        self._graph_evaluations = None
+        self._graph_index = None
+        self._graph_surface = None
     
     def create_buttons(self):
         """Create all the buttons needed for the game."""
@@ -68,6 +102,16 @@ class UIManager:
         # Place "Best Move" button at the bottom
         self.buttons["best move"].rect = pygame.Rect(BOARD_SIZE + 20, SCREEN_HEIGHT - 150, button_width, button_height)
         
+        # "Stats" takes the slot left free by "Best Move"
+        self.buttons["stats"] = Button(
+            pygame.Rect(start_x, start_y + 3 * (button_height + button_margin), button_width, button_height),
+            "Stats",
+            self.font
+        )
+        
+        # "Variation" shares the slot of "Decline Draw", which analysis has no use for
+        self.buttons["variation"] = Button(self.buttons["decline draw"].rect.copy(), "Variation", self.font)
+        
         # Menu buttons
         menu_buttons = ["Single Player", "Two Player", "Quit"]
         for i, text in enumerate(menu_buttons):
@@ -77,6 +121,13 @@ class UIManager:
                 self.title_font
             )
         
+        # Time control selector (cycles through TIME_CONTROLS)
+        self.buttons["time control"] = Button(
+            pygame.Rect(SCREEN_WIDTH // 2 - 100, 150 + 3 * 60, 200, 50),
+            "Time: No clock",
+            self.title_font
+        )
+        
         # Color selection buttons
         color_buttons = ["Play as White", "Play as Black", "Back to Menu"]
         for i, text in enumerate(color_buttons):
@@ -111,7 +162,7 @@ class UIManager:
             self.font
         )
     
-    def draw_menu(self):
+    def draw_menu(self, time_control_text="No clock"):
         """Draw the main menu screen."""
         self.screen.fill(WHITE)
         
@@ -120,7 +171,8 @@ class UIManager:
         self.screen.blit(title, (SCREEN_WIDTH // 2 - title.get_width() // 2, 50))
         
         # Draw menu buttons
-        for button_name in ["single player", "two player", "quit"]:
+        self.buttons["time control"].text = f"Time: {time_control_text}"
+        for button_name in ["single player", "two player", "quit", "time control"]:
             self.buttons[button_name].draw(self.screen)
     
     def draw_color_menu(self):
@@ -174,15 +226,24 @@ class UIManager:
         draw_requested = game_state and hasattr(game_state, 'draw_requested') and game_state.draw_requested
         is_multiplayer = game_state and game_state.difficulty is None
         
-        self.buttons["decline draw"].active = draw_requested and is_multiplayer
+        # In analysis the "Decline Draw" slot switches between the variations played at the cursor
+        in_analysis = game_state and game_state.game_state == "analysis"
+        self.buttons["decline draw"].active = draw_requested and is_multiplayer and not in_analysis
+        variation, variation_count = game_state.tree.variation_number() if in_analysis else (1, 1)
+        self.buttons["variation"].active = variation_count > 1
+        self.buttons["variation"].text = f"Line {variation}/{variation_count}"
         
         # Draw buttons with appropriate highlighting
         for name, button in self.buttons.items():
-            if name in ["resign", "draw", "menu", "back", "forward", "evaluate", "best move", "decline draw"]:
+            if name in ["resign", "draw", "menu", "back", "forward", "evaluate", "best move", "decline draw", "stats",
+                        "variation"]:
                 color = GREY
                 # Highlight active evaluation button
                 if name == "evaluate" and evaluation_mode:
                     color = (0, 255, 0)
+                # Highlight active stats button
+                elif name == "stats" and game_state and game_state.show_stats:
+                    color = (0, 255, 0)
                 # Highlight active best move button
                 elif name == "best move" and show_best_move:
                     color = (0, 255, 0)
@@ -253,7 +314,7 @@ class UIManager:
         text_surf = self.font.render(eval_text, True, BLACK)
         self.screen.blit(text_surf, (bar_x - 60, bar_y + bar_height // 2))
     
-    def draw_evaluation_info(self, best_move, board, pv_line):
+    def draw_evaluation_info(self, best_move, board, pv_line, depth=None):
         """Draw information about the best move and PV line."""
         if best_move:
             try:
@@ -263,10 +324,14 @@ class UIManager:
                 else:
                     best_move_text = f"Best: {best_move.uci()} (not applicable)"
                 
+                # Show how deep the streaming analysis has searched
+                if depth:
+                    best_move_text += f"  (depth {depth})"
+                
                 # Draw best move text
                 text_surf = self.font.render(best_move_text, True, BLACK)
                 self.screen.blit(text_surf, (BOARD_SIZE + 20, SCREEN_HEIGHT - 90))
-                
+            
             except Exception as e:
                 # Handle any errors
                 error_text = f"Best move error: {str(e)}"
@@ -282,6 +347,61 @@ class UIManager:
             text_surf = self.font.render("No valid line available", True, BLACK)
             self.screen.blit(text_surf, (BOARD_SIZE + 20, SCREEN_HEIGHT - 60))
     
+    def draw_candidate_lines(self, lines):
+        """Draw the ranked list of candidate lines with their scores."""
+        if len(lines) < 2:
+            return
+        
+        # Text is only re-rendered when the engine publishes a new batch
+        if lines is not self._candidate_lines:
+            self._candidate_lines = lines
+            self._candidate_surfaces = []
+            for rank, line in enumerate(lines):
+                if line.mate_in is not None and abs(line.evaluation) > 10000:
+                    score_text = f"#{line.mate_in}" if line.evaluation > 0 else f"#-{line.mate_in}"
+                else:
+                    score_text = f"{line.evaluation / 100:+.2f}"
+                text = f"{rank + 1}. {score_text}  {' '.join(line.san_line)}"
+                self._candidate_surfaces.append(self.font.render(text, True, BLACK))
+        
+        x = BOARD_SIZE + 20
+        y = 270
+        for rank, surface in enumerate(self._candidate_surfaces):
+            color = CANDIDATE_MOVE_COLORS[min(rank, len(CANDIDATE_MOVE_COLORS) - 1)]
+            pygame.draw.rect(self.screen, color, (x, y + rank * 25 + 4, 8, 8))
+            
+            # Clip long lines so they don't run into the evaluation bar
+            width = min(surface.get_width(), SCREEN_WIDTH - 80 - (x + 14))
+            self.screen.blit(surface, (x + 14, y + rank * 25), (0, 0, width, surface.get_height()))
+    
+    def draw_stats_panel(self, telemetry):
+        """Draw engine telemetry (latency, depth, NPS, hash usage, errors) over the board."""
+        now = pygame.time.get_ticks()
+        if telemetry.version != self._stats_version and now - self._stats_rendered_at >= 500:
+            self._stats_version = telemetry.version
+            self._stats_rendered_at = now
+            
+            rows = ["op         calls  p50 ms  p95 ms  depth   kNPS  hash  err"]
+            for name, stats in sorted(telemetry.snapshot()["operations"].items()):
+                rows.append(
+                    f"{name:<10} {stats['count']:>5}  {stats['latency_p50'] * 1000:>6.0f}  "
+                    f"{stats['latency_p95'] * 1000:>6.0f}  {stats['depth_avg']:>5.1f}  "
+                    f"{stats['nps'] / 1000:>5.0f}  {stats['hashfull'] / 10:>3.0f}%  {stats['errors']:>3}"
+                )
+            self._stats_surfaces = [self.mono_font.render(row, True, BLACK) for row in rows]
+        
+        # Semi-transparent background over the board
+        height = 20 + 20 * len(self._stats_surfaces)
+        if self._stats_overlay is None or self._stats_overlay.get_height() != height:
+            self._stats_overlay = pygame.Surface((BOARD_SIZE - 20, height))
+            self._stats_overlay.set_alpha(220)
+            self._stats_overlay.fill(WHITE)
+        self.screen.blit(self._stats_overlay, (10, 10))
+        pygame.draw.rect(self.screen, BLACK, (10, 10, BOARD_SIZE - 20, height), 2)
+        
+        for i, surface in enumerate(self._stats_surfaces):
+            self.screen.blit(surface, (20, 20 + i * 20))
+    
     def draw_game_stats(self, game_count, difficulty):
         """Draw game statistics (wins/losses/draws)."""
         opponent = 'Player 2' if difficulty is None else 'Stockfish'
@@ -289,6 +409,132 @@ class UIManager:
         count_surf = self.font.render(count_text, True, BLACK)
         self.screen.blit(count_surf, (BOARD_SIZE + 20, SCREEN_HEIGHT - 30))
     
+    @staticmethod
+    def format_clock(seconds):
+        """Format a clock as m:ss, with tenths of a second under ten seconds."""
+        if seconds < 10:
+            return f"{int(seconds * 10) / 10:.1f}"
+        seconds = int(seconds)
+        return f"{seconds // 60}:{seconds % 60:02d}"
+    
+    def draw_clocks(self, game_state):
+        """Draw both clocks below the board, highlighting the one that is running."""
+        if not game_state.time_control:
+            return
+        
+        width = BOARD_SIZE // 2 - 40
+        for i, color in enumerate([chess.WHITE, chess.BLACK]):
+            text = f"{'White' if color == chess.WHITE else 'Black'}  {self.format_clock(game_state.get_clock(color))}"
+            
+            # The text only changes once a second (ten times a second when low)
+            cached = self._clock_surfaces.get(color)
+            if cached is None or cached[0] != text:
+                cached = (text, self.title_font.render(text, True, BLACK))
+                self._clock_surfaces[color] = cached
+            
+            rect = pygame.Rect(20 + i * (BOARD_SIZE // 2), BOARD_SIZE + 40, width, 50)
+            running = game_state.clock_started is not None and game_state.clock_turn == color
+            pygame.draw.rect(self.screen, HIGHLIGHT if running else GREY, rect)
+            pygame.draw.rect(self.screen, BLACK, rect, 2)
+            self.screen.blit(cached[1], cached[1].get_rect(center=rect.center))
+    
+    def draw_evaluation_graph(self, evaluations, engine_known, current_index):
+        """Draw the evaluation of every position in the game below the board.
+        
+        evaluations are centipawns from white's point of view; positions the
+        engine has searched (engine_known) are marked with a dot, the others
+        come from the static batch evaluator. The current position is marked
+        with a vertical line.
+        """
+        rect = pygame.Rect(20, BOARD_SIZE + 30, BOARD_SIZE - 40, SCREEN_HEIGHT - BOARD_SIZE - 40)
+        
+        if evaluations is not self._graph_evaluations or current_index != self._graph_index:
+            self._graph_evaluations = evaluations
+            self._graph_index = current_index
+            
+            surface = pygame.Surface(rect.size)
+            surface.fill(GREY)
+            middle = rect.height // 2
+            pygame.draw.line(surface, WHITE, (0, middle), (rect.width, middle))
+            
+            # Same scale as the evaluation bar: +/-10 pawns, mates at the edges
+            step = rect.width / max(1, len(evaluations) - 1)
+            points = []
+            for i, evaluation in enumerate(evaluations):
+                clamped = max(-1000, min(1000, evaluation))
+                points.append((round(i * step), round(middle - clamped / 1000 * (middle - 4))))
+            
+            if len(points) > 1:
+                pygame.draw.lines(surface, BLACK, False, points, 2)
+            for point, known in zip(points, engine_known):
+                if known:
+                    pygame.draw.circle(surface, BEST_MOVE_COLOR, point, 3)
+            
+            if evaluations:
+                x = round(current_index * step)
+                pygame.draw.line(surface, HIGHLIGHT, (x, 0), (x, rect.height), 2)
+            self._graph_surface = surface
+        
+        self.screen.blit(self._graph_surface, rect)
+        pygame.draw.rect(self.screen, BLACK, rect, 2)
+    
+    def draw_explorer(self, moves, board):
+        """Draw how often the position occurred in the game collection and how those games went.
+        
+        Each row shows a continuation, the number of games and a bar of
+        white wins, draws and black wins.
+        """
+        if moves is not self._explorer_moves:
+            self._explorer_moves = moves
+            shown = moves[:EXPLORER_MOVES_SHOWN]
+            surface = pygame.Surface((230, 25 * (len(shown) + 1)), pygame.SRCALPHA)
+            
+            total = sum(entry.games for entry in moves)
+            header = f"Database: {total} game{'s' if total != 1 else ''}" if total else "Database: no games"
+            surface.blit(self.font.render(header, True, BLACK), (0, 0))
+            
+            for row, entry in enumerate(shown, 1):
+                y = row * 25
+                if entry.move is None:
+                    label = "(end)"
+                elif board.is_legal(entry.move):
+                    label = board.san(entry.move)
+                else:
+                    label = entry.move.uci()  # Hash collision with another position
+                surface.blit(self.font.render(label, True, BLACK), (0, y))
+                surface.blit(self.font.render(str(entry.games), True, BLACK), (60, y))
+                
+                # Score bar; games without a result are left out
+                decided = entry.white + entry.draws + entry.black
+                bar = pygame.Rect(120, y + 2, 100, 14)
+                pygame.draw.rect(surface, GREY, bar)
+                if decided:
+                    white_width = round(bar.width * entry.white / decided)
+                    draw_width = round(bar.width * entry.draws / decided)
+                    pygame.draw.rect(surface, WHITE, (bar.x, bar.y, white_width, bar.height))
+                    pygame.draw.rect(surface, BLACK, (bar.x + white_width + draw_width, bar.y,
+                                                      bar.width - white_width - draw_width, bar.height))
+                pygame.draw.rect(surface, BLACK, bar, 1)
+            self._explorer_surface = surface
+        
+        self.screen.blit(self._explorer_surface, (BOARD_SIZE + 20, 370))
+    
+    def draw_thinking_indicator(self):
+        """Draw an animated indicator while the AI computes its move."""
+        frame = (pygame.time.get_ticks() // 300) % len(self.thinking_surfaces)
+        self.screen.blit(self.thinking_surfaces[frame], (BOARD_SIZE + 20, 230))
+    
+    def draw_network_status(self, lines):
+        """Draw the state of the network connection and its round-trip time."""
+        if lines != self._network_lines:
+            self._network_lines = lines
+            self._network_surfaces = [self.font.render(line, True, BLACK) for line in lines]
+        
+        # Below the candidate lines and the explorer's largest table, above the draw request text
+        y = 370 + 25 * (EXPLORER_MOVES_SHOWN + 1) + 5
+        for i, surface in enumerate(self._network_surfaces):
+            self.screen.blit(surface, (BOARD_SIZE + 20, y + i * 25))
+    
     def draw_move_counter(self, current_index, total_moves):
         """Draw the move counter for analysis mode."""
         move_text = f"Move: {current_index + 1}/{total_moves}"
@@ -0,0 +1,205 @@
+from collections import OrderedDict
+import chess
+from config import CHECKPOINT_CACHE_SIZE
+from game_end_tracker import GameEndTracker
+
+
+class VariationNode:
+    """A position in the game tree, stored only as the move that leads to it."""
+    
+    __slots__ = ("parent", "move", "children", "selected", "ply")
+    
+    def __init__(self, parent=None, move=None):
+        """Create a node below parent (None for the starting position)."""
+        self.parent = parent
+        self.move = move
+        self.children = []  # The first child is the main continuation
+        self.selected = None  # The child "forward" goes to (the one visited last)
+        self.ply = parent.ply + 1 if parent else 0
+    
+    def child(self, move):
+        """Get the continuation with this move, or None."""
+        for child in self.children:
+            if child.move == move:
+                return child
+        return None
+    
+    def next(self):
+        """Get the continuation followed when going forward."""
+        if self.selected is not None:
+            return self.selected
+        return self.children[0] if self.children else None
+
+
+class VariationTree:
+    """The moves of a game and its side variations, with boards built on demand.
+    
+    Only the cursor position is kept as a live board; moving forward and
+    back pushes and pops a single move. Boards for other nodes are rebuilt
+    from the nearest cached checkpoint (or the cursor, or the start) and
+    kept in a small LRU of checkpoints. Playing a move from an earlier
+    position adds a variation instead of discarding the old line, and
+    switch_variation() brings the cursor back onto the other lines.
+    """
+    
+    def __init__(self, board=None):
+        """Start a tree at the given position (the standard starting position by default)."""
+        self.reset(board)
+    
+    def reset(self, board=None):
+        """Discard every move and start again from a position."""
+        self.start = board.copy() if board is not None else chess.Board()
+        self.root = VariationNode()
+        self.current = self.root
+        self.board = self.start.copy()
+        self.tracker = GameEndTracker(self.board)  # Repetitions and Zobrist key along the cursor's line
+        self._checkpoints = OrderedDict()
+        self._line = None  # The selected line, until a node is added or another line is selected
+    
+    def push(self, move):
+        """Play a move at the cursor, following an existing variation if there is one."""
+        child = self.add_variation(self.current, move)
+        if self.current.selected is not child:
+            self.current.selected = child
+            self._line = None
+        self.tracker.push(self.board, move)
+        self.current = child
+        return child
+    
+    def add_variation(self, node, move):
+        """Add a continuation below any node without moving the cursor (no board is built)."""
+        child = node.child(move)
+        if child is None:
+            child = VariationNode(node, move)
+            node.children.append(child)
+            self._line = None
+        return child
+    
+    def select_main_line(self):
+        """Make forward follow the first continuation of every node from the start."""
+        node = self.root
+        while node.children:
+            node.selected = node.children[0]
+            node = node.children[0]
+        self._line = None
+    
+    def can_go_forward(self):
+        """Check if the cursor has a continuation."""
+        return bool(self.current.children)
+    
+    def go_back(self):
+        """Move the cursor one ply back. Returns False at the start."""
+        if self.current.parent is None:
+            return False
+        self.tracker.pop(self.board)
+        self.current = self.current.parent
+        return True
+    
+    def go_forward(self):
+        """Move the cursor one ply forward along the selected continuation. Returns False at the end."""
+        child = self.current.next()
+        if child is None:
+            return False
+        self.tracker.push(self.board, child.move)
+        self.current = child
+        return True
+    
+    def variation_number(self):
+        """Get which of the alternatives to the cursor's move it is, as (number, count) from 1."""
+        parent = self.current.parent
+        if parent is None:
+            return 1, 1
+        return parent.children.index(self.current) + 1, len(parent.children)
+    
+    def switch_variation(self, step=1):
+        """Replace the cursor's move with the next (or previous) alternative. Returns False without one.
+        
+        The cursor stays at the same ply, and forward then follows the
+        line that was last visited in that variation.
+        """
+        parent = self.current.parent
+        if parent is None or len(parent.children) < 2:
+            return False
+        siblings = parent.children
+        sibling = siblings[(siblings.index(self.current) + step) % len(siblings)]
+        self.tracker.pop(self.board)
+        self.tracker.push(self.board, sibling.move)
+        parent.selected = sibling
+        self.current = sibling
+        self._line = None
+        return True
+    
+    def go_to(self, node):
+        """Move the cursor to any node and make its line the selected one."""
+        if node is self.current:
+            return
+        self.board = self.board_at(node)
+        self.tracker.reset(self.board)
+        self.current = node
+        while node.parent is not None:
+            node.parent.selected = node
+            node = node.parent
+        self._line = None
+    
+    def line(self):
+        """Get the nodes of the selected line: from the start through the cursor to the end.
+        
+        The list is shared between calls (do not modify it); going back and
+        forward stays on the same line, so it is only rebuilt when a node is
+        added or another line is selected.
+        """
+        line = self._line
+        if line is not None and self.current.ply < len(line) and line[self.current.ply] is self.current:
+            return line
+        
+        nodes = []
+        node = self.current
+        while node is not None:
+            nodes.append(node)
+            node = node.parent
+        nodes.reverse()
+        
+        node = self.current.next()
+        while node is not None:
+            nodes.append(node)
+            node = node.next()
+        self._line = nodes
+        return nodes
+    
+    def line_boards(self, stack=False):
+        """Get a board for every node of the selected line (without move stacks by default)."""
+        board = self.start.copy()
+        boards = [board.copy(stack=stack)]
+        for node in self.line()[1:]:
+            board.push(node.move)
+            boards.append(board.copy(stack=stack))
+        return boards
+    
+    def board_at(self, node):
+        """Build the board for any node, starting from the nearest known position."""
+        moves = []
+        walker = node
+        while True:
+            if walker is self.current:
+                base = self.board
+                break
+            if walker in self._checkpoints:
+                self._checkpoints.move_to_end(walker)
+                base = self._checkpoints[walker]
+                break
+            if walker.parent is None:
+                base = self.start
+                break
+            moves.append(walker.move)
+            walker = walker.parent
+        
+        board = base.copy()
+        for move in reversed(moves):
+            board.push(move)
+        
+        # Remember the result so nearby positions are cheap to build next time
+        if moves:
+            self._checkpoints[node] = board.copy()
+            while len(self._checkpoints) > CHECKPOINT_CACHE_SIZE:
+                self._checkpoints.popitem(last=False)
+        return board